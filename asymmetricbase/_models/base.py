@@ -17,7 +17,12 @@
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+from itertools import islice
+from numbers import Integral
+
+from django.conf import settings
 from django.db import models
+from django.db.models.query import QuerySet
 from django.utils import timezone
 from django.dispatch.dispatcher import receiver
 from django.db.models import signals
@@ -28,6 +33,69 @@ from asymmetricbase.logging import audit_logger
 from asymmetricbase._models.logger_models import LogEntryType, AccessType
 from asymmetricbase.fields import UUIDField
 
+def read_audit_mode():
+	"""
+	How reads of AsymBaseModels are audited when LOG_MODEL_ACCESS_READ is on:
+	'instance' logs every instance as it is loaded, 'queryset' logs one entry
+	per evaluated queryset (see AuditedQuerySet).
+	"""
+	if not getattr(settings, 'LOG_MODEL_ACCESS_READ', False):
+		return None
+	return getattr(settings, 'ASYM_AUDIT_READ_MODE', 'instance')
+
+def _format_id_ranges(ids):
+	"""
+	Formats a list of ids as ranges, eg [1, 2, 3, 5, 7, 8] as '1-3, 5, 7-8'.
+	Ids that aren't integers are listed as they are.
+	"""
+	if not all(isinstance(object_id, Integral) and not isinstance(object_id, bool) for object_id in ids):
+		return ', '.join(sorted('{}'.format(object_id) for object_id in ids))
+	
+	ranges = []
+	for object_id in sorted(ids):
+		if ranges and ranges[-1][1] + 1 == object_id:
+			ranges[-1][1] = object_id
+		else:
+			ranges.append([object_id, object_id])
+	
+	return ', '.join('{}'.format(start) if start == end else '{}-{}'.format(start, end) for start, end in ranges)
+
+class AuditedQuerySet(QuerySet):
+	"""
+	When ASYM_AUDIT_READ_MODE is 'queryset', writes a single read audit entry
+	for all the objects a queryset loaded, instead of one per object.
+	
+	The objects are read ASYM_AUDIT_READ_CHUNK_SIZE (default 1000) at a time,
+	and each chunk is logged before its objects are handed out. So querysets
+	up to that size get a single entry, and a queryset that is only partly
+	iterated has logged what it loaded straight away, rather than whenever
+	it is garbage collected.
+	"""
+	def iterator(self):
+		if read_audit_mode() != 'queryset' or not issubclass(self.model, AsymBaseModel):
+			return super(AuditedQuerySet, self).iterator()
+		
+		return self._audited_iterator()
+	
+	def _audited_iterator(self):
+		objects = super(AuditedQuerySet, self).iterator()
+		chunk_size = getattr(settings, 'ASYM_AUDIT_READ_CHUNK_SIZE', 1000)
+		
+		while True:
+			chunk = list(islice(objects, chunk_size))
+			if not chunk:
+				return
+			
+			self.model._audit_log_many([obj.pk for obj in chunk], access_type = AccessType.READ, success = True)
+			for obj in chunk:
+				yield obj
+
+class AsymBaseManager(models.Manager):
+	use_for_related_fields = True
+	
+	def get_query_set(self):
+		return AuditedQuerySet(self.model, using = self._db)
+
 class AsymBaseModel(models.Model):
 	# The next two lines for for eclipse so that it stops reporting _meta as unknown
 	_meta = models.options.Options
@@ -38,6 +106,8 @@ class AsymBaseModel(models.Model):
 	date_created = models.DateTimeField(auto_now_add = True, default = timezone.now)
 	date_updated = models.DateTimeField(auto_now = True, default = timezone.now)
 	
+	objects = AsymBaseManager()
+	
 	class Meta(object):
 		abstract = True
 		app_label = 'shared'
@@ -51,6 +121,16 @@ class AsymBaseModel(models.Model):
 			'success' : success
 		})
 	
+	@classmethod
+	def _audit_log_many(cls, object_ids, access_type, success):
+		msg = 'Model Access: {} {} objects ({})'.format(len(object_ids), cls.__name__, _format_id_ranges(object_ids))
+		audit_logger.info(msg, extra = {
+			'log_type' : LogEntryType.MODEL,
+			'model_name' : cls.__name__,
+			'access_type' : access_type,
+			'success' : success
+		})
+	
 	def _object_saved_before(self):
 		''' Returns True if this object has been saved before '''
 		return hasattr(self, 'id') and self.id is not None
@@ -77,6 +157,9 @@ def asym_model_base_postinit(sender, instance, **kwargs):
 	if not isinstance(instance, AsymBaseModel):
 		return
 	
+	if read_audit_mode() != 'instance':
+		return  # reads are either not logged, or logged by AuditedQuerySet
+	
 	if not instance._object_saved_before():
 		return  # this is a constructor call. CanAdd will be checked it in pre_save
 	
@@ -16,6 +16,11 @@
 #    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 
 from __future__ import absolute_import, division, print_function, unicode_literals
+
+from collections import OrderedDict
+import time
+import uuid
+
 from asymmetricbase.utils.cached_function import cached_function
 
 __all__ = ('Role', 'AssignedRole', 'RoleTransfer', 'TypeAwareRoleManager', 'DefaultRole', 'OnlyRoleGroupProxy', 'HasTypeAwareRoleManager')
@@ -25,10 +30,14 @@ from django.contrib.contenttypes import generic
 from django.contrib.auth.models import Group, GroupManager
 from django.core.exceptions import ValidationError, ImproperlyConfigured
 from django.conf import settings
+from django.core.cache import cache
 from django.db import models
+from django.db.models.signals import post_save, post_delete
 
 from asymmetricbase.logging import logger
-from .base import AsymBaseModel
+from asymmetricbase.utils.permission_cache import invalidate_permission_cache
+from .base import AsymBaseModel, AsymBaseManager
+from .logger_models import AccessType
 from asymmetricbase.fields import LongNameField
 
 # UserModel implement get_groups_query_string()
@@ -52,14 +61,128 @@ def get_user_role_model():
 		raise ImproperlyConfigured("ASYM_ROLE_USER_MODEL refers to model '{}' that has not been installed".format(settings.ASYM_ROLE_USER_MODEL))
 	return user_model
 
+class RoleRegistry(object):
+	"""
+	Process wide cache of the ContentType ids for a model name and of the Roles
+	defined for each ContentType, so that role lookups in templates and loops
+	don't have to query.
+	
+	Role and ContentType changes clear it through signals. The other processes
+	notice through a version stamp in the django cache, which is checked at most
+	once every ASYM_ROLE_REGISTRY_CHECK_INTERVAL seconds.
+	
+	The cached Roles are shared, so they shouldn't be modified.
+	"""
+	VERSION_KEY = 'asym-role-registry-version'
+	VERSION_TIMEOUT = 60 * 60 * 24
+	CHECK_INTERVAL = getattr(settings, 'ASYM_ROLE_REGISTRY_CHECK_INTERVAL', 30)
+	
+	def __init__(self):
+		self.version = None
+		self.clear()
+	
+	def clear(self):
+		"""
+		Clears this process's registry. The dicts are replaced rather than
+		emptied, so lookups that are part way through keep a consistent view.
+		"""
+		self.content_type_ids = {}
+		self.roles = {}
+		self.checked_at = time.time()
+	
+	def invalidate(self, *args, **kwargs):
+		""" Clears the registry in every process. Can be connected to model signals. """
+		self.version = uuid.uuid4().hex
+		cache.set(self.VERSION_KEY, self.version, self.VERSION_TIMEOUT)
+		self.clear()
+	
+	def _check_version(self):
+		if time.time() - self.checked_at < self.CHECK_INTERVAL:
+			return
+		
+		version = cache.get(self.VERSION_KEY)
+		if version != self.version:
+			self.version = version
+			self.clear()
+		else:
+			self.checked_at = time.time()
+	
+	def get_content_type_ids(self, model_name):
+		""" Returns a tuple of the ids of the ContentTypes for models called model_name """
+		self._check_version()
+		cached = self.content_type_ids
+		
+		content_type_ids = cached.get(model_name, None)
+		if content_type_ids is None:
+			content_type_ids = tuple(ContentType.objects.filter(model = model_name).values_list('id', flat = True))
+			# don't remember models whose ContentType hasn't been created yet
+			if content_type_ids:
+				cached[model_name] = content_type_ids
+		
+		return content_type_ids
+	
+	def get_roles(self, content_type_ids):
+		"""
+		Returns an OrderedDict of name to Role of the Roles defined for the given
+		ContentTypes, loading the ones that aren't cached yet with one query.
+		"""
+		self._check_version()
+		# Another thread may clear() the registry while this runs, so work on
+		# the dict as it is now
+		cached = self.roles
+		
+		missing = [content_type_id for content_type_id in content_type_ids if content_type_id not in cached]
+		if missing:
+			loaded = dict((content_type_id, OrderedDict()) for content_type_id in missing)
+			for role in Role.objects.filter(defined_for__in = missing).order_by('name'):
+				loaded[role.defined_for_id][role.name] = role
+			cached.update(loaded)
+		
+		if len(content_type_ids) == 1:
+			return cached[content_type_ids[0]]
+		
+		roles = OrderedDict()
+		for content_type_id in content_type_ids:
+			roles.update(cached[content_type_id])
+		return roles
+
+role_registry = RoleRegistry()
+
 class TypeAwareRoleManager(models.Manager):
-	def __init__(self, model_content_type, *args, **kwargs):
+	"""
+	Manager for the Roles defined for one type of model. The type is either
+	given as model_content_type (anything that defined_for can be filtered by),
+	or as content_type_model_name, in which case the content types and the
+	Roles are looked up through the role_registry.
+	"""
+	def __init__(self, model_content_type = None, content_type_model_name = None, *args, **kwargs):
 		super(TypeAwareRoleManager, self).__init__(*args, **kwargs)
 		self.model_content_type = model_content_type
+		self.content_type_model_name = content_type_model_name
 	
 	def get_query_set(self):
+		if self.content_type_model_name is not None:
+			return Role.objects.get_query_set() \
+				.filter(defined_for__in = role_registry.get_content_type_ids(self.content_type_model_name))
+		
 		return Role.objects.get_query_set() \
 			.filter(defined_for = self.model_content_type)
+	
+	def cached(self):
+		""" Returns a list of the Roles, from the role_registry """
+		return list(self._get_cached_roles().values())
+	
+	def get_cached(self, name):
+		""" Returns the Role called name, from the role_registry """
+		try:
+			return self._get_cached_roles()[name]
+		except KeyError:
+			raise Role.DoesNotExist("No role called '{}'".format(name))
+	
+	def _get_cached_roles(self):
+		if self.content_type_model_name is None:
+			raise ImproperlyConfigured("Cached role lookups need a TypeAwareRoleManager with a content_type_model_name")
+		return role_registry.get_roles(role_registry.get_content_type_ids(self.content_type_model_name))
 
 def HasTypeAwareRoleManager(content_type_model_name):
 	""" If a model has a TypeAwareRoleManager (TARM) as a field, and its baseclass defines "objects",
@@ -67,9 +190,10 @@ def HasTypeAwareRoleManager(content_type_model_name):
 	    if, for example, the primary key of the model is a CharField. In this case, the TARM causes an insert
 	    to fail as it uses AutoField() instead of CharField() causing it to issue an int() on the field.
 	"""
+	roles = TypeAwareRoleManager(content_type_model_name = content_type_model_name)
 	attrs = {
 		'assigned_roles' : generic.GenericRelation(AssignedRole),
-		'roles' : property(lambda self: TypeAwareRoleManager(model_content_type = ContentType.objects.filter(model = content_type_model_name)))
+		'roles' : property(lambda self: roles)
 	}
 	
 	return type(str('{}TypeAwareRoleManager'.format(content_type_model_name.title())), (object,), attrs)
@@ -147,6 +271,119 @@ class Role(AsymBaseModel):
 #				users.add(u)
 #		return users
 
+class AssignedRoleManager(AsymBaseManager):
+	def get_permission_index(self, user):
+		"""
+		Returns a dict of (content_type_id, object_id) to the frozenset of
+		permissions ('app_label.codename') user has on that object through
+		the permission_groups of their assigned roles. Uses a single query.
+		"""
+		rows = self.get_query_set().filter(user = user).values_list(
+			'content_type', 'object_id',
+			'role__permission_group__permissions__content_type__app_label',
+			'role__permission_group__permissions__codename',
+		)
+		
+		index = {}
+		for content_type_id, object_id, app_label, codename in rows:
+			# roles whose permission_group has no permissions
+			if codename is None:
+				continue
+			index.setdefault((content_type_id, object_id), set()).add('{}.{}'.format(app_label, codename))
+		
+		return dict((key, frozenset(perms)) for key, perms in index.items())
+	
+	def filter_objects_with_perm(self, user, perm, queryset):
+		"""
+		Returns queryset filtered down to the objects user has perm on through
+		an assigned role, as one query (the role lookup is a subquery).
+		
+		Matches user.has_perm(perm, obj): inactive users have no permissions,
+		and active superusers have all of them.
+		"""
+		if not user.is_active:
+			return queryset.none()
+		if getattr(user, 'is_superuser', False):
+			return queryset
+		
+		app_label, codename = perm.split('.', 1)
+		object_ids = self.get_query_set().filter(
+			user = user,
+			content_type = ContentType.objects.get_for_model(queryset.model),
+			role__permission_group__permissions__content_type__app_label = app_label,
+			role__permission_group__permissions__codename = codename,
+		).values('object_id')
+		
+		return queryset.filter(pk__in = object_ids)
+	
+	def bulk_assign(self, users, role, objects):
+		"""
+		Assigns role to every user on every one of objects, skipping the
+		assignments that already exist. Returns the new (unsaved looking, since
+		bulk_create does not set their ids) AssignedRoles.
+		
+		Everything is validated up front like AssignedRole.save() does, with one
+		query for the permitted users and one for the existing assignments, and
+		the new rows are written with a single bulk_create. As with any
+		bulk_create, no post_save signals are sent; a single audit log entry
+		lists all the new assignments instead.
+		"""
+		users = list(users)
+		objects = list(objects)
+		if not users or not objects:
+			return []
+		
+		content_types = dict((obj.pk, ContentType.objects.get_for_model(obj)) for obj in objects)
+		for obj in objects:
+			if content_types[obj.pk].id != role.defined_for_id:
+				raise ValidationError("'{}' is not defined on '{}'".format(role, content_types[obj.pk]))
+		
+		user_ids = set(user.pk for user in users)
+		permitted_ids = set(role.permitted_users.filter(pk__in = user_ids).values_list('pk', flat = True))
+		for user in users:
+			if user.pk not in permitted_ids:
+				raise ValidationError("'{}' is not permitted to be assigned to '{}'".format(user, role))
+		
+		existing = set(self.get_query_set().filter(
+			role = role,
+			user__in = user_ids,
+			content_type = role.defined_for_id,
+			object_id__in = list(content_types),
+		).values_list('user', 'object_id'))
+		
+		new_assigned_roles = []
+		for user in users:
+			for obj in objects:
+				if (user.pk, obj.pk) in existing:
+					continue
+				existing.add((user.pk, obj.pk))
+				new_assigned_roles.append(self.model(
+					user = user,
+					role = role,
+					content_type = content_types[obj.pk],
+					object_id = obj.pk,
+				))
+		
+		if new_assigned_roles:
+			self.bulk_create(new_assigned_roles)
+			invalidate_permission_cache()
+			
+			# bulk_create doesn't set the ids, so look them up for the audit log
+			new_keys = set((assigned_role.user_id, assigned_role.object_id) for assigned_role in new_assigned_roles)
+			saved = self.get_query_set().filter(
+				role = role,
+				user__in = user_ids,
+				content_type = role.defined_for_id,
+				object_id__in = list(content_types),
+			).values_list('id', 'user', 'object_id')
+			self.model._audit_log_many(
+				[pk for pk, user_id, object_id in saved if (user_id, object_id) in new_keys],
+				access_type = AccessType.ADD,
+				success = True
+			)
+		
+		return new_assigned_roles
+
 class AssignedRole(AsymBaseModel):
 	"""
 	For adding Users in specific roles to models.
@@ -158,6 +395,8 @@ class AssignedRole(AsymBaseModel):
 	object_id = models.PositiveIntegerField()
 	content_object = generic.GenericForeignKey()
 	
+	objects = AssignedRoleManager()
+	
 	def __str__(self):
 		return "Role '{}' on '{}'".format(self.role, self.content_type)
 	
@@ -172,14 +411,23 @@ class AssignedRole(AsymBaseModel):
 		"""
 		Check that role is defined on the content_type and user in permitted_groups.
 		"""
-		if self.role not in Role.objects.filter(defined_for = self.content_type):
+		if self.role.defined_for_id != self.content_type_id:
 			raise ValidationError("'{}' is not defined on '{}'".format(self.role, self.content_type))
 		
-		if self.user not in self.role.permitted_users:
+		if not self.role.permitted_users.filter(pk = self.user_id).exists():
 			raise ValidationError("'{}' is not permitted to be assigned to '{}'".format(self.user, self.role))
 		
 		super(AssignedRole, self).save(*args, **kwargs)
 
+# A Role's permission_group decides the permissions its assignments give
+for model in (Role, AssignedRole):
+	post_save.connect(invalidate_permission_cache, sender = model, dispatch_uid = 'asym_permission_cache_{}_save'.format(model.__name__))
+	post_delete.connect(invalidate_permission_cache, sender = model, dispatch_uid = 'asym_permission_cache_{}_delete'.format(model.__name__))
+
+for model in (Role, ContentType):
+	post_save.connect(role_registry.invalidate, sender = model, dispatch_uid = 'asym_role_registry_{}_save'.format(model.__name__))
+	post_delete.connect(role_registry.invalidate, sender = model, dispatch_uid = 'asym_role_registry_{}_delete'.format(model.__name__))
+
 class RoleTransfer(AsymBaseModel):
 	role_from = models.ForeignKey(Role, related_name = '+')
 	role_to = models.ForeignKey(Role, related_name = '+')
@@ -199,28 +447,64 @@ class RoleTransfer(AsymBaseModel):
 			logger.info("Tried to create a role transfer on identical models {} and {}".format(from_model, to_model))
 			return
 		
-		new_assigned_roles = []
+		from_content_type = from_model.get_content_type()
+		to_content_type = to_model.get_content_type()
 		
 		# All the transfers that could be made
-		possible_transfers = cls.objects.filter(role_from__defined_for = from_model.get_content_type(), role_to__defined_for = to_model.get_content_type())
+		possible_transfers = list(cls.objects.filter(role_from__defined_for = from_content_type, role_to__defined_for = to_content_type).select_related('role_to'))
+		if not possible_transfers:
+			return []
 		
+		# All the assigned roles on the from_model that could be transferred
+		assigned_by_role = {}
+		assigned = AssignedRole.objects.filter(
+			role__in = set(transfer.role_from_id for transfer in possible_transfers),
+			content_type = from_content_type,
+			object_id = from_model.id
+		).select_related('user')
+		for assigned_role in assigned:
+			assigned_by_role.setdefault(assigned_role.role_id, []).append(assigned_role)
+		
+		# The assigned roles the to_model already has, by (user id, role id)
+		to_role_ids = set(transfer.role_to_id for transfer in possible_transfers)
+		to_assigned_roles = AssignedRole.objects.filter(role__in = to_role_ids, content_type = to_content_type, object_id = to_model.id)
+		existing = dict(((assigned_role.user_id, assigned_role.role_id), assigned_role) for assigned_role in to_assigned_roles)
+		
+		# Work out which assigned roles to create, keeping the order that
+		# get_or_create would have returned them in
+		new_keys = []
+		missing = OrderedDict()
 		for transfer in possible_transfers:
-			# See if there are any assigned roles on the from_model
-			assigned = AssignedRole.objects.filter(role = transfer.role_from, content_type = from_model.get_content_type(), object_id = from_model.id)
+			for assigned_role in assigned_by_role.get(transfer.role_from_id, ()):
+				key = (assigned_role.user_id, transfer.role_to_id)
+				new_keys.append(key)
+				if key not in existing and key not in missing:
+					missing[key] = AssignedRole(
+						user = assigned_role.user,
+						role = transfer.role_to,
+						object_id = to_model.id,
+						content_type = to_content_type
+					)
+		
+		if missing:
+			# Same validation as AssignedRole.save(), one query per target role
+			for role in set(assigned_role.role for assigned_role in missing.values()):
+				user_ids = set(user_id for user_id, role_id in missing if role_id == role.id)
+				permitted_ids = set(role.permitted_users.filter(pk__in = user_ids).values_list('pk', flat = True))
+				for (user_id, role_id), assigned_role in missing.items():
+					if role_id == role.id and user_id not in permitted_ids:
+						raise ValidationError("'{}' is not permitted to be assigned to '{}'".format(assigned_role.user, role))
 			
-			# Now copy the role to the to_model
-			for assigned_role in assigned:
-				new_assigned_role, created = AssignedRole.objects.get_or_create(
-					user = assigned_role.user,
-					role = transfer.role_to,
-					object_id = to_model.id,
-					content_type = to_model.get_content_type()
-				)
-				
-				logger.info("Created ({}) assigned role {}/{} for user {}".format(created, new_assigned_role, transfer, assigned_role.user))
-				new_assigned_roles.append(new_assigned_role)
+			AssignedRole.objects.bulk_create(list(missing.values()))
+			invalidate_permission_cache()
+			
+			# bulk_create doesn't set the ids, so load the saved rows back
+			existing = dict(((assigned_role.user_id, assigned_role.role_id), assigned_role) for assigned_role in to_assigned_roles.all())
+			AssignedRole._audit_log_many([existing[key].id for key in missing], access_type = AccessType.ADD, success = True)
 		
-		return new_assigned_roles
+		logger.info("Transferred {} assigned roles ({} created) from {} to {}".format(len(new_keys), len(missing), from_model, to_model))
+		
+		return [existing[key] for key in new_keys]
 	
 	@classmethod
 	def check_groups(cls, from_role, to_role):
@@ -230,13 +514,43 @@ class RoleTransfer(AsymBaseModel):
 		
 		Return a list of messages or None if no errors.
 		"""
-		msg_list = []
-		for from_group in from_role.permitted_groups.all():
-			if from_group not in to_role.permitted_groups.all():
-				msg_list.append("""
+		return cls.check_groups_many([(from_role, to_role)])[(from_role, to_role)]
+	
+	@classmethod
+	def check_groups_many(cls, role_pairs):
+		"""
+		check_groups() for many (from_role, to_role) pairs at once, using a single
+		query for the permitted groups of all the roles involved.
+		
+		Returns an OrderedDict of each pair to its check_groups() result.
+		"""
+		role_pairs = list(role_pairs)
+		role_ids = set()
+		for from_role, to_role in role_pairs:
+			role_ids.update((from_role.id, to_role.id))
+		
+		permitted_groups = {}
+		group_names = {}
+		rows = Role.permitted_groups.through.objects \
+			.filter(role__in = role_ids) \
+			.order_by('group__name') \
+			.values_list('role', 'group', 'group__name')
+		for role_id, group_id, group_name in rows:
+			permitted_groups.setdefault(role_id, []).append(group_id)
+			group_names[group_id] = group_name
+		
+		results = OrderedDict()
+		for from_role, to_role in role_pairs:
+			to_groups = set(permitted_groups.get(to_role.id, ()))
+			msg_list = []
+			for group_id in permitted_groups.get(from_role.id, ()):
+				if group_id not in to_groups:
+					msg_list.append("""
 				The {group} group is not a Permitted Group on the {role} role defined on {to_model}. The role transfer could fail if created.
-				""".format(group = from_group.name, role = to_role.name, to_model = str(to_role.defined_for).title()))
-		return msg_list if len(msg_list) > 0 else None
+				""".format(group = group_names[group_id], role = to_role.name, to_model = str(ContentType.objects.get_for_id(to_role.defined_for_id)).title()))
+			results[(from_role, to_role)] = msg_list if len(msg_list) > 0 else None
+		
+		return results
 
 class DefaultRole(AsymBaseModel):
 	"""
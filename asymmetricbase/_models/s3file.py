@@ -17,11 +17,12 @@
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
-import base64
 import mimetypes
-import uuid
-import time
 import threading
+import time
+import uuid
+from collections import defaultdict
+from itertools import islice
 
 try:
 	from urllib.parse import quote as url_quote
@@ -35,22 +36,20 @@ except ImportError:
 
 from django.utils import timezone
 from django.db import models
-from django.db.utils import DatabaseError
 from django.core.exceptions import ValidationError
 from django.conf import settings
 
 from django_extensions.db.fields.json import JSONField
 
-try:
-	from boto.s3.connection import S3Connection
-	from boto.s3.key import Key
-	from boto import exception as boto_exceptions
-except ImportError:
-	boto = None
-
+from asymmetricbase.fields import EnumField
 from asymmetricbase.logging import logger
+from asymmetricbase.middleware.preview_queue import submit_after_commit
+from asymmetricbase.utils.enum import Enum
+from asymmetricbase.utils.lru import LRUCache
+from asymmetricbase.utils.s3storage import get_s3_storage, MB
+from asymmetricbase.utils.taskpool import TaskPool
 
-from .base import AsymBaseModel
+from .base import AsymBaseModel, AuditedQuerySet, AsymBaseManager
 
 try:
 	import Image # Try to import PIL
@@ -60,7 +59,83 @@ except ImportError:
 	except ImportError:
 		Image = None	# PIL/Pillow not installed. File Preview is disabled
 
-thread_safe_connection_cache = threading.local()
+def prefetch_file_data(s3files, max_workers = None):
+	"""
+	Loads the contents of all the given S3Files concurrently, instead of one
+	round trip per file the first time each file_data is accessed.
+	
+	Files which already have their data, or have no key yet, are skipped.
+	Files whose data can't be fetched are left as they are, so accessing
+	their file_data raises the error as usual.
+	"""
+	by_bucket = defaultdict(list)
+	for s3file in s3files:
+		if s3file._s3_key and not getattr(s3file, '_file_data', None):
+			by_bucket[s3file._get_bucket_name()].append(s3file)
+	
+	storage = get_s3_storage()
+	for bucket_name, bucket_files in by_bucket.items():
+		data = storage.get_many(bucket_name, (s3file._s3_key for s3file in bucket_files), max_workers)
+		for s3file in bucket_files:
+			if s3file._s3_key in data:
+				s3file._file_data = data[s3file._s3_key]
+	
+	return s3files
+
+class S3FileQuerySet(AuditedQuerySet):
+	"""
+	QuerySet for S3Files, which can load the file contents of the objects
+	along with the rows. See prefetch_file_data().
+	"""
+	
+	# How many objects have their data fetched at once
+	PREFETCH_BATCH_SIZE = 100
+	
+	def __init__(self, *args, **kwargs):
+		super(S3FileQuerySet, self).__init__(*args, **kwargs)
+		self._prefetch_file_data = False
+		self._prefetch_max_workers = None
+	
+	def prefetch_file_data(self, max_workers = None):
+		"""
+		Returns a queryset which loads the file_data of its objects from S3
+		concurrently (at most `max_workers` requests at a time), a batch of
+		objects at a time.
+		"""
+		clone = self._clone()
+		clone._prefetch_file_data = True
+		clone._prefetch_max_workers = max_workers
+		return clone
+	
+	def iterator(self):
+		objects = super(S3FileQuerySet, self).iterator()
+		if not self._prefetch_file_data:
+			return objects
+		
+		return self._prefetching_iterator(objects)
+	
+	def _prefetching_iterator(self, objects):
+		while True:
+			batch = list(islice(objects, self.PREFETCH_BATCH_SIZE))
+			if not batch:
+				return
+			
+			for obj in prefetch_file_data(batch, self._prefetch_max_workers):
+				yield obj
+	
+	def _clone(self, *args, **kwargs):
+		clone = super(S3FileQuerySet, self)._clone(*args, **kwargs)
+		clone._prefetch_file_data = self._prefetch_file_data
+		clone._prefetch_max_workers = self._prefetch_max_workers
+		return clone
+
+class S3FileManager(AsymBaseManager):
+	
+	def get_query_set(self):
+		return S3FileQuerySet(self.model, using = self._db)
+	
+	def prefetch_file_data(self, max_workers = None):
+		return self.get_query_set().prefetch_file_data(max_workers)
 
 class S3File(AsymBaseModel):
 	"""
@@ -74,6 +149,8 @@ class S3File(AsymBaseModel):
 	_s3_key = models.CharField(max_length = 256)
 	_s3_version_id = models.CharField(max_length = 256)
 	
+	objects = S3FileManager()
+	
 	class Meta(object):
 		abstract = True
 	
@@ -87,6 +164,41 @@ class S3File(AsymBaseModel):
 	@file_data.setter
 	def file_data(self, value):
 		self._file_data = value
+		self._file_data_changed = True
+	
+	def open(self, mode = 'rb'):
+		"""
+		Returns a file-like object for the contents, so they don't all have to
+		be held in memory.
+		
+		'rb': a seekable S3ReadFile, which reads with ranged GETs. Iterating
+		over it yields the contents in chunks.
+		
+		'wb': an S3WriteFile, which uploads the data when it is closed. The
+		model must then be saved to store the new key and version.
+		"""
+		if mode in ('r', 'rb'):
+			_file_data = getattr(self, '_file_data', None)
+			if _file_data:
+				# not saved yet
+				return ImageBufferIO(_file_data)
+			
+			if not self._s3_key:
+				raise ValueError("S3File has no data to open")
+			
+			return get_s3_storage().open_read(self._get_bucket_name(), self._s3_key)
+		
+		elif mode in ('w', 'wb'):
+			if not self._s3_key:
+				self._s3_key = self._generate_s3_key()
+			
+			def on_close(version_id):
+				self._s3_version_id = version_id
+				self._file_data = None
+			
+			return get_s3_storage().open_write(self._get_bucket_name(), self._s3_key, on_close)
+		
+		raise ValueError("Unsupported mode '{}'".format(mode))
 	
 	@property
 	def content_type(self):
@@ -101,11 +213,7 @@ class S3File(AsymBaseModel):
 		if not self._s3_key:
 			return [] # we don't have a key yet
 		
-		bucket = self._get_s3_bucket(
-			bucket_name = self._get_bucket_name(),
-			assert_versioning_enabled = True
-		)
-		return bucket.list_versions(prefix = self._s3_key)
+		return get_s3_storage().list_versions(self._get_bucket_name(), self._s3_key)
 	
 	def get_file_prefix(self):
 		# Subclasses can use to append a prefix to file name
@@ -123,7 +231,8 @@ class S3File(AsymBaseModel):
 		
 		if _file_data:
 			bucket_name = self._get_bucket_name()
-			self._put_object_in_s3(bucket_name, self._s3_key, _file_data)
+			self._s3_version_id = self._put_object_in_s3(bucket_name, self._s3_key, _file_data)
+			self._file_data_changed = False
 		
 		super(S3File, self).save(*args, **kwargs)
 	
@@ -139,77 +248,11 @@ class S3File(AsymBaseModel):
 		return '{}/{}{}'.format(self.get_file_prefix(), uuid.uuid4(), self.get_file_postfix())
 	
 	def _get_object_from_s3(self, bucket_name, object_name):
-		key = self._get_s3_key(bucket_name, object_name)
-		encoded_value = key.get_contents_as_string()
-		return bytes(base64.b64decode(encoded_value))
+		return get_s3_storage().get(bucket_name, object_name)
 	
 	def _put_object_in_s3(self, bucket_name, object_name, value):
-		key = self._get_s3_key(bucket_name, object_name, assert_versioning_enabled = True)
-		encoded_value = base64.b64encode(bytes(value))
-		key.set_contents_from_string(encoded_value, encrypt_key = True)
-		self._s3_version_id = key.version_id
-	
-	def _get_s3_key(self, bucket_name, object_name, assert_versioning_enabled = False):
-		bucket = self._get_s3_bucket(bucket_name, assert_versioning_enabled)
-		try:
-			return Key(bucket = bucket, name = object_name)
-		except boto_exceptions.BotoClientError as e:
-			raise DatabaseError(
-				"Error retrieving object from S3.\n Bucket: {}\n Object Name: {}\n Boto Exception:\n {}".format(
-					bucket_name, object_name, e
-				)
-			)
-	
-	@classmethod
-	def _get_s3_bucket(cls, bucket_name, assert_versioning_enabled):
-		try:
-			connection = cls._get_s3_connection()
-			if not connection.lookup(bucket_name):
-				connection.create_bucket(bucket_name)
-			
-			bucket = connection.get_bucket(bucket_name)
-			
-			if assert_versioning_enabled:
-				cls._assert_bucket_has_versioning_enabled(bucket)
-				
-			return bucket
-		except boto_exceptions.S3ResponseError as e:
-			raise DatabaseError(
-				"Error retrieving bucket from S3.\nBucket: {}\nBoto Exception:\n{}".format(
-					bucket_name, e
-				)
-			)
-	
-	@classmethod
-	def _assert_bucket_has_versioning_enabled(cls, bucket):
-		d = bucket.get_versioning_status()
-		if 'Versioning' in d and d['Versioning'] == 'Enabled':
-			# already has versioning enabled
-			return
-		bucket.configure_versioning(versioning = True)
-		# need to wait until AWS syncs s3. this is fine,
-		# since we only do this once every few months (when bucket properties change)
-		time.sleep(15)
-	
-	@classmethod
-	def _get_s3_connection(cls):
-		s3_connection = getattr(thread_safe_connection_cache, 's3_connection', None)
-		
-		if s3_connection:
-			return s3_connection
-		
-		aws_access_key_id = getattr(settings, 'AWS_S3_FILES_ACCESS_KEY_ID', None)
-		aws_secret_access_key = getattr(settings, 'AWS_S3_FILES_SECRET_ACCESS_KEY', None)
-		assert aws_access_key_id and aws_secret_access_key, \
-			"Please assign values for AWS_S3_FILES_ACCESS_KEY_ID and AWS_S3_FILES_SECRET_ACCESS_KEY in settings"
-		
-		try:
-			connection = S3Connection(aws_access_key_id, aws_secret_access_key) # TODO: We may want to move to a connection pool
-			setattr(thread_safe_connection_cache, 's3_connection', connection)
-		except boto_exceptions.BotoClientError as e:
-			raise DatabaseError("Unable to connect to S3.\nBoto Exception:\n{}".format(e))
-		
-		return thread_safe_connection_cache.s3_connection
+		"Stores `value` (bytes or a file-like object) and returns the new version id"
+		return get_s3_storage().put(bucket_name, object_name, value)
 	
 	@classmethod
 	def _get_bucket_name(cls):
@@ -225,7 +268,71 @@ class S3File(AsymBaseModel):
 		
 		return real_bucket if not in_test else test_bucket
 
+class PreviewStatus(Enum):
+	NONE = 1, 'none'
+	PENDING = 2, 'pending'
+	READY = 3, 'ready'
+	FAILED = 4, 'failed'
+
+_preview_pool = None
+_preview_pool_lock = threading.Lock()
+
+def _close_db_connection():
+	from django.db import connection
+	connection.close()
+
+def get_preview_pool():
+	"""
+	The TaskPool previews are generated on. Tasks run in the calling thread
+	when settings.IS_IN_TEST is set, or ASYM_PREVIEW_MODE is 'sync'. Tasks
+	submitted while its queue is full are dropped, rather than generating
+	the previews in the request.
+	"""
+	global _preview_pool
+	
+	if _preview_pool is None:
+		with _preview_pool_lock:
+			if _preview_pool is None:
+				background = getattr(settings, 'ASYM_PREVIEW_MODE', 'background') == 'background' and \
+					not getattr(settings, 'IS_IN_TEST', False)
+				_preview_pool = TaskPool(
+					workers = getattr(settings, 'ASYM_PREVIEW_WORKERS', 2),
+					max_queue_size = getattr(settings, 'ASYM_PREVIEW_QUEUE_SIZE', 100),
+					background = background,
+					drop_when_full = True,
+					after_task = _close_db_connection,
+					name = 'PreviewPool'
+				)
+	
+	return _preview_pool
+
+# Recently generated or fetched previews, keyed by (preview key, version id)
+preview_cache = LRUCache(
+	max_size = getattr(settings, 'ASYM_PREVIEW_CACHE_SIZE', 1000),
+	max_bytes = getattr(settings, 'ASYM_PREVIEW_CACHE_BYTES', 16 * MB)
+)
+
+# data: urls built by get_data_url(), keyed by (s3 key, version id, max width)
+data_url_cache = LRUCache(
+	max_size = getattr(settings, 'ASYM_DATA_URL_CACHE_SIZE', 500),
+	max_bytes = getattr(settings, 'ASYM_DATA_URL_CACHE_BYTES', 32 * MB)
+)
+
 class S3FileWithPreview(S3File):
+	"""
+	An S3File which can store small JPEG previews of itself, if it is an image.
+	
+	Previews are generated for every size in Constants.PREVIEW_SIZES (by
+	default just PREVIEW_IMAGE_WIDTH x PREVIEW_IMAGE_HEIGHT) from a single
+	decode of the image. queue_preview_image() does this on the preview
+	pool; set Constants.QUEUE_PREVIEW_ON_SAVE to do it whenever new image
+	data is saved.
+	
+	preview_status records the progress. It is only a hint, as it is updated
+	from another thread, possibly before the row is committed.
+	"""
+	preview_status = EnumField(PreviewStatus, default = PreviewStatus.NONE)
+	
 	class Meta(object):
 		abstract = True
 	
@@ -233,32 +340,160 @@ class S3FileWithPreview(S3File):
 		PREVIEW_IMAGE_WIDTH = None
 		PREVIEW_IMAGE_HEIGHT = None
 	
-	def get_preview_image_data(self):
+	@classmethod
+	def get_preview_sizes(cls):
+		"The sizes of the previews, the first being the default one"
+		sizes = getattr(cls.Constants, 'PREVIEW_SIZES', None)
+		if sizes:
+			return [tuple(size) for size in sizes]
+		return [(cls.Constants.PREVIEW_IMAGE_WIDTH, cls.Constants.PREVIEW_IMAGE_HEIGHT)]
+	
+	def get_preview_image_data(self, size = None):
+		if self.preview_status == PreviewStatus.FAILED:
+			return b""
+		
+		preview_key = self._generate_preview_key(size)
+		cache_key = (preview_key, self._s3_version_id)
+		
+		data = preview_cache.get(cache_key)
+		if data is not None:
+			return data
+		
 		bucket_name = self._get_bucket_name()
 		try:
-			return self._get_object_from_s3(bucket_name, self._generate_preview_key())
+			data = self._get_object_from_s3(bucket_name, preview_key)
 		except IOError:
 			return b""
+		
+		preview_cache.set(cache_key, data)
+		return data
 	
 	def get_preview_type(self):
 		return 'image/jpeg'	# only jpeg previews are currently supported
 	
+	def save(self, *args, **kwargs):
+		new_data = getattr(self, '_file_data_changed', False) and bool(getattr(self, '_file_data', None))
+		queue_preview = new_data and self.is_image() and getattr(self.Constants, 'QUEUE_PREVIEW_ON_SAVE', False)
+		
+		if new_data:
+			# any existing previews are of the old data
+			self.preview_status = PreviewStatus.PENDING if queue_preview else PreviewStatus.NONE
+		
+		super(S3FileWithPreview, self).save(*args, **kwargs)
+		
+		if queue_preview:
+			self.queue_preview_image()
+	
 	def save_preview_image(self):
+		"Generates and stores the previews in the calling thread"
+		self._check_can_save_preview()
+		self._save_previews(self.file_data)
+	
+	def queue_preview_image(self):
+		"""
+		Generates and stores the previews on the preview pool, and returns
+		immediately. Within a request, the previews are only queued once the
+		request's transaction is committed (see PreviewQueueMiddleware).
+		"""
+		self._check_can_save_preview()
+		
+		if self.preview_status != PreviewStatus.PENDING:
+			self._set_preview_status(PreviewStatus.PENDING)
+		
+		# The task gets the pk rather than self, which the request may go on
+		# changing. If the pool is full the task is dropped, and the status
+		# stays PENDING until the previews are queued again.
+		submit_after_commit(get_preview_pool(), type(self)._save_previews_for_pk, self.pk, self._s3_version_id, self.file_data)
+	
+	@classmethod
+	def _save_previews_for_pk(cls, pk, version_id, file_data):
+		"Generates the previews of `file_data` for a fresh copy of row `pk`"
+		retries = getattr(settings, 'ASYM_PREVIEW_STATUS_RETRIES', 5)
+		for attempt in range(retries + 1):
+			try:
+				instance = cls._default_manager.get(pk = pk)
+				break
+			except cls.DoesNotExist:
+				if attempt < retries:
+					time.sleep(0.2 * (attempt + 1))
+		else:
+			logger.warning('Could not save the previews of {} {}, the row does not exist'.format(cls.__name__, pk))
+			return
+		
+		if instance._s3_version_id != version_id:
+			# newer data was saved since, and queued its own previews
+			return
+		
+		instance._save_previews(file_data)
+	
+	def _check_can_save_preview(self):
 		assert Image, "PIL or Pillow is required for image preview"
 		assert self.is_image(), "Cannot save preview image for non-image file"
 		assert self.id and self._s3_key, "Can only save image preview once the image is saved"
-		assert self.Constants.PREVIEW_IMAGE_HEIGHT and self.Constants.PREVIEW_IMAGE_WIDTH, "Set preview image dimensions in the subclass"
+		assert all(width and height for width, height in self.get_preview_sizes()), "Set preview image dimensions in the subclass"
+	
+	def _save_previews(self, file_data):
+		try:
+			previews = self._generate_previews(ImageBufferIO(file_data), self.get_preview_sizes())
+		except PreviewImageGenerationFailed:
+			self._set_preview_status(PreviewStatus.FAILED, wait_for_row = True)
+			raise
 		
-		image_file = ImageBufferIO(self.file_data)
-		output = ImageBufferIO()
+		bucket_name = self._get_bucket_name()
+		for size, preview_image_data in previews.items():
+			preview_image_s3_key = self._generate_preview_key(size)
+			self._put_object_in_s3(bucket_name, preview_image_s3_key, preview_image_data)
+			preview_cache.set((preview_image_s3_key, self._s3_version_id), preview_image_data)
 		
-		self._generate_thumbnail(image_file, output)
+		self._set_preview_status(PreviewStatus.READY, wait_for_row = True)
+	
+	def _set_preview_status(self, status, wait_for_row = False):
+		"""
+		With `wait_for_row`, retries a few times when the row isn't visible
+		yet, as the transaction which saved it may not have been committed.
+		"""
+		self.preview_status = status
+		queryset = type(self)._default_manager.filter(pk = self.pk)
 		
-		preview_image_data = output.getvalue()
-		preview_image_s3_key = self._generate_preview_key()
-		bucket_name = self._get_bucket_name()
+		retries = getattr(settings, 'ASYM_PREVIEW_STATUS_RETRIES', 5) if wait_for_row else 0
+		for attempt in range(retries + 1):
+			if queryset.update(preview_status = status):
+				return
+			if attempt < retries:
+				time.sleep(0.2 * (attempt + 1))
+		
+		if wait_for_row:
+			logger.warning('Could not set preview status of {} {}, the row does not exist'.format(type(self).__name__, self.pk))
+	
+	def _generate_previews(self, image_file, sizes):
+		"""
+		Returns a dict of size to JPEG data, for each of `sizes`. The image is
+		decoded once, and each preview is scaled down from the decoded image.
+		"""
+		sizes = set(sizes)
+		
+		try:
+			image = Image.open(image_file)
+			# Lets the JPEG decoder scale down by up to 8x while decoding,
+			# which is much faster than decoding at full size. The draft size
+			# covers the widest and the tallest preview. No-op for other
+			# formats.
+			image.draft('RGB', (max(width for width, _ in sizes), max(height for _, height in sizes)))
+			if image.mode != 'RGB':
+				image = image.convert('RGB')
+			
+			previews = {}
+			for size in sizes:
+				preview = image.copy()
+				preview.thumbnail(size, Image.ANTIALIAS)
+				output = ImageBufferIO()
+				preview.save(output, 'JPEG')
+				previews[size] = output.getvalue()
+		except IOError:
+			logger.exception('Could not generate thumbnail')
+			raise PreviewImageGenerationFailed()
 		
-		self._put_object_in_s3(bucket_name, preview_image_s3_key, preview_image_data)
+		return previews
 	
 	def _generate_thumbnail(self, image_file, output, size = None):
 		try:
@@ -282,39 +517,83 @@ class S3FileWithPreview(S3File):
 	def is_image(self):
 		return self.content_type in ['image/png', 'image/jpeg', 'image/gif']
 
-	def _generate_preview_key(self):
-		return "{}-preview".format(self._s3_key)
+	def _generate_preview_key(self, size = None):
+		if size is None or tuple(size) == self.get_preview_sizes()[0]:
+			return "{}-preview".format(self._s3_key)
+		return "{}-preview-{}x{}".format(self._s3_key, size[0], size[1])
 	
 	def get_data_url(self, max_width = None):
+		"""
+		Returns the file as a data: url, with images scaled down to at most
+		`max_width` wide.
+		
+		Results are kept in data_url_cache. With ASYM_DATA_URL_PERSIST, scaled
+		images are also stored in S3 next to the original, so other processes
+		don't have to scale them again.
+		"""
+		if not self._s3_key or getattr(self, '_file_data_changed', False):
+			# not saved yet
+			return self._build_data_url(max_width)
+		
+		cache_key = (self._s3_key, self._s3_version_id, max_width)
+		data_url = data_url_cache.get(cache_key)
+		if data_url is None:
+			data_url = self._build_data_url(max_width)
+			data_url_cache.set(cache_key, data_url)
+		
+		return data_url
+	
+	def _build_data_url(self, max_width):
 		data_url = b'data:{};base64,{}'
 		
 		if self.is_image():
-			image_file = ImageBufferIO(self.file_data)
-			output = ImageBufferIO()
-			
-			try:
-				image = Image.open(image_file)
-				
-				s = image.size
-				
-				if max_width and s[0] > max_width:
-					ratio = max_width / s[0]
-					width = s[0] * ratio
-					height = s[1] * ratio
-					self._generate_thumbnail(image, output, (width, height))
-					
-					file_data = output.getvalue()
-				else:
-					file_data = image_file.getvalue()
-			except IOError:
-				file_data = self.file_data
-				logger.exception('Error when trying to resize image for data: url')
+			file_data = self._get_scaled_image_data(max_width)
 		else:
 			file_data = self.file_data
-			
+		
 		data = bytes(url_quote(file_data.encode('base64')))
 		
 		return data_url.format(self.content_type, data)
+	
+	def _get_scaled_image_data(self, max_width):
+		persist = max_width and self._s3_key and getattr(settings, 'ASYM_DATA_URL_PERSIST', False)
+		
+		if persist:
+			bucket_name = self._get_bucket_name()
+			scaled_key = self._generate_scaled_key(max_width)
+			try:
+				return self._get_object_from_s3(bucket_name, scaled_key)
+			except IOError:
+				pass
+		
+		image_file = ImageBufferIO(self.file_data)
+		output = ImageBufferIO()
+		
+		try:
+			image = Image.open(image_file)
+			
+			s = image.size
+			
+			if max_width and s[0] > max_width:
+				ratio = max_width / s[0]
+				width = s[0] * ratio
+				height = s[1] * ratio
+				self._generate_thumbnail(image, output, (width, height))
+				
+				file_data = output.getvalue()
+			else:
+				file_data = image_file.getvalue()
+		except IOError:
+			logger.exception('Error when trying to resize image for data: url')
+			return self.file_data
+		
+		if persist:
+			self._put_object_in_s3(bucket_name, scaled_key, file_data)
+		
+		return file_data
+	
+	def _generate_scaled_key(self, max_width):
+		return "{}-{}-w{}".format(self._s3_key, self._s3_version_id, max_width)
 
 class PreviewImageGenerationFailed(Exception):
 	pass
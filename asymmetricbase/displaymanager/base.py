@@ -17,6 +17,7 @@
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import time
 from bisect import bisect
 from collections import OrderedDict
 
@@ -27,7 +28,6 @@ from jinja2.utils import contextfunction
 
 from asymmetricbase.jinja import jinja_env
 from asymmetricbase.utils.orderedset import OrderedSet
-from asymmetricbase.middleware.request_cache import get_request_cache
 
 DEFAULT_NAMES = ('ordering', 'structural_name',)
 
@@ -190,8 +190,6 @@ class Display(object):
 	''' Per "model" '''
 	__metaclass__ = DisplayMeta
 	
-	USE_CACHE = False
-	
 	def __init__(self, obj, *args, **kwargs):
 		self.obj = obj
 	
@@ -211,53 +209,63 @@ class Display(object):
 		"""
 		context = kwargs.pop('context', {})
 		
-		if Display.USE_CACHE:
-			if id(context) == id({}):
-				tmp = {}
-				tmp = context
-				context = {}
-				context = tmp
-			
-			
-			cache = get_request_cache()
-			
-			macro_key = Display.__make_key(id(cls), name, id(context))
-			
-			macro_ret = cache.get(macro_key)
-		else:
-			macro_ret = None
-		
-		if macro_ret is None:
-			# Load all macros with this context
-			template_dict = Display._load_templates(OrderedDict(), getattr(cls._meta, 'template_name', None), context)
-			
-			# Now find all the macros
-			for template_module in reversed(template_dict.values()):
-				for macro_name, macro in template_module.__dict__.items():
-					if isinstance(macro, Macro):
-						if macro_name == name:
-							macro_ret = macro
-						if Display.USE_CACHE:
-							cache.set(Display.__make_key(id(cls), macro_name, id(context)), macro)
+		index = cls._get_macro_index()
 		
-		if macro_ret is None:
+		template_name = index.macros.get(name)
+		if template_name is None:
 			raise AttributeError('Cannot get macro \'{}\''.format(name))
 		
-		return macro_ret
+		if not context:
+			template_module = index.templates[template_name].module
+		else:
+			template_module = jinja_env.get_cached_template_module(template_name, context)
+		
+		return getattr(template_module, name)
 	
-	@staticmethod
-	def __make_key(*args):
-		return '-'.join(map(str, args))
+	@classmethod
+	def _get_macro_index(cls):
+		index = _macro_indexes.get(cls)
+		if index is None or not index.is_current():
+			index = _macro_indexes[cls] = MacroIndex(getattr(cls._meta, 'template_name', None))
+		return index
+
+# Display class to MacroIndex
+_macro_indexes = {}
+
+class MacroIndex(object):
+	"""
+	Which of a Display's templates defines each macro, the first template
+	in template_name taking precedence.
 	
-	@staticmethod
-	def _load_templates(template_dict, template_name, context):
-		if template_name is not None:
-			if isinstance(template_name, (list, tuple, OrderedSet)):
-				for name in template_name:
-					if name not in template_dict:
-						template_dict.update({name : jinja_env.get_template_module(name, context)})
-			else:
-				if template_name not in template_dict:
-					template_dict.update({template_name : jinja_env.get_template_module(template_name, context)})
+	The templates are only run once, to find their macros. The macros are
+	then taken from modules made for the render context they're used in,
+	see JinjaEnvironment.get_cached_template_module().
+	"""
+	
+	# With jinja's auto_reload, how often to check for changed templates
+	CHECK_INTERVAL = 1
+	
+	def __init__(self, template_name):
+		if template_name is None:
+			template_names = []
+		elif isinstance(template_name, (list, tuple, OrderedSet)):
+			template_names = template_name
+		else:
+			template_names = [template_name]
 		
-		return template_dict
+		self.templates = OrderedDict((name, jinja_env.get_template(name)) for name in template_names)
+		self.macros = {}
+		
+		for template_name, template in reversed(list(self.templates.items())):
+			for macro_name, macro in template.module.__dict__.items():
+				if isinstance(macro, Macro):
+					self.macros[macro_name] = template_name
+		
+		self.checked = time.time()
+	
+	def is_current(self):
+		if not jinja_env.auto_reload or time.time() - self.checked < self.CHECK_INTERVAL:
+			return True
+		
+		self.checked = time.time()
+		return all(jinja_env.get_template(name) is template for name, template in self.templates.items())
@@ -21,18 +21,63 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 import operator
 from collections import OrderedDict
 
-from asymmetricbase.displaymanager.fields import MenuItemField
+from django.db.models.query import QuerySet
+
+from jinja2.utils import contextfunction
+from markupsafe import escape
+
+from asymmetricbase.displaymanager.fields import MenuItemField, AttrGetField, AttrCallField
 from asymmetricbase.displaymanager.base import Display
+from asymmetricbase.jinja.global_functions import jinja_getattr
+
+FIELDS_TEMPLATE = 'asymmetricbase/displaymanager/fields.djhtml'
+
+def _compile_attr_cell(attr, call):
+	"""
+	Renders what fields.djhtml's attr_field (or attr_call_field) macro would,
+	without going through the macro. Falls back to jinja's getattr, for
+	item lookups and undefined attributes.
+	"""
+	getter = operator.attrgetter(attr)
+	
+	def cell(context, item):
+		try:
+			value = getter(item)
+		except AttributeError:
+			value = jinja_getattr(context.environment, item, attr)
+		
+		if call:
+			value = value()
+		
+		return escape(value)
+	
+	return cell
+
+def _compile_cell(field, index):
+	if type(field) in (AttrGetField, AttrCallField):
+		call = type(field) is AttrCallField
+		if index.macros.get('attr_call_field' if call else 'attr_field') == FIELDS_TEMPLATE:
+			return _compile_attr_cell(field.field_name, call)
+	
+	return field
+
+# (SimpleTableDisplay class, exclude) to (MacroIndex, compiled cells)
+_compiled_cells = {}
 
 class SimpleTableDisplay(Display):
 	
-	def __init__(self, obj, exclude = (), *args, **kwargs):
+	def __init__(self, obj, exclude = (), iterator = False, *args, **kwargs):
 		"""
 		:param exclude: fields that should not be displayed
 		:type exclude: tuble containing field names
+		:param iterator: read a QuerySet with .iterator(), so its rows aren't
+		                 all kept in memory. Use with streamed responses and
+		                 the vtable_stream.djhtml template.
+		:type iterator: bool
 		"""
 		super(SimpleTableDisplay, self).__init__(obj, *args, **kwargs)
 		self.exclude = exclude
+		self.iterator = iterator
 	
 	class Meta(object):
 		template_name = ('asymmetricbase/displaymanager/fields.djhtml', 'asymmetricbase/displaymanager/vtable.djhtml')
@@ -43,8 +88,33 @@ class SimpleTableDisplay(Display):
 	
 	@property
 	def items(self):
+		if self.iterator and isinstance(self.obj, QuerySet):
+			return self.obj.iterator()
 		return self.obj
 	
+	@contextfunction
+	def render_row(self, context, item):
+		"""
+		Returns the cells of the row for `item`, as each column would render
+		them.
+		"""
+		return [cell(context, item) for cell in self._get_cells()]
+	
+	def _get_cells(self):
+		"""
+		The columns, compiled once per class and exclude. Plain AttrGetFields
+		and AttrCallFields are rendered directly, instead of through their
+		macros, as they are usually most of the cells of big tables.
+		"""
+		index = self._get_macro_index()
+		key = (type(self), tuple(self.exclude))
+		
+		compiled = _compiled_cells.get(key)
+		if compiled is None or compiled[0] is not index:
+			compiled = _compiled_cells[key] = (index, [_compile_cell(field, index) for field in self.columns])
+		
+		return compiled[1]
+	
 	@property
 	def empty_form(self):
 		if hasattr(self.obj, 'empty_form'):
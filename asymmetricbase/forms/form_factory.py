@@ -17,19 +17,45 @@
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
-from copy import deepcopy
+from copy import copy, deepcopy
+
+import operator
 
 from django.http import QueryDict
+from django.db.models import Model
+from django.db.models.query import QuerySet
+from django.utils.functional import SimpleLazyObject, new_method_proxy
+
+from markupsafe import escape
 
 from asymmetricbase.logging import logger # @UnusedImport
 from asymmetricbase import forms
 
+def _copy_value(value):
+	"""
+	Copies the containers a request might modify, and clones querysets so
+	their results aren't cached across requests. Model instances are deep
+	copied, as a shallow copy would share their _state (and so eg. whether
+	they are saved yet). Anything else is shared.
+	"""
+	if isinstance(value, QuerySet):
+		return value.all()
+	if isinstance(value, Model):
+		return deepcopy(value)
+	if isinstance(value, (dict, list, set)):
+		return copy(value)
+	return value
+
 class FormFactory(object):
 	"""
 	If you need a form to return is_valid() == True even when request.{POST,GET}
 	is an empty QueryDict(), then set always_bound = True
 	
 	If you need to merge POST and GET, call with use_REQUEST = True
+	
+	AsymBaseView only creates a form (and runs its callbacks) when it is first
+	used, unless the form is eager. Pass eager = True or False to choose, by
+	default forms with callbacks are eager.
 	"""
 	
 	def __init__(self, form, *args, **kwargs):
@@ -47,6 +73,7 @@ class FormFactory(object):
 		self.parents = set(kwargs.pop('parents', []))
 		self.use_GET = kwargs.pop('use_GET', False)
 		self.use_REQUEST = kwargs.pop('use_REQUEST', False)
+		self.eager = kwargs.pop('eager', None)
 		
 		self.kwargs = kwargs
 		self.instance = None
@@ -92,11 +119,37 @@ class FormFactory(object):
 			callback(self.form_instance)
 		return self.form_instance
 	
+	def is_eager(self):
+		if self.eager is None:
+			return any(self.callbacks)
+		return self.eager
+	
 	def process_callbacks(self):
 		is_valid = self.form_instance.is_valid()
 		for callback in filter(None, self.callbacks):
 			callback(self.form_instance, is_valid)
 	
+	def copy(self):
+		"""
+		Returns a copy of this factory to be used for one request. This is much
+		cheaper than deepcopy(): only what __call__() and the view may change
+		is copied, see _copy_value().
+		"""
+		ret = type(self).__new__(type(self))
+		ret.__dict__.update(self.__dict__)
+		
+		ret.args = tuple(_copy_value(arg) for arg in self.args)
+		ret.kwargs = { k : _copy_value(v) for k, v in self.kwargs.items() }
+		ret.callbacks = list(self.callbacks)
+		ret.init_callbacks = list(self.init_callbacks)
+		ret.children = set(self.children)
+		ret.parents = set(self.parents)
+		ret.data = _copy_value(self.data)
+		ret.initial = _copy_value(self.initial)
+		ret.instance = _copy_value(self.instance)
+		
+		return ret
+	
 	def __deepcopy__(self, memo):
 		form = deepcopy(self.form, memo)
 		args = deepcopy(self.args, memo)
@@ -108,6 +161,7 @@ class FormFactory(object):
 		kwargs['use_GET'] = self.use_GET
 		kwargs['use_REQUEST'] = self.use_REQUEST
 		kwargs['always_bound'] = self.always_bound
+		kwargs['eager'] = self.eager
 		ret = FormFactory(form, *args, callbacks = callbacks, init_callbacks = init_callbacks, **kwargs)
 		
 		ret.data = deepcopy(self.data, memo)
@@ -132,6 +186,19 @@ class FormFactory(object):
 				else:
 					setattr(field, k, v)
 
+class LazyForm(SimpleLazyObject):
+	"""
+	Stands in for a form (or formset) until it is used, then creates it with
+	`func` and passes everything on to it.
+	"""
+	
+	__getitem__ = new_method_proxy(operator.getitem)
+	__contains__ = new_method_proxy(operator.contains)
+	__iter__ = new_method_proxy(iter)
+	__len__ = new_method_proxy(len)
+	__nonzero__ = __bool__ = new_method_proxy(bool)
+	__html__ = new_method_proxy(escape)
+
 def form_callback(form, position = None, is_init = False):
 	callback_list = form.callbacks if not is_init else form.init_callbacks
 	
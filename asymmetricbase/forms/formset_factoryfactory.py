@@ -42,6 +42,7 @@ class AsymFormFactoryFactoryDeepcopier(object):
 		self.kwargs['use_GET'] = instance.use_GET
 		self.kwargs['use_REQUEST'] = instance.use_REQUEST
 		self.kwargs['always_bound'] = instance.always_bound
+		self.kwargs['eager'] = instance.eager
 		
 		self.kwargs['extra'] = instance.extra
 		self.kwargs['max_num'] = instance.max_num
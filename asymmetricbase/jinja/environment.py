@@ -16,12 +16,18 @@
 #    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
 
 from __future__ import absolute_import, division, print_function, unicode_literals
+import threading
 import warnings
+import weakref
 
 from django.conf import settings
 from django.template.context import RequestContext, Context
 
 import jinja2
+from jinja2.runtime import Context as JinjaContext
+
+# Per thread, a dict of jinja Context to {template name : module}
+_context_modules = threading.local()
 
 class UndefinedVar(jinja2.Undefined):
 	def __int__(self):
@@ -82,6 +88,34 @@ class JinjaEnvironment(jinja2.Environment):
 	def get_template_module(self, template_name, ctx = None):
 		return self.get_template(template_name).make_module(vars = ctx)
 	
+	def get_cached_template_module(self, template_name, ctx = None):
+		"""
+		Like get_template_module(), but reuses the modules. Modules for an
+		empty context are the template's own (Template.module), and modules
+		for a jinja Context are kept for as long as that Context is alive, so
+		they are made once per render instead of once per call.
+		"""
+		if ctx is None or (isinstance(ctx, dict) and not ctx):
+			return self.get_template(template_name).module
+		
+		if not isinstance(ctx, JinjaContext):
+			return self.get_template_module(template_name, ctx)
+		
+		try:
+			cache = _context_modules.cache
+		except AttributeError:
+			cache = _context_modules.cache = weakref.WeakKeyDictionary()
+		
+		modules = cache.get(ctx)
+		if modules is None:
+			modules = cache[ctx] = {}
+		
+		module = modules.get(template_name)
+		if module is None:
+			module = modules[template_name] = self.get_template_module(template_name, ctx)
+		
+		return module
+	
 	@classmethod
 	def context_to_dict(cls, ctx):
 		merged_context = {}
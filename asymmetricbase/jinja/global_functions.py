@@ -90,15 +90,15 @@ def jinja_resolve_contextattributes(context, __obj, **kwargs):
 
 @contextfunction
 def jinja_vtable(ctx, table, header = '', tail = '', title = ''):
-	return ctx.environment.get_template_module('asymmetricbase/displaymanager/base.djhtml', ctx).vtable(table, header, tail, title)
+	return ctx.environment.get_cached_template_module('asymmetricbase/displaymanager/base.djhtml', ctx).vtable(table, header, tail, title)
 
 @contextfunction
 def jinja_gridlayout(ctx, layout):
-	return ctx.environment.get_template_module('asymmetricbase/displaymanager/base.djhtml', ctx).gridlayout(layout)
+	return ctx.environment.get_cached_template_module('asymmetricbase/displaymanager/base.djhtml', ctx).gridlayout(layout)
 
 @contextfunction
 def jinja_display(ctx, layout):
-	return ctx.environment.get_template_module('asymmetricbase/displaymanager/base.djhtml', ctx).display(layout)
+	return ctx.environment.get_cached_template_module('asymmetricbase/displaymanager/base.djhtml', ctx).display(layout)
 
 def get_functions(jinja_env):
 	return {
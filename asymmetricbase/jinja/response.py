@@ -17,21 +17,26 @@
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+from django.conf import settings
+from django.http import StreamingHttpResponse
 from django.template.response import TemplateResponse
 from django.template.context import RequestContext
 
 from asymmetricbase.jinja import jinja_env
 from asymmetricbase.logging import logger #@UnusedImport
 
+def _resolve_template(template):
+	if isinstance(template, (list, tuple)):
+		return jinja_env.select_template(template)
+	elif isinstance(template, basestring):
+		return jinja_env.get_template(template)
+	else:
+		return template
+
 class JinjaTemplateResponse(TemplateResponse):
 	
 	def resolve_template(self, template):
-		if isinstance(template, (list, tuple)):
-			return jinja_env.select_template(template)
-		elif isinstance(template, basestring):
-			return jinja_env.get_template(template)
-		else:
-			return template
+		return _resolve_template(template)
 	
 	def resolve_context(self, context):
 		context = super(JinjaTemplateResponse, self).resolve_context(context)
@@ -40,3 +45,43 @@ class JinjaTemplateResponse(TemplateResponse):
 			context = jinja_env.context_to_dict(context)
 			
 		return context
+
+class StreamingJinjaTemplateResponse(StreamingHttpResponse):
+	"""
+	Renders the template while the response is being sent, using jinja's
+	Template.stream(), so the page never has to be held in memory at once.
+	
+	Takes the same arguments as JinjaTemplateResponse. The context
+	processors run when the response is created, but the template is only
+	rendered after the view and the response middleware have returned, so
+	errors while rendering can no longer become an error page.
+	
+	The output is sent in pieces of `buffer_size` template events
+	(ASYM_STREAMING_BUFFER_SIZE, default 100).
+	
+	A macro call returns its whole output at once, so anything rendered
+	through a macro, such as {{ vtable(table) }}, is built in memory before
+	any of it is sent. Big tables should be included with
+	asymmetricbase/displaymanager/vtable_stream.djhtml instead, which renders
+	them row by row.
+	"""
+	
+	def __init__(self, request, template, context = None, content_type = None, status = None, current_app = None, buffer_size = None):
+		super(StreamingJinjaTemplateResponse, self).__init__(content_type = content_type, status = status)
+		
+		self._request = request
+		self.template_name = template
+		self.buffer_size = buffer_size or getattr(settings, 'ASYM_STREAMING_BUFFER_SIZE', 100)
+		
+		context = RequestContext(request, context, current_app = current_app)
+		self.context_data = jinja_env.context_to_dict(context)
+		
+		self.streaming_content = self._render()
+	
+	def _render(self):
+		template = _resolve_template(self.template_name)
+		stream = template.stream(self.context_data)
+		stream.enable_buffering(self.buffer_size)
+		
+		for chunk in stream:
+			yield chunk
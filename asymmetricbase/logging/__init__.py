@@ -19,7 +19,7 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 import logging
 
-from django.utils.functional import SimpleLazyObject
+from django.utils.functional import SimpleLazyObject, empty
 
 class NullHandler(logging.Handler):
 	def emit(self, record):
@@ -52,3 +52,12 @@ def init_tracing_logger():
 logger = SimpleLazyObject(init_tracing_logger)
 line_logger = SimpleLazyObject(init_logger)
 audit_logger = SimpleLazyObject(init_audit_logger)
+
+def unwrap_logger(lazy_logger):
+	"""
+	Returns the Logger behind one of the lazy loggers above, so code that
+	logs a lot doesn't go through the SimpleLazyObject proxy for each call.
+	"""
+	if lazy_logger._wrapped is empty:
+		lazy_logger._setup()
+	return lazy_logger._wrapped
@@ -18,22 +18,168 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 import logging
+import threading
+
+from asymmetricbase.logging.batchwriter import BatchWriter, reset_db_connection
+
+WRITE_MODES = ('sync', 'request', 'background')
+
+def write_audit_entries(entries):
+	"""
+	Saves a list of (AuditEntry, object content json) pairs built by
+	AuditLogGenerator.build(), with one bulk_create for the ObjectContent rows
+	and one for the AuditEntry rows.
+	"""
+	from django.db import transaction
+	from asymmetricbase.models import AuditEntry
+	
+	with transaction.commit_on_success():
+		object_contents = _save_object_contents(set(content for _, content in entries if content is not None))
+		for audit_entry, content_in_json in entries:
+			if content_in_json is not None:
+				audit_entry.object_content_id = object_contents[content_in_json]
+		
+		AuditEntry.objects.bulk_create([audit_entry for audit_entry, _ in entries])
+
+def _save_object_contents(contents):
+	"""
+	Inserts an ObjectContent for each of `contents`, and returns a dict of
+	content to the id of its row.
+	
+	bulk_create doesn't set the ids, so the rows are read back, only looking
+	at the ids after the highest one before the insert. Entries with the same
+	content are the same snapshot of an object, so they share a row, and it
+	doesn't matter if another process inserted the same content meanwhile.
+	"""
+	from django.db.models import Max
+	from asymmetricbase.models import ObjectContent
+	
+	if not contents:
+		return {}
+	
+	last_id = ObjectContent.objects.aggregate(last_id = Max('id'))['last_id'] or 0
+	ObjectContent.objects.bulk_create([ObjectContent(content_in_json = content) for content in contents])
+	
+	return dict(ObjectContent.objects.filter(
+		id__gt = last_id,
+		content_in_json__in = list(contents),
+	).values_list('content_in_json', 'id'))
 
 class AuditLoggingHandler(logging.Handler):
 	"""
 		Performs our Audit logging. If there is a model included in the record,
 		we will also include Object Retention info
+		
+		Nothing is written unless ASYM_AUDIT_ENABLED is set, see
+		AuditLogGenerator.build().
+		
+		How the entries are written depends on ASYM_AUDIT_WRITE_MODE (or the
+		`write_mode` argument):
+		
+		'sync'       Every record is saved as soon as it is emitted.
+		'request'    Records are buffered and saved together when the request
+		             finishes (AddRequestToLoggerMiddleware calls flush()), or
+		             as soon as ASYM_AUDIT_BATCH_SIZE records are waiting.
+		'background' Records are handed to a BatchWriter, which saves them in
+		             batches from its own thread. See BatchWriter for the
+		             meaning of ASYM_AUDIT_BATCH_SIZE, ASYM_AUDIT_FLUSH_INTERVAL,
+		             ASYM_AUDIT_QUEUE_SIZE and ASYM_AUDIT_QUEUE_TIMEOUT. What
+		             is still queued is written when the process exits.
 	"""
-	def __init__(self, *args, **kwargs):
+	def __init__(self, write_mode = None, batch_size = None, flush_interval = None, max_queue_size = None, put_timeout = None, *args, **kwargs):
+		self._local = threading.local()
+		self._writer_lock = threading.Lock()
 		super(AuditLoggingHandler, self).__init__(*args, **kwargs)
-		self.django_request = None
+		self.writer = None
+		
+		self._write_mode = write_mode
+		self._batch_size = batch_size
+		self._flush_interval = flush_interval
+		self._max_queue_size = max_queue_size
+		self._put_timeout = put_timeout
 	
 	def _get_current_user_info(self):
 		pass
 	
+	# The request and the buffered entries are kept per thread, since the
+	# handler is shared by all the threads serving requests
+	
+	@property
+	def django_request(self):
+		return getattr(self._local, 'django_request', None)
+	
+	@django_request.setter
+	def django_request(self, request):
+		self._local.django_request = request
+	
+	@property
+	def buffer(self):
+		buffer = getattr(self._local, 'buffer', None)
+		if buffer is None:
+			buffer = self._local.buffer = []
+		return buffer
+	
+	@buffer.setter
+	def buffer(self, buffer):
+		self._local.buffer = buffer
+	
+	@property
+	def write_mode(self):
+		from django.conf import settings
+		
+		write_mode = self._write_mode or getattr(settings, 'ASYM_AUDIT_WRITE_MODE', 'request')
+		assert write_mode in WRITE_MODES, "ASYM_AUDIT_WRITE_MODE must be one of {}".format(', '.join(WRITE_MODES))
+		return write_mode
+	
+	@property
+	def batch_size(self):
+		from django.conf import settings
+		return self._batch_size or getattr(settings, 'ASYM_AUDIT_BATCH_SIZE', 100)
+	
+	def get_writer(self):
+		if self.writer is None:
+			with self._writer_lock:
+				if self.writer is None:
+					from django.conf import settings
+					
+					self.writer = BatchWriter(
+						write_audit_entries,
+						batch_size = self.batch_size,
+						flush_interval = self._flush_interval or getattr(settings, 'ASYM_AUDIT_FLUSH_INTERVAL', 1.0),
+						max_queue_size = self._max_queue_size or getattr(settings, 'ASYM_AUDIT_QUEUE_SIZE', 1000),
+						put_timeout = self._put_timeout or getattr(settings, 'ASYM_AUDIT_QUEUE_TIMEOUT', 0.5),
+						on_error = reset_db_connection,
+						name = 'AuditWriter',
+					)
+		return self.writer
+	
 	def emit(self, record):
-		log_generator = AuditLogGenerator(self.django_request, record)
-		log_generator.generate()
+		entry = AuditLogGenerator(self.django_request, record).build()
+		if entry is None:
+			return
+		
+		write_mode = self.write_mode
+		
+		if write_mode == 'sync':
+			write_audit_entries([entry])
+		elif write_mode == 'background':
+			self.get_writer().put(entry)
+		else:
+			self.buffer.append(entry)
+			if len(self.buffer) >= self.batch_size:
+				self.flush()
+	
+	def flush(self):
+		"Saves the records the current thread buffered in 'request' mode"
+		entries, self.buffer = self.buffer, []
+		if entries:
+			write_audit_entries(entries)
+	
+	def close(self):
+		self.flush()
+		if self.writer is not None:
+			self.writer.stop()
+		super(AuditLoggingHandler, self).close()
 
 class AuditLogGenerator(object):
 	def __init__(self, request, record):
@@ -41,59 +187,64 @@ class AuditLogGenerator(object):
 		self.record = record
 	
 	def generate(self):
+		entry = self.build()
+		if entry is not None:
+			write_audit_entries([entry])
+	
+	def build(self):
+		"""
+		Returns an unsaved (AuditEntry, object content json) pair for the
+		record, or None if the record should not be logged.
+		
+		Records are only logged when ASYM_AUDIT_ENABLED is set, and while there
+		is a request (set by AddRequestToLoggerMiddleware). This used to check
+		a `django_request` attribute the generator never had, so nothing was
+		ever logged; the setting keeps that the default.
+		"""
 		from django.conf import settings
 		
-		if getattr(settings, 'IS_IN_TEST', False):
-			return
+		if getattr(settings, 'IS_IN_TEST', False) or not getattr(settings, 'ASYM_AUDIT_ENABLED', False):
+			return None
 		
-		if not hasattr(self, 'django_request') or self.django_request is None:
-			return
+		if self.request is None:
+			return None
 		
 		self._get_access_type()
 		self._get_log_type()
 		self._get_success()
 		if self._do_ignore_log():
-			return
+			return None
 		self._get_current_user_info()
 		self._get_ip()
 		self._get_model()
 		self._get_view_name()
-		self._save_object_contnt()
-		self._save_log_entry()
+		return self._build_log_entry(), self._get_object_content()
 	
-	def _save_log_entry(self):
-		from django.db import transaction
+	def _build_log_entry(self):
 		from asymmetricbase.models import AuditEntry
 		
-		with transaction.commit_on_success():
-			l = AuditEntry(
-				log_type = self.log_type,
-				access_type = self.access_type,
-				user_id = self.user.id if self.user is not None else None,
-				ip = self.ip,
-				message = self.record.msg,
-				model_name = self.model_str,
-				view_name = self.view_name,
-				success = self.success,
-				object_content = self.object_content,
-			)
-			l.save()
-	
-	def _save_object_contnt(self):
-		from asymmetricbase.models import ObjectContent
+		return AuditEntry(
+			log_type = self.log_type,
+			access_type = self.access_type,
+			user_id = self.user.id if self.user is not None else None,
+			ip = self.ip,
+			message = self.record.msg,
+			model_name = self.model_str,
+			view_name = self.view_name,
+			success = self.success,
+		)
+	
+	def _get_object_content(self):
 		from django.core import serializers
-
+		
 		if not self._is_save_object_content_required():
-			self.object_content = None
-			return
+			return None
 		
 		# serializer only accepts iterables!
-		content_in_json = serializers.serialize('json', [self.model], ensure_ascii = False)
-		oc = ObjectContent(content_in_json = content_in_json)
-		oc.save()
-		
-		self.object_content = oc
-	
+		# The content is serialized now, since the model may have changed by
+		# the time the entry is saved.
+		return serializers.serialize('json', [self.model], ensure_ascii = False)
+
 	def _is_save_object_content_required(self):
 		from asymmetricbase.models import LogEntryType, AccessType
 
@@ -135,7 +286,8 @@ class AuditLogGenerator(object):
 			self.model_str = u"{model.__class__.__name__}.{model.id}".format(model = self.model)
 		except AttributeError:
 			self.model = None
-			self.model_str = None
+			# Entries covering many objects only give the model's name
+			self.model_str = getattr(self.record, 'model_name', None)
 	
 	def _get_view_name(self):
 		try:
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+#    Asymmetric Base Framework - A collection of utilities for django frameworks
+#    Copyright (C) 2013  Asymmetric Ventures Inc.
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; version 2 of the License.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import time
+
+try:
+	from queue import Empty
+except ImportError:
+	from Queue import Empty
+
+from asymmetricbase.utils.worker_queue import WorkerQueue, _STOP
+
+def reset_db_connection():
+	"""
+	For use as a writer's `on_error`: rolls back whatever the failed write left
+	open and closes the writer thread's connection, so the next batch starts
+	on a fresh one instead of failing on an aborted transaction.
+	"""
+	from django.db import connection
+	
+	try:
+		connection._rollback()
+	finally:
+		connection.close()
+
+class BatchWriter(WorkerQueue):
+	"""
+	Hands items to `write_batch` in batches, from a background thread.
+	
+	A batch is written once `batch_size` items are waiting, or
+	`flush_interval` seconds after the first item of the batch was queued,
+	whichever comes first. See WorkerQueue for the other arguments. By default
+	the items still queued when the process exits are written first.
+	"""
+	
+	def __init__(self, write_batch, batch_size = 100, flush_interval = 1.0, max_queue_size = 1000, put_timeout = 0.5, background = True, on_error = None, stop_at_exit = True, name = 'BatchWriter'):
+		super(BatchWriter, self).__init__(
+			workers = 1,
+			max_queue_size = max_queue_size,
+			put_timeout = put_timeout,
+			background = background,
+			on_error = on_error,
+			stop_at_exit = stop_at_exit,
+			name = name,
+		)
+		self.write_batch = write_batch
+		self.batch_size = batch_size
+		self.flush_interval = flush_interval
+	
+	def flush(self):
+		"Blocks until every queued item has been written"
+		self.join()
+	
+	def _process(self, items):
+		self.write_batch(items)
+	
+	def _get_items(self):
+		batch = [self._queue.get()]
+		deadline = time.time() + self.flush_interval
+		
+		while batch[-1] is not _STOP and len(batch) < self.batch_size:
+			timeout = deadline - time.time()
+			if timeout <= 0:
+				break
+			try:
+				batch.append(self._queue.get(True, timeout))
+			except Empty:
+				break
+		
+		return batch
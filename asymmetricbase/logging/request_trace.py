@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+#    Asymmetric Base Framework - A collection of utilities for django frameworks
+#    Copyright (C) 2013  Asymmetric Ventures Inc.
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; version 2 of the License.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import logging
+import time
+
+class _NullPhase(object):
+	def start(self):
+		pass
+	
+	def stop(self):
+		pass
+	
+	def __enter__(self):
+		return self
+	
+	def __exit__(self, *exc_info):
+		return False
+
+_null_phase = _NullPhase()
+
+class NullRequestTrace(object):
+	"""
+	What requests get when tracing is off. Every method does nothing, so
+	tracing can be left in production code.
+	"""
+	enabled = False
+	
+	def phase(self, name):
+		return _null_phase
+	
+	def add(self, name, duration):
+		pass
+	
+	def log(self, logger, path):
+		pass
+
+null_request_trace = NullRequestTrace()
+
+class _Phase(object):
+	"""
+	Times a phase, either as a context manager, or between start() and stop()
+	for phases that don't end in the same block, such as rendering.
+	"""
+	def __init__(self, trace, name):
+		self.trace = trace
+		self.name = name
+		self.started = None
+	
+	def start(self):
+		self.started = time.time()
+	
+	def stop(self):
+		if self.started is not None:
+			self.trace.add(self.name, time.time() - self.started)
+			self.started = None
+	
+	def __enter__(self):
+		self.start()
+		return self
+	
+	def __exit__(self, *exc_info):
+		self.stop()
+		return False
+
+class RequestTrace(object):
+	"""
+	Times the phases of a request:
+	
+	> with trace.phase('preprocess'):
+	>     ...
+	
+	The timings are logged in one DEBUG line by log(), and passed as the
+	`timings` attribute of its record, a list of (phase name, seconds).
+	"""
+	enabled = True
+	
+	def __init__(self):
+		self.start = time.time()
+		self.timings = []
+	
+	def phase(self, name):
+		return _Phase(self, name)
+	
+	def add(self, name, duration):
+		self.timings.append((name, duration))
+	
+	def log(self, logger, path):
+		total = time.time() - self.start
+		logger.debug('Request %s took %.1fms: %s', path, total * 1000,
+			_TimingsFormatter(self.timings), extra = {'timings' : self.timings})
+
+class _TimingsFormatter(object):
+	# Formats the timings only if the message is actually formatted
+	def __init__(self, timings):
+		self.timings = timings
+	
+	def __str__(self):
+		return ', '.join('{}={:.1f}ms'.format(name, duration * 1000) for name, duration in self.timings)
+
+def start_request_trace(request, logger):
+	"""
+	Returns a RequestTrace for the request if `logger` is enabled for DEBUG,
+	otherwise null_request_trace. It is also set as request.asym_trace.
+	"""
+	trace = RequestTrace() if logger.isEnabledFor(logging.DEBUG) else null_request_trace
+	request.asym_trace = trace
+	return trace
+
+def get_request_trace(request):
+	return getattr(request, 'asym_trace', null_request_trace)
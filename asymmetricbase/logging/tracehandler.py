@@ -19,21 +19,138 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 import logging
 from logging import CRITICAL, DEBUG, ERROR, FATAL, INFO, WARN
+import random
 import re
+import threading
+import time
 from pprint import pformat
 
-from django.utils.encoding import force_str
+from django.utils.encoding import force_str, force_text
+
+from asymmetricbase.logging.batchwriter import BatchWriter, reset_db_connection
+
+WRITE_MODES = ('sync', 'background')
+SAMPLE_MODES = ('all', 'slow', 'errors')
+
+SENSITIVE_KEYS = ['pass', 'password', 'key']
+SENSITIVE_KEY_RX = re.compile(r'|'.join(re.escape(r) for r in SENSITIVE_KEYS), re.I)
+META_KEY_RX = re.compile(r'^(HTTP|CONTENT|SERVER|REMOTE).*')
+
+ERROR_LEVELS = ('C', 'E', 'F')
+
+def build_trace_entry(data):
+	"""
+	Builds an unsaved TraceEntry from the data DBTraceHandler collected for a
+	request. The request dicts are only formatted here, off the request thread.
+	"""
+	from asymmetricbase.models import TraceEntry
+	
+	return TraceEntry(
+		get = data['get'],
+		method = data['method'],
+		user = data['user'],
+		msg = data['msg'],
+		exc_info = data['exc_info'],
+		request_meta = force_str(pformat(data['request_meta'])),
+		request_data = force_str(pformat(data['request_data'])),
+	)
+
+def write_trace_entries(entries):
+	""" Saves a list of the data DBTraceHandler collected, with a single bulk_create """
+	from django.db import transaction
+	from asymmetricbase.models import TraceEntry
+	
+	with transaction.commit_on_success():
+		TraceEntry.objects.bulk_create([build_trace_entry(data) for data in entries])
 
 class DBTraceHandler(logging.Handler):
-	def __init__(self):
-		self.rows = []
-		self.django_request = None
+	"""
+	Collects the trace log records of a request and saves them as a single
+	TraceEntry when TraceLogger calls flush() at the end of the request.
+	
+	ASYM_TRACE_WRITE_MODE (or `write_mode`) decides how the entries are saved:
+	
+	'sync'       flush() saves the entry itself.
+	'background' (default outside of tests) The entry is handed to a BatchWriter, which saves
+	             entries in batches from its own thread (and so on its own
+	             database connection). ASYM_TRACE_BATCH_SIZE,
+	             ASYM_TRACE_FLUSH_INTERVAL, ASYM_TRACE_QUEUE_SIZE and
+	             ASYM_TRACE_QUEUE_TIMEOUT configure it, see BatchWriter.
+	             Entries still queued when the process exits are saved
+	             before it does.
+	
+	Which requests are saved is decided by ASYM_TRACE_SAMPLE:
+	
+	'all'        (default) every request
+	'slow'       requests that took at least ASYM_TRACE_SLOW_THRESHOLD seconds
+	'errors'     only requests that logged an error
+	
+	Requests that logged an error are always saved. Of the other requests
+	that are picked, only a ASYM_TRACE_SAMPLE_RATE fraction (default 1.0) are.
+	"""
+	def __init__(self, write_mode = None):
+		self._local = threading.local()
+		self._writer_lock = threading.Lock()
+		self._write_mode = write_mode
+		self.writer = None
 		super(DBTraceHandler, self).__init__()
 	
+	# The request and its records are kept per thread, since the handler is
+	# shared by all the threads serving requests
+	
+	@property
+	def django_request(self):
+		return getattr(self._local, 'django_request', None)
+	
+	@django_request.setter
+	def django_request(self, request):
+		self._local.django_request = request
+		self._local.started = time.time()
+		self._local.rows = []
+	
+	@property
+	def rows(self):
+		rows = getattr(self._local, 'rows', None)
+		if rows is None:
+			rows = self._local.rows = []
+		return rows
+	
+	@rows.setter
+	def rows(self, rows):
+		self._local.rows = rows
+	
+	@property
+	def write_mode(self):
+		from django.conf import settings
+		
+		default_mode = 'sync' if getattr(settings, 'IS_IN_TEST', False) else 'background'
+		write_mode = self._write_mode or getattr(settings, 'ASYM_TRACE_WRITE_MODE', default_mode)
+		assert write_mode in WRITE_MODES, "ASYM_TRACE_WRITE_MODE must be one of {}".format(', '.join(WRITE_MODES))
+		return write_mode
+	
+	def get_writer(self):
+		if self.writer is None:
+			with self._writer_lock:
+				if self.writer is None:
+					from django.conf import settings
+					
+					self.writer = BatchWriter(
+						write_trace_entries,
+						batch_size = getattr(settings, 'ASYM_TRACE_BATCH_SIZE', 100),
+						flush_interval = getattr(settings, 'ASYM_TRACE_FLUSH_INTERVAL', 1.0),
+						max_queue_size = getattr(settings, 'ASYM_TRACE_QUEUE_SIZE', 1000),
+						put_timeout = getattr(settings, 'ASYM_TRACE_QUEUE_TIMEOUT', 0.5),
+						on_error = reset_db_connection,
+						stop_at_exit = True,
+						name = 'TraceWriter',
+					)
+		return self.writer
+	
 	def _get_safe_dict(self, d, *extra_rxs):
 		new_dict = {}
-		sensitive_rxs = ['pass', 'password', 'key'] + list(extra_rxs)
-		rx = re.compile(r'|'.join(re.escape(r) for r in sensitive_rxs), re.I)
+		rx = SENSITIVE_KEY_RX
+		if extra_rxs:
+			rx = re.compile(r'|'.join(re.escape(r) for r in SENSITIVE_KEYS + list(extra_rxs)), re.I)
 		
 		for k, v in d.items():
 			new_dict[k] = v
@@ -43,35 +160,52 @@ class DBTraceHandler(logging.Handler):
 	
 		return new_dict
 	
-	def _get_request_dict_string(self, key, dict_process = None):
+	def _get_request_dict(self, key, dict_process = None):
 		d = getattr(self.django_request, key, {})
 		if dict_process is not None:
 			d = dict_process(d)
-		safe_d = self._get_safe_dict(d)
-		return force_str(pformat(safe_d))
+		return self._get_safe_dict(d)
+	
+	def _get_request_dict_string(self, key, dict_process = None):
+		return force_str(pformat(self._get_request_dict(key, dict_process)))
 	
 	def _trim_meta_dict(self, d):
 		new_dict = {}
 		
-		rx = re.compile(r'^(HTTP|CONTENT|SERVER|REMOTE).*')
-		
 		for k, v in d.items():
-			if rx.match(k) is not None:
+			if META_KEY_RX.match(k) is not None:
 				new_dict[k] = v
 		
 		return new_dict
 	
+	def _is_sampled(self, has_error):
+		from django.conf import settings
+		
+		if has_error:
+			return True
+		
+		sample = getattr(settings, 'ASYM_TRACE_SAMPLE', 'all')
+		assert sample in SAMPLE_MODES, "ASYM_TRACE_SAMPLE must be one of {}".format(', '.join(SAMPLE_MODES))
+		
+		if sample == 'errors':
+			return False
+		
+		if sample == 'slow':
+			duration = time.time() - getattr(self._local, 'started', time.time())
+			if duration < getattr(settings, 'ASYM_TRACE_SLOW_THRESHOLD', 1.0):
+				return False
+		
+		rate = getattr(settings, 'ASYM_TRACE_SAMPLE_RATE', 1.0)
+		return rate >= 1 or random.random() < rate
+	
 	def emit(self, record):
 		if self.django_request is None:
 			return
 		self.rows.append(DBTraceLogGenerator(self.django_request, record).generate())
 	
 	def flush(self):
-		from django.db import connection
-		from django.db.utils import DatabaseError
-		from asymmetricbase.models import TraceEntry
+		rows, self.rows = self.rows, []
 		
-		msg = u''
 		url_path = getattr(self.django_request, 'path', '')
 		request_method = getattr(self.django_request, 'method', 'REQUEST')
 		
@@ -79,37 +213,56 @@ class DBTraceHandler(logging.Handler):
 			# Ignore static files in DEBUG
 			return
 		
-		entry = TraceEntry(get = url_path, method = request_method)
-		
-		entry.request_meta = self._get_request_dict_string('META', dict_process = self._trim_meta_dict)
-		entry.request_data = self._get_request_dict_string(request_method if request_method in ['POST', 'GET'] else 'REQUEST')
-		
-		user = getattr(self.django_request, 'user', None)
-		
-		if user:
-			entry.user = u'{} {}'.format(getattr(user, 'id', '0'), getattr(user, 'username', 'anonymous'))
-		else:
-			entry.user = '0 None'
-		
-		for row in self.rows:
+		msg = u''
+		exc_info = ''
+		has_error = False
+		for row in rows:
 			msg_row = u'''[{level}] {file_name}:{lineno} {msg}\n'''
 			
 			if row['exc_info']:
-				entry.exc_info = row['exc_info']
+				exc_info = row['exc_info']
+			if row['exc_info'] or row['level'] in ERROR_LEVELS:
+				has_error = True
 			
 			msg += msg_row.format(**row)
 		
-		if len(msg) > 1:
-			entry.msg = msg
-			try:
-				# "current transaction is aborted, commands ignored until end of transaction block"
-				# If there is a database error before this point, then this
-				# insert may fail because we may still be inside a transaction
-				# block. So, we rollback and allow the code to continue. 
-				entry.save()
-			except DatabaseError:
-				connection._rollback()
-		self.rows = []
+		if len(msg) <= 1 or not self._is_sampled(has_error):
+			return
+		
+		user = getattr(self.django_request, 'user', None)
+		
+		# Only plain data is kept, so that nothing refers to the request once
+		# it is over. The dicts are formatted by whoever saves the entry.
+		data = {
+			'get' : url_path,
+			'method' : request_method,
+			'user' : u'{} {}'.format(getattr(user, 'id', '0'), getattr(user, 'username', 'anonymous')) if user else '0 None',
+			'msg' : msg,
+			'exc_info' : force_text(exc_info),
+			'request_meta' : self._get_request_dict('META', dict_process = self._trim_meta_dict),
+			'request_data' : self._get_request_dict(request_method if request_method in ['POST', 'GET'] else 'REQUEST'),
+		}
+		
+		if self.write_mode == 'background':
+			self.get_writer().put(data)
+			return
+		
+		from django.db import connection
+		from django.db.utils import DatabaseError
+		
+		try:
+			# "current transaction is aborted, commands ignored until end of transaction block"
+			# If there is a database error before this point, then this
+			# insert may fail because we may still be inside a transaction
+			# block. So, we rollback and allow the code to continue. 
+			build_trace_entry(data).save()
+		except DatabaseError:
+			connection._rollback()
+	
+	def close(self):
+		if self.writer is not None:
+			self.writer.stop()
+		super(DBTraceHandler, self).close()
 		
 class DBTraceLogGenerator(object):
 	def __init__(self, request, record):
@@ -121,6 +274,7 @@ class DBTraceLogGenerator(object):
 			'file_name' : self.record.pathname,
 			'lineno' : self.record.lineno,
 			'level' : {CRITICAL : 'C', DEBUG : 'D', ERROR : 'E', FATAL : 'F', INFO : 'I', WARN : 'W'}.get(self.record.levelno, 'I'),
-			'msg' : self.record.msg,
+			# formatted, as the views log with %-style arguments
+			'msg' : self.record.getMessage(),
 			'exc_info' : self.record.exc_info,
 		}
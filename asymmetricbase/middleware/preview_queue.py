@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+#    Asymmetric Base Framework - A collection of utilities for django frameworks
+#    Copyright (C) 2013  Asymmetric Ventures Inc.
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; version 2 of the License.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import threading
+
+from django.db import transaction
+
+# Tasks held back until the current request's transaction is committed
+_local = threading.local()
+
+def submit_after_commit(pool, func, *args, **kwargs):
+	"""
+	Submits func to `pool` once the current request's transaction has been
+	committed, so the task can see the rows the request wrote. Outside of a
+	request, or when nothing is holding a transaction open, or when the pool
+	runs tasks in the calling thread, the task is submitted straight away.
+	"""
+	pending = getattr(_local, 'pending', None)
+	if pending is None or not pool.background or not transaction.is_managed():
+		pool.submit(func, *args, **kwargs)
+	else:
+		pending.append((pool, func, args, kwargs))
+
+class PreviewQueueMiddleware(object):
+	"""
+	Submits the tasks given to submit_after_commit() during a request once
+	the response is ready, and drops them if the view raised.
+	
+	It must come before TransactionMiddleware in MIDDLEWARE_CLASSES, so that
+	its process_response runs after the transaction has been committed.
+	"""
+	def process_request(self, request):
+		_local.pending = []
+	
+	def process_response(self, request, response):
+		pending = getattr(_local, 'pending', None)
+		_local.pending = None
+		for pool, func, args, kwargs in pending or ():
+			pool.submit(func, *args, **kwargs)
+		return response
+	
+	def process_exception(self, request, exception):
+		_local.pending = None
@@ -1,107 +1,121 @@
 # No license given.
 # Modified from:http://stackoverflow.com/questions/3151469/per-request-cache-in-django
 
-from threading import currentThread
-import time
+from __future__ import absolute_import, division, print_function, unicode_literals
 
-from django.core.cache.backends.locmem import LocMemCache
+from collections import OrderedDict
+import threading
 
-_request_cache = {}
+from django.conf import settings
+
+_MISSING = object()
+
+# Holds the current request's cache. When gevent or eventlet patch threading,
+# this is local to the greenlet instead.
+_local = threading.local()
 _installed_middleware = False
 
 def get_request_cache():
 	assert _installed_middleware, 'RequestCacheMiddleware not loaded'
-	return _request_cache[currentThread()]
+	cache = getattr(_local, 'cache', None)
+	assert cache is not None, 'get_request_cache() called outside of a request'
+	return cache
 
-# LocMemCache is a threadsafe local memory cache
-class RequestCache(LocMemCache):
-	def __init__(self):
-		name = 'locmemcache@%i' % hash(currentThread())
-		params = dict()
-		super(RequestCache, self).__init__(name, params)
+class RequestCache(object):
+	"""
+	A cache that lives for a single request.
+	
+	It only ever gets used by the thread handling the request, so it is a
+	plain least recently used dict without locks or expiry. It keeps at most
+	ASYM_REQUEST_CACHE_MAX_ENTRIES entries. The methods take the same arguments
+	as django's cache backends, so it can be used in place of one, but timeouts
+	are ignored.
+	"""
+	
+	def __init__(self, max_entries = None):
+		if max_entries is None:
+			max_entries = getattr(settings, 'ASYM_REQUEST_CACHE_MAX_ENTRIES', 1000)
+		self.max_entries = max_entries
+		self.hits = 0
+		self.misses = 0
+		self._data = OrderedDict()
 	
-	def add(self, key, value, timeout = None, version = None):
-		key = self.make_key(key, version = version)
-		self.validate_key(key)
-		with self._lock.writer():
-			exp = self._expire_info.get(key)
-			if exp is None or exp <= time.time():
-				try:
-					self._set(key, value, timeout)
-					return True
-				except Exception:
-					pass
-			return False
-
 	def get(self, key, default = None, version = None):
-		key = self.make_key(key, version = version)
-		self.validate_key(key)
-		with self._lock.reader():
-			exp = self._expire_info.get(key)
-			if exp is None:
-				return default
-			elif exp > time.time():
-				try:
-					return self._cache[key]
-				except Exception:
-					return default
-		with self._lock.writer():
-			try:
-				del self._cache[key]
-				del self._expire_info[key]
-			except KeyError:
-				pass
+		value = self._data.pop(key, _MISSING)
+		if value is _MISSING:
+			self.misses += 1
 			return default
-
-	def _set(self, key, value, timeout = None):
-		if len(self._cache) >= self._max_entries:
-			self._cull()
-		if timeout is None:
-			timeout = self.default_timeout
-		self._cache[key] = value
-		self._expire_info[key] = time.time() + timeout
-
+		
+		# re-insert to mark it as the most recently used
+		self._data[key] = value
+		self.hits += 1
+		return value
+	
 	def set(self, key, value, timeout = None, version = None):
-		key = self.make_key(key, version = version)
-		self.validate_key(key)
-		with self._lock.writer():
-			self._set(key, value, timeout)
-
+		self._data.pop(key, None)
+		self._data[key] = value
+		while len(self._data) > self.max_entries:
+			self._data.popitem(last = False)
+	
+	def add(self, key, value, timeout = None, version = None):
+		if key in self._data:
+			return False
+		self.set(key, value)
+		return True
+	
+	def delete(self, key, version = None):
+		self._data.pop(key, None)
+	
+	def has_key(self, key, version = None):
+		return key in self._data
+	
+	__contains__ = has_key
+	
 	def incr(self, key, delta = 1, version = None):
-		value = self.get(key, version = version)
-		if value is None:
+		value = self._data.get(key, _MISSING)
+		if value is _MISSING:
 			raise ValueError("Key '%s' not found" % key)
-		new_value = value + delta
-		key = self.make_key(key, version = version)
-		with self._lock.writer():
-			self._cache[key] = new_value
-		return new_value
-
-	def has_key(self, key, version = None):
-		key = self.make_key(key, version = version)
-		self.validate_key(key)
-		with self._lock.reader():
-			exp = self._expire_info.get(key)
-			if exp is None:
-				return False
-			elif exp > time.time():
-				return True
-
-		with self._lock.writer():
-			try:
-				del self._cache[key]
-				del self._expire_info[key]
-			except KeyError:
-				pass
-			return False
+		self._data[key] = value + delta
+		return value + delta
+	
+	def clear(self):
+		self._data.clear()
+	
+	def __len__(self):
+		return len(self._data)
 
 class RequestCacheMiddleware(object):
+	"""
+	Gives each request a fresh RequestCache (see get_request_cache()) and
+	drops it when the request is done. For streaming responses the cache is
+	kept until the content has been sent.
+	"""
 	def __init__(self):
 		global _installed_middleware
 		_installed_middleware = True
-
+	
 	def process_request(self, request):
-		cache = _request_cache.get(currentThread()) or RequestCache()
-		_request_cache[currentThread()] = cache
-		
-		cache.clear()
+		_local.cache = RequestCache()
+	
+	def process_response(self, request, response):
+		cache = getattr(_local, 'cache', None)
+		if cache is not None and getattr(response, 'streaming', False):
+			response.streaming_content = self._drop_after(response.streaming_content, cache)
+		else:
+			self._drop(cache)
+		return response
+	
+	def process_exception(self, request, exception):
+		self._drop(getattr(_local, 'cache', None))
+	
+	def _drop_after(self, content, cache):
+		try:
+			for chunk in content:
+				yield chunk
+		finally:
+			self._drop(cache)
+	
+	@staticmethod
+	def _drop(cache):
+		if cache is not None and getattr(_local, 'cache', None) is cache:
+			del _local.cache
@@ -28,3 +28,17 @@ class AddRequestToLoggerMiddleware(object):
 		for l in (logger, audit_logger, line_logger):
 			for handler in l.handlers:
 				setattr(handler, 'django_request', request)
+	
+	def process_response(self, request, response):
+		self._flush_audit_handlers()
+		return response
+	
+	def process_exception(self, request, exception):
+		self._flush_audit_handlers()
+		return None
+	
+	def _flush_audit_handlers(self):
+		# Audit handlers buffer their entries for the length of the request
+		# (see AuditLoggingHandler), write them out now
+		for handler in audit_logger.handlers:
+			handler.flush()
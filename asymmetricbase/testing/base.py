@@ -22,6 +22,8 @@ from django.conf import settings
 
 from asymmetricbase.views.mixins.merge_attr import MergeAttrMixin
 from asymmetricbase.testing.model_initializer import install_initializers
+from asymmetricbase._models.roles import role_registry
+from asymmetricbase.utils.cached_function import clear_all_caches
 from django.test.testcases import assert_and_parse_html
 
 class BaseTestCase(TestCase, MergeAttrMixin):
@@ -39,6 +41,10 @@ class BaseTestCase(TestCase, MergeAttrMixin):
 	def _fixture_setup(self):
 		super(BaseTestCase, self)._fixture_setup()
 		
+		# rolled back rows don't send signals, so start each test with empty caches
+		role_registry.clear()
+		clear_all_caches()
+		
 		all_initializers = self.pre_initalizers + self._get_inherited_initializers()
 		
 		self.initialized_instances = install_initializers(all_initializers)
@@ -23,11 +23,46 @@ from .formset_factory_tests import FormsetFactoryFactoryTests
 from .enumfield import EnumFieldTests
 from .cached_function import TestCachedFunction
 from .s3_file import TestS3File, TestS3FileWithPreview
+from .batchwriter import TestBatchWriter
+from .s3_storage import TestFileSystemS3Storage
+from .permission_cache import TestPermissionCache
+from .tiered_cache import TestTieredCache
+from .streaming_response import TestStreamingJinjaTemplateResponse
+from .preview_queue import TestPreviewQueueMiddleware
+from .audit_logging import TestAuditLogging
+from .trace_handler import TestDBTraceHandler
+from .caching import TestCached
+from .roles import TestRoles
+from .table_display import TestSimpleTableDisplay
+from .audited_queryset import TestAuditedQuerySet
+from .merge_attr import TestMergeAttr
+from .macro_index import TestMacroIndex
+from .form_factory import TestFormFactory, TestLazyForms
+from .request_trace import TestRequestTrace
+from .request_cache import TestRequestCache
 
 def suite():
 	return build_test_suite_from((
 		FormsetFactoryFactoryTests,
 		EnumFieldTests,
 		TestCachedFunction,
-		TestS3File
+		TestS3File,
+		TestBatchWriter,
+		TestFileSystemS3Storage,
+		TestPermissionCache,
+		TestTieredCache,
+		TestStreamingJinjaTemplateResponse,
+		TestPreviewQueueMiddleware,
+		TestAuditLogging,
+		TestDBTraceHandler,
+		TestCached,
+		TestRoles,
+		TestSimpleTableDisplay,
+		TestAuditedQuerySet,
+		TestMergeAttr,
+		TestMacroIndex,
+		TestFormFactory,
+		TestLazyForms,
+		TestRequestTrace,
+		TestRequestCache,
 	))
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+#    Asymmetric Base Framework - A collection of utilities for django frameworks
+#    Copyright (C) 2013  Asymmetric Ventures Inc.
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; version 2 of the License.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import logging
+
+from asymmetricbase.logging import unwrap_logger, audit_logger
+
+class LogCapture(logging.Handler):
+	"""
+	Collects the records sent to one of the lazy loggers, at `level` and
+	above, while it is installed:
+	
+	> with LogCapture(logger, logging.DEBUG) as capture:
+	>     ...
+	> capture.records
+	"""
+	def __init__(self, lazy_logger, level):
+		super(LogCapture, self).__init__(level)
+		self.records = []
+		self.logger = unwrap_logger(lazy_logger)
+	
+	def emit(self, record):
+		self.records.append(record)
+	
+	def install(self):
+		self.level_before = self.logger.level
+		self.logger.setLevel(self.level)
+		self.logger.addHandler(self)
+		return self
+	
+	def uninstall(self):
+		self.logger.removeHandler(self)
+		self.logger.setLevel(self.level_before)
+	
+	def __enter__(self):
+		return self.install()
+	
+	def __exit__(self, *exc_info):
+		self.uninstall()
+
+class AuditCapture(LogCapture):
+	""" Collects the records sent to the audit logger """
+	def __init__(self):
+		super(AuditCapture, self).__init__(audit_logger, logging.INFO)
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+#    Asymmetric Base Framework - A collection of utilities for django frameworks
+#    Copyright (C) 2013  Asymmetric Ventures Inc.
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; version 2 of the License.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import logging
+import threading
+
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+
+from asymmetricbase.logging.audit import AuditLogGenerator, AuditLoggingHandler, write_audit_entries
+from asymmetricbase.models import AccessType, LogEntryType, AuditEntry, ObjectContent
+from asymmetricbase.testing.base import BaseTestCase
+
+def make_record(message = 'viewed'):
+	record = logging.LogRecord('audit', logging.INFO, __file__, 0, message, (), None)
+	record.access_type = AccessType.OTHER
+	record.log_type = LogEntryType.VIEW
+	record.view_name = 'test_view'
+	record.success = True
+	return record
+
+class TestAuditLogging(BaseTestCase):
+	
+	def setUp(self):
+		self.request = RequestFactory().get('/', REMOTE_ADDR = '10.0.0.1')
+	
+	@override_settings(IS_IN_TEST = False, ASYM_AUDIT_ENABLED = True, LOG_MODEL_ACCESS_READ = False)
+	def test_build_uses_the_request(self):
+		audit_entry, content_in_json = AuditLogGenerator(self.request, make_record()).build()
+		
+		self.assertEqual(audit_entry.ip, '10.0.0.1')
+		self.assertEqual(audit_entry.view_name, 'test_view')
+		self.assertEqual(audit_entry.message, 'viewed')
+		self.assertIsNone(audit_entry.pk)
+		self.assertIsNone(content_in_json)
+	
+	@override_settings(IS_IN_TEST = False, ASYM_AUDIT_ENABLED = True, LOG_MODEL_ACCESS_READ = False)
+	def test_build_without_request(self):
+		self.assertIsNone(AuditLogGenerator(None, make_record()).build())
+	
+	def test_build_in_tests(self):
+		self.assertIsNone(AuditLogGenerator(self.request, make_record()).build())
+	
+	@override_settings(IS_IN_TEST = False, LOG_MODEL_ACCESS_READ = False)
+	def test_build_needs_audit_enabled(self):
+		self.assertIsNone(AuditLogGenerator(self.request, make_record()).build())
+	
+	@override_settings(IS_IN_TEST = False, ASYM_AUDIT_ENABLED = True, LOG_MODEL_ACCESS_READ = False)
+	def test_buffer_is_per_thread(self):
+		handler = AuditLoggingHandler(write_mode = 'request', batch_size = 100)
+		handler.django_request = self.request
+		handler.emit(make_record())
+		
+		seen = []
+		def other_thread():
+			seen.append((handler.django_request, len(handler.buffer)))
+		thread = threading.Thread(target = other_thread)
+		thread.start()
+		thread.join()
+		
+		self.assertEqual(seen, [(None, 0)])
+		self.assertEqual(len(handler.buffer), 1)
+	
+	def test_write_audit_entries(self):
+		entries = [
+			(AuditEntry(ip = '10.0.0.1', message = 'a'), '["first"]'),
+			(AuditEntry(ip = '10.0.0.1', message = 'b'), '["second"]'),
+			(AuditEntry(ip = '10.0.0.1', message = 'c'), '["first"]'),
+			(AuditEntry(ip = '10.0.0.1', message = 'd'), None),
+		]
+		object_content_count = ObjectContent.objects.count()
+		
+		write_audit_entries(entries)
+		
+		self.assertEqual(ObjectContent.objects.count(), object_content_count + 2)
+		saved = dict(
+			(audit_entry.message, audit_entry.object_content.content_in_json if audit_entry.object_content_id else None)
+			for audit_entry in AuditEntry.objects.filter(message__in = ['a', 'b', 'c', 'd']).select_related('object_content')
+		)
+		self.assertEqual(saved, {'a' : '["first"]', 'b' : '["second"]', 'c' : '["first"]', 'd' : None})
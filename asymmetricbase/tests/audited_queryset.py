@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+#    Asymmetric Base Framework - A collection of utilities for django frameworks
+#    Copyright (C) 2013  Asymmetric Ventures Inc.
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; version 2 of the License.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from django.test.utils import override_settings
+
+from asymmetricbase.models import AccessType
+from asymmetricbase._models.base import _format_id_ranges
+from asymmetricbase.testing.base_with_models import BaseTestCaseWithModels
+from asymmetricbase.tests.audit_capture import AuditCapture
+from asymmetricbase.tests.models import TestModel
+
+class TestAuditedQuerySet(BaseTestCaseWithModels):
+	
+	def setUp(self):
+		self.objects = [TestModel.objects.create(field1 = i, field2 = 'audited') for i in range(5)]
+	
+	def _read_records(self, capture):
+		return [record for record in capture.records if record.access_type == AccessType.READ]
+	
+	def test_format_id_ranges(self):
+		self.assertEqual(_format_id_ranges([8, 1, 2, 3, 5, 7]), '1-3, 5, 7-8')
+		self.assertEqual(_format_id_ranges([]), '')
+		self.assertEqual(_format_id_ranges(['b', 'a', 'c']), 'a, b, c')
+		self.assertEqual(_format_id_ranges([1, 'a']), '1, a')
+	
+	@override_settings(LOG_MODEL_ACCESS_READ = True, ASYM_AUDIT_READ_MODE = 'queryset')
+	def test_one_entry_per_queryset(self):
+		with AuditCapture() as capture:
+			loaded = list(TestModel.objects.filter(field2 = 'audited').order_by('id'))
+		
+		self.assertEqual(len(loaded), 5)
+		records = self._read_records(capture)
+		self.assertEqual(len(records), 1)
+		self.assertEqual(records[0].model_name, 'TestModel')
+		self.assertIn('5 TestModel objects', records[0].msg)
+		self.assertIn('({})'.format(_format_id_ranges([obj.pk for obj in self.objects])), records[0].msg)
+	
+	@override_settings(LOG_MODEL_ACCESS_READ = True, ASYM_AUDIT_READ_MODE = 'queryset', ASYM_AUDIT_READ_CHUNK_SIZE = 2)
+	def test_partial_iteration_is_logged_straight_away(self):
+		with AuditCapture() as capture:
+			objects = TestModel.objects.filter(field2 = 'audited').order_by('id').iterator()
+			next(objects)
+			
+			records = self._read_records(capture)
+			self.assertEqual(len(records), 1)
+			self.assertIn('2 TestModel objects', records[0].msg)
+			
+			list(objects)
+		
+		self.assertEqual(len(self._read_records(capture)), 3)
+	
+	@override_settings(LOG_MODEL_ACCESS_READ = True, ASYM_AUDIT_READ_MODE = 'instance')
+	def test_instance_mode(self):
+		with AuditCapture() as capture:
+			list(TestModel.objects.filter(field2 = 'audited'))
+		
+		records = self._read_records(capture)
+		self.assertEqual(len(records), 5)
+		self.assertTrue(all(record.model in self.objects for record in records))
+	
+	@override_settings(LOG_MODEL_ACCESS_READ = False, ASYM_AUDIT_READ_MODE = 'queryset')
+	def test_reads_not_logged(self):
+		with AuditCapture() as capture:
+			list(TestModel.objects.filter(field2 = 'audited'))
+		
+		self.assertEqual(self._read_records(capture), [])
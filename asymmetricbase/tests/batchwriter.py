@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+#    Asymmetric Base Framework - A collection of utilities for django frameworks
+#    Copyright (C) 2013  Asymmetric Ventures Inc.
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; version 2 of the License.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import threading
+import unittest
+
+from asymmetricbase.logging.batchwriter import BatchWriter
+
+class TestBatchWriter(unittest.TestCase):
+	
+	def test_batches_are_written_in_order(self):
+		batches = []
+		writer = BatchWriter(batches.append, batch_size = 10, flush_interval = 0.5, max_queue_size = 100)
+		
+		for i in range(25):
+			writer.put(i)
+		writer.stop()
+		
+		self.assertEqual([item for batch in batches for item in batch], list(range(25)))
+		self.assertTrue(all(len(batch) <= 10 for batch in batches))
+	
+	def test_full_queue_writes_in_calling_thread(self):
+		batches = []
+		writer = BatchWriter(batches.append, batch_size = 1000, flush_interval = 60, max_queue_size = 1, put_timeout = 0.01)
+		
+		for i in range(5):
+			writer.put(i)
+		writer.stop()
+		
+		self.assertEqual(sorted(item for batch in batches for item in batch), list(range(5)))
+	
+	def test_synchronous_writer(self):
+		batches = []
+		writer = BatchWriter(batches.append, background = False)
+		
+		writer.put('a')
+		
+		self.assertEqual(batches, [['a']])
+	
+	def test_on_error_runs_in_the_writer_thread(self):
+		threads = []
+		def fail(batch):
+			raise ValueError(batch)
+		writer = BatchWriter(fail, on_error = lambda: threads.append(threading.current_thread()))
+		
+		writer.put('a')
+		writer.stop()
+		
+		self.assertEqual(len(threads), 1)
+		self.assertNotEqual(threads[0], threading.current_thread())
@@ -19,7 +19,7 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 import unittest
 
-from asymmetricbase.utils.cached_function import cached_function
+from asymmetricbase.utils.cached_function import cached_function, memoize
 
 class TestCachedFunction(unittest.TestCase):
 	
@@ -35,3 +35,57 @@ class TestCachedFunction(unittest.TestCase):
 		self.assertEqual(self.outer_var, 101)
 		self.assertEqual(method_to_test(), 42)
 		self.assertEqual(self.outer_var, 101)
+		
+		method_to_test.cache_clear()
+		self.assertEqual(method_to_test(), 42)
+		self.assertEqual(self.outer_var, 102)
+	
+	def test_memoize(self):
+		calls = []
+		
+		@memoize(max_size = 2)
+		def method_to_test(x, y = 0):
+			calls.append((x, y))
+			return x + y
+		
+		self.assertEqual(method_to_test(1), 1)
+		self.assertEqual(method_to_test(1), 1)
+		self.assertEqual(method_to_test(1, y = 2), 3)
+		self.assertEqual(calls, [(1, 0), (1, 2)])
+		
+		method_to_test.invalidate(1)
+		self.assertEqual(method_to_test(1), 1)
+		self.assertEqual(calls, [(1, 0), (1, 2), (1, 0)])
+		
+		# the least recently used result, for (1, 2), is dropped
+		method_to_test(2)
+		method_to_test(1, y = 2)
+		self.assertEqual(len(calls), 5)
+		self.assertEqual(method_to_test.cache_info().hits, 1)
+	
+	def test_memoize_unhashable_arguments_bypass_the_cache(self):
+		calls = []
+		
+		@memoize()
+		def method_to_test(items):
+			calls.append(items)
+			return len(items)
+		
+		self.assertEqual(method_to_test([1, 2]), 2)
+		self.assertEqual(method_to_test([1, 2]), 2)
+		self.assertEqual(len(calls), 2)
+		self.assertEqual(method_to_test.cache_info().size, 0)
+		
+		# nothing to forget, but it mustn't fail either
+		method_to_test.invalidate([1, 2])
+	
+	def test_memoize_releases_the_key_lock_when_the_function_raises(self):
+		@memoize()
+		def method_to_test(x):
+			raise ValueError(x)
+		
+		self.assertRaises(ValueError, method_to_test, 1)
+		self.assertRaises(ValueError, method_to_test, 1)
+		
+		memo = method_to_test.cache_info.__self__
+		self.assertEqual(memo._key_locks, {})
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+#    Asymmetric Base Framework - A collection of utilities for django frameworks
+#    Copyright (C) 2013  Asymmetric Ventures Inc.
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; version 2 of the License.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import unittest
+
+from django.core.cache import get_cache
+
+from asymmetricbase.utils.caching import cached, make_cache_key, CACHE_KEY_VERSION, UncacheableArguments
+
+class TestCached(unittest.TestCase):
+	
+	def setUp(self):
+		self.backend = get_cache('django.core.cache.backends.locmem.LocMemCache', LOCATION = 'asym-test-cached')
+		self.backend.clear()
+		self.calls = []
+	
+	def make_function(self, **kwargs):
+		@cached(backend = self.backend, **kwargs)
+		def double(x):
+			self.calls.append(x)
+			return x * 2
+		return double
+	
+	def test_make_cache_key(self):
+		key = make_cache_key('prefix', (1, 'a'), {'b' : (2, 3)}, scope = 'user-1')
+		
+		self.assertTrue(key.startswith('{}:prefix:user-1:'.format(CACHE_KEY_VERSION)))
+		self.assertEqual(key, make_cache_key('prefix', (1, 'a'), {'b' : (2, 3)}, scope = 'user-1'))
+		self.assertNotEqual(key, make_cache_key('prefix', (1, 'a'), {'b' : (2, 4)}, scope = 'user-1'))
+		self.assertNotEqual(key, make_cache_key('prefix', (1, 'a'), {'b' : (2, 3)}, scope = 'user-2'))
+		self.assertEqual(make_cache_key('prefix'), '{}:prefix'.format(CACHE_KEY_VERSION))
+	
+	def test_make_cache_key_rejects_unstable_arguments(self):
+		self.assertRaises(UncacheableArguments, make_cache_key, 'prefix', (object(),))
+		self.assertRaises(UncacheableArguments, make_cache_key, 'prefix', ({'a' : 1},))
+	
+	def test_unstable_arguments_bypass_the_cache(self):
+		@cached(backend = self.backend)
+		def count(items):
+			self.calls.append(items)
+			return len(items)
+		
+		self.assertEqual(count({'a' : 1}), 1)
+		self.assertEqual(count({'a' : 1}), 1)
+		self.assertEqual(len(self.calls), 2)
+		
+		count.invalidate({'a' : 1})
+		self.assertEqual(count.get_many([({'a' : 1},), ((1, 2),), ((1, 2),)]), [1, 2, 2])
+		self.assertEqual(len(self.calls), 4)
+	
+	def test_methods_of_different_classes_get_different_keys(self):
+		backend = self.backend
+		
+		class Item(object):
+			def __init__(self, pk):
+				self.pk = pk
+			
+			def __repr__(self):
+				# the same for both classes
+				return 'Item({})'.format(self.pk)
+		
+		class Invoice(Item):
+			@cached(backend = backend)
+			def total(self):
+				return 'invoice'
+		
+		class Order(Item):
+			@cached(backend = backend)
+			def total(self):
+				return 'order'
+		
+		class RushOrder(Order):
+			pass
+		
+		self.assertEqual(Invoice(1).total(), 'invoice')
+		self.assertEqual(Order(1).total(), 'order')
+		self.assertIn('.Order.total:', Order.total.make_key(Order(1)))
+		self.assertIn('.Order.total:', Order.total.make_key(RushOrder(1)))
+	
+	def test_results_are_cached(self):
+		double = self.make_function()
+		
+		self.assertEqual(double(2), 4)
+		self.assertEqual(double(2), 4)
+		self.assertEqual(self.calls, [2])
+		
+		double.invalidate(2)
+		self.assertEqual(double(2), 4)
+		self.assertEqual(self.calls, [2, 2])
+	
+	def test_stale_result_is_served_while_refreshing(self):
+		double = self.make_function(timeout = -1, stale_timeout = 60)
+		
+		self.assertEqual(double(2), 4)
+		
+		# another caller is refreshing the stale result already
+		self.backend.add('{}:refreshing'.format(double.make_key(2)), True)
+		self.assertEqual(double(2), 4)
+		self.assertEqual(self.calls, [2])
+		
+		self.backend.delete('{}:refreshing'.format(double.make_key(2)))
+		self.assertEqual(double(2), 4)
+		self.assertEqual(self.calls, [2, 2])
+	
+	def test_get_many(self):
+		double = self.make_function()
+		double(1)
+		
+		self.assertEqual(double.get_many([1, 2, (3,), 2]), [2, 4, 6, 4])
+		self.assertEqual(self.calls, [1, 2, 3])
+		
+		self.assertEqual(double.get_many([1, 2, 3]), [2, 4, 6])
+		self.assertEqual(self.calls, [1, 2, 3])
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+#    Asymmetric Base Framework - A collection of utilities for django frameworks
+#    Copyright (C) 2013  Asymmetric Ventures Inc.
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; version 2 of the License.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from collections import OrderedDict
+
+from django.test.client import RequestFactory
+
+from asymmetricbase import forms
+from asymmetricbase.forms.form_factory import FormFactory, LazyForm
+from asymmetricbase.testing.base_with_models import BaseTestCaseWithModels
+from asymmetricbase.tests.models import TestModel
+from asymmetricbase.views.base import AsymBaseView
+
+class TestForm(forms.Form):
+	field1 = forms.IntegerField()
+
+class TestModelForm(forms.ModelForm):
+	class Meta(object):
+		model = TestModel
+
+class FormsView(AsymBaseView):
+	form_info = OrderedDict((
+		('child', FormFactory(TestForm, parents = ['parent'])),
+		('parent', FormFactory(TestForm)),
+		('other', FormFactory(TestForm)),
+	))
+
+# The names of the forms LazyFormsView has created, in order
+created_forms = []
+
+def _created(form_name):
+	return lambda form: created_forms.append(form_name)
+
+class LazyFormsView(AsymBaseView):
+	form_info = OrderedDict((
+		('child', FormFactory(TestForm, parents = ['parent'], init_callbacks = [_created('child')])),
+		('parent', FormFactory(TestForm, init_callbacks = [_created('parent')])),
+		('eager', FormFactory(TestForm, eager = True, init_callbacks = [_created('eager')])),
+		('with_callback', FormFactory(TestForm, callbacks = [lambda form, is_valid: None], init_callbacks = [_created('with_callback')])),
+	))
+
+class TestFormFactory(BaseTestCaseWithModels):
+	
+	def test_copy(self):
+		instance = TestModel.objects.create(field1 = 1, field2 = 'instance')
+		factory = FormFactory(TestModelForm, initial = {'field2' : 'initial'})
+		factory.instance = instance
+		factory.data = {'field1' : '2'}
+		queryset_factory = FormFactory(TestForm, TestModel.objects.all())
+		
+		copied = factory.copy()
+		self.assertIsNot(copied.instance, instance)
+		self.assertIsNot(copied.instance._state, instance._state)
+		self.assertEqual(copied.instance.pk, instance.pk)
+		
+		copied.data['field2'] = 'changed'
+		copied.kwargs['initial']['field2'] = 'changed'
+		copied.callbacks.append(lambda form, is_valid: None)
+		copied.parents.add('parent')
+		self.assertEqual(factory.data, {'field1' : '2'})
+		self.assertEqual(factory.kwargs, {'initial' : {'field2' : 'initial'}})
+		self.assertEqual(factory.callbacks, [])
+		self.assertEqual(factory.parents, set())
+		
+		# querysets are cloned, so their results aren't cached across requests
+		queryset = queryset_factory.args[0]
+		list(queryset)
+		copied_queryset = queryset_factory.copy().args[0]
+		self.assertIsNot(copied_queryset, queryset)
+		self.assertIsNone(copied_queryset._result_cache)
+	
+	def test_calling_a_copy_leaves_the_factory_alone(self):
+		factory = FormFactory(TestModelForm, initial = {'field2' : 'initial'})
+		
+		form = factory.copy()(RequestFactory().post('/', {'field1' : '1', 'field2' : 'posted'}))
+		
+		self.assertTrue(form.is_valid())
+		self.assertEqual(factory.args, ())
+		self.assertEqual(factory.kwargs, {'initial' : {'field2' : 'initial'}})
+		self.assertFalse(hasattr(factory, 'form_instance'))
+	
+	def test_form_plan(self):
+		form_info = FormsView._get_merged_attr('form_info')
+		plan = FormsView._get_form_plan(form_info)
+		
+		self.assertEqual(list(plan), ['parent', 'other', 'child'])
+		self.assertEqual(plan['parent'], (set(), set(['child'])))
+		self.assertEqual(plan['child'], (set(['parent']), set()))
+		
+		# worked out once per class and form_info
+		self.assertIs(FormsView._get_form_plan(form_info), plan)
+		self.assertIsNot(FormsView._get_form_plan(OrderedDict(form_info)), plan)
+	
+	def test_get_form_data_copies_the_factories(self):
+		view = FormsView()
+		view.get_form_data()
+		
+		self.assertEqual(list(view.forms), ['parent', 'other', 'child'])
+		for form_name, form_data in view.forms.items():
+			self.assertIsNot(form_data, FormsView.form_info[form_name])
+		self.assertEqual(view.forms['parent'].children, set(['child']))
+		self.assertEqual(FormsView.form_info['parent'].children, set())
+
+class TestLazyForms(BaseTestCaseWithModels):
+	
+	def setUp(self):
+		created_forms[:] = []
+		self.request = RequestFactory().post('/', {'field1' : '1'})
+	
+	def load_view(self, output_type = 'html'):
+		view = LazyFormsView()
+		view.output_type = output_type
+		view.get_form_data()
+		view.load_forms(self.request)
+		return view
+	
+	def test_forms_are_created_when_used(self):
+		view = self.load_view()
+		
+		self.assertEqual(created_forms, ['eager', 'with_callback'])
+		self.assertIsInstance(view.child, LazyForm)
+		self.assertIs(view.context['child'], view.child)
+		
+		# the parent is created first
+		self.assertTrue(view.child.is_valid())
+		self.assertEqual(created_forms, ['eager', 'with_callback', 'parent', 'child'])
+		
+		self.assertTrue(view.parent)
+		self.assertEqual([field.name for field in view.parent], ['field1'])
+		self.assertEqual(view.parent['field1'].value(), '1')
+		self.assertEqual(created_forms, ['eager', 'with_callback', 'parent', 'child'])
+	
+	def test_eager_forms(self):
+		view = self.load_view()
+		
+		self.assertNotIsInstance(view.eager, LazyForm)
+		self.assertNotIsInstance(view.with_callback, LazyForm)
+		self.assertIsInstance(view.eager, TestForm)
+	
+	def test_json_output_creates_every_form(self):
+		view = self.load_view(output_type = 'json')
+		
+		self.assertEqual(sorted(created_forms), ['child', 'eager', 'parent', 'with_callback'])
+		self.assertLess(created_forms.index('parent'), created_forms.index('child'))
+		self.assertIsInstance(view.child, TestForm)
+		self.assertEqual(view.context['child']['is_valid'], True)
+
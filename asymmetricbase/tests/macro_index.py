@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+#    Asymmetric Base Framework - A collection of utilities for django frameworks
+#    Copyright (C) 2013  Asymmetric Ventures Inc.
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; version 2 of the License.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import unittest
+
+from jinja2.runtime import new_context
+
+from asymmetricbase import displaymanager as dm
+from asymmetricbase.displaymanager.base import MacroIndex
+from asymmetricbase.jinja import jinja_env
+
+VTABLE = 'asymmetricbase/displaymanager/vtable.djhtml'
+GRID_LAYOUT = 'asymmetricbase/displaymanager/grid_layout.djhtml'
+FIELDS = 'asymmetricbase/displaymanager/fields.djhtml'
+
+class IndexedDisplay(dm.Display):
+	class Meta(object):
+		template_name = (VTABLE, GRID_LAYOUT, FIELDS)
+
+class TestMacroIndex(unittest.TestCase):
+	
+	def setUp(self):
+		self.auto_reload = jinja_env.auto_reload
+	
+	def tearDown(self):
+		jinja_env.auto_reload = self.auto_reload
+	
+	def test_first_template_takes_precedence(self):
+		index = MacroIndex((VTABLE, GRID_LAYOUT, FIELDS))
+		
+		self.assertEqual(index.macros['display'], VTABLE)
+		self.assertEqual(index.macros['charfield'], FIELDS)
+		self.assertEqual(MacroIndex(VTABLE).macros, {'display' : VTABLE})
+		self.assertEqual(MacroIndex(None).macros, {})
+	
+	def test_index_is_kept_per_class(self):
+		jinja_env.auto_reload = False
+		index = IndexedDisplay._get_macro_index()
+		
+		self.assertIs(IndexedDisplay._get_macro_index(), index)
+		self.assertIsNot(dm.SimpleTableDisplay._get_macro_index(), index)
+	
+	def test_get_macro(self):
+		self.assertIs(IndexedDisplay.get_macro('charfield'), jinja_env.get_template(FIELDS).module.charfield)
+		self.assertRaises(AttributeError, IndexedDisplay.get_macro, 'not_a_macro')
+	
+	def test_changed_templates_are_noticed_with_auto_reload(self):
+		index = MacroIndex(VTABLE)
+		jinja_env.auto_reload = True
+		self.assertTrue(index.is_current())
+		
+		# as if the template had been reloaded since
+		index.templates[VTABLE] = jinja_env.from_string('')
+		self.assertTrue(index.is_current())
+		index.checked -= MacroIndex.CHECK_INTERVAL
+		self.assertFalse(index.is_current())
+		
+		jinja_env.auto_reload = False
+		index.checked -= MacroIndex.CHECK_INTERVAL
+		self.assertTrue(index.is_current())
+	
+	def test_cached_template_modules(self):
+		template = jinja_env.get_template(FIELDS)
+		self.assertIs(jinja_env.get_cached_template_module(FIELDS), template.module)
+		self.assertIs(jinja_env.get_cached_template_module(FIELDS, {}), template.module)
+		
+		# made once per render context
+		ctx = new_context(jinja_env, FIELDS, {}, {'x' : 1})
+		module = jinja_env.get_cached_template_module(FIELDS, ctx)
+		self.assertIsNot(module, template.module)
+		self.assertIs(jinja_env.get_cached_template_module(FIELDS, ctx), module)
+		self.assertIsNot(jinja_env.get_cached_template_module(FIELDS, new_context(jinja_env, FIELDS, {}, {'x' : 1})), module)
+		
+		# plain dicts aren't kept
+		self.assertIsNot(jinja_env.get_cached_template_module(FIELDS, {'x' : 1}), jinja_env.get_cached_template_module(FIELDS, {'x' : 1}))
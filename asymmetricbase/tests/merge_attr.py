@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+#    Asymmetric Base Framework - A collection of utilities for django frameworks
+#    Copyright (C) 2013  Asymmetric Ventures Inc.
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; version 2 of the License.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import unittest
+
+from asymmetricbase.views.mixins.merge_attr import MergeAttrMixin
+
+class TestMergeAttr(unittest.TestCase):
+	
+	def make_classes(self):
+		class Parent(MergeAttrMixin):
+			css_files = ['base.css']
+			form_info = {'a' : 1}
+		
+		class Child(Parent):
+			css_files = ['child.css']
+			form_info = {'b' : 2}
+		
+		return Parent, Child
+	
+	def test_merge(self):
+		Parent, Child = self.make_classes()
+		
+		self.assertEqual(list(Child._merge_attr('css_files').keys()), ['base.css', 'child.css'])
+		self.assertEqual(dict(Child._merge_attr('form_info')), {'a' : 1, 'b' : 2})
+		self.assertEqual(list(Child._merge_attr('css_files', lambda name: name.upper()).keys()), ['BASE.CSS', 'CHILD.CSS'])
+	
+	def test_merge_is_cached(self):
+		Parent, Child = self.make_classes()
+		
+		merged = Child._get_merged_attr('css_files')
+		self.assertIs(Child._get_merged_attr('css_files'), merged)
+		
+		# an inline lambda is keyed on its code, so each call gets the same one
+		merged = [Child._get_merged_attr('css_files', lambda name: name.upper()) for _ in range(2)]
+		self.assertIs(merged[0], merged[1])
+	
+	def test_merge_attr_returns_a_copy(self):
+		Parent, Child = self.make_classes()
+		
+		merged = Child._merge_attr('css_files')
+		merged['extra.css'] = True
+		
+		self.assertNotIn('extra.css', Child._merge_attr('css_files'))
+		self.assertNotIn('extra.css', Child._get_merged_attr('css_files'))
+	
+	def test_setattr_and_delattr_invalidate(self):
+		Parent, Child = self.make_classes()
+		Child._get_merged_attr('css_files')
+		
+		Parent.css_files = ['other.css']
+		self.assertEqual(list(Child._get_merged_attr('css_files').keys()), ['other.css', 'child.css'])
+		
+		del Child.css_files
+		self.assertEqual(list(Child._get_merged_attr('css_files').keys()), ['other.css'])
+	
+	def test_unhashable_defaults_are_not_cached(self):
+		Parent, Child = self.make_classes()
+		
+		def process(name, seen = []):
+			seen.append(name)
+			return name
+		
+		first = Child._get_merged_attr('css_files', process)
+		second = Child._get_merged_attr('css_files', process)
+		
+		self.assertIsNot(first, second)
+		self.assertEqual(first, second)
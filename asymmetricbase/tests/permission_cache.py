@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+#    Asymmetric Base Framework - A collection of utilities for django frameworks
+#    Copyright (C) 2013  Asymmetric Ventures Inc.
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; version 2 of the License.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import unittest
+
+from django.contrib.auth.models import Group
+
+from asymmetricbase.utils.permission_cache import get_permission_version, \
+	invalidate_permission_cache
+
+class TestPermissionCache(unittest.TestCase):
+	
+	def test_version_is_stable(self):
+		self.assertEqual(get_permission_version(), get_permission_version())
+	
+	def test_invalidate(self):
+		version = get_permission_version()
+		invalidate_permission_cache()
+		self.assertNotEqual(version, get_permission_version())
+	
+	def test_group_change_invalidates(self):
+		version = get_permission_version()
+		group = Group.objects.create(name = 'permission cache test')
+		self.assertNotEqual(version, get_permission_version())
+		
+		version = get_permission_version()
+		group.delete()
+		self.assertNotEqual(version, get_permission_version())
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+#    Asymmetric Base Framework - A collection of utilities for django frameworks
+#    Copyright (C) 2013  Asymmetric Ventures Inc.
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; version 2 of the License.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import threading
+import unittest
+
+from django.db import transaction
+from django.http import HttpResponse
+from django.test.client import RequestFactory
+
+from asymmetricbase.middleware.preview_queue import PreviewQueueMiddleware, submit_after_commit
+from asymmetricbase.utils.taskpool import TaskPool
+
+class FakePool(object):
+	def __init__(self, background = True):
+		self.background = background
+		self.submitted = []
+	
+	def submit(self, func, *args, **kwargs):
+		self.submitted.append((func, args, kwargs))
+
+class TestPreviewQueueMiddleware(unittest.TestCase):
+	
+	def setUp(self):
+		self.middleware = PreviewQueueMiddleware()
+		self.request = RequestFactory().get('/')
+		transaction.enter_transaction_management()
+		transaction.managed(True)
+	
+	def tearDown(self):
+		transaction.rollback()
+		transaction.leave_transaction_management()
+	
+	def test_tasks_are_submitted_with_the_response(self):
+		pool = FakePool()
+		self.middleware.process_request(self.request)
+		
+		submit_after_commit(pool, len, 'abc')
+		self.assertEqual(pool.submitted, [])
+		
+		self.middleware.process_response(self.request, HttpResponse())
+		self.assertEqual(pool.submitted, [(len, ('abc',), {})])
+	
+	def test_tasks_are_dropped_on_exception(self):
+		pool = FakePool()
+		self.middleware.process_request(self.request)
+		
+		submit_after_commit(pool, len, 'abc')
+		self.middleware.process_exception(self.request, ValueError())
+		self.middleware.process_response(self.request, HttpResponse())
+		
+		self.assertEqual(pool.submitted, [])
+	
+	def test_synchronous_pool_runs_straight_away(self):
+		pool = FakePool(background = False)
+		self.middleware.process_request(self.request)
+		
+		submit_after_commit(pool, len, 'abc')
+		self.assertEqual(pool.submitted, [(len, ('abc',), {})])
+		self.middleware.process_response(self.request, HttpResponse())
+	
+	def test_outside_of_a_request(self):
+		pool = FakePool()
+		
+		submit_after_commit(pool, len, 'abc')
+		self.assertEqual(pool.submitted, [(len, ('abc',), {})])
+	
+	def test_full_pool_drops_tasks(self):
+		started, release = threading.Event(), threading.Event()
+		ran = []
+		
+		def block():
+			started.set()
+			release.wait(5)
+		
+		pool = TaskPool(workers = 1, max_queue_size = 1, drop_when_full = True)
+		pool.submit(block)
+		started.wait(5)
+		
+		pool.submit(ran.append, 'queued')
+		pool.submit(ran.append, 'dropped')
+		self.assertEqual(ran, [])
+		
+		release.set()
+		pool.join()
+		pool.stop()
+		self.assertEqual(ran, ['queued'])
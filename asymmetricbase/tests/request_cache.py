@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+#    Asymmetric Base Framework - A collection of utilities for django frameworks
+#    Copyright (C) 2013  Asymmetric Ventures Inc.
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; version 2 of the License.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import unittest
+
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test.client import RequestFactory
+
+from asymmetricbase.middleware.request_cache import RequestCache, RequestCacheMiddleware, get_request_cache
+
+class TestRequestCache(unittest.TestCase):
+	
+	def setUp(self):
+		self.middleware = RequestCacheMiddleware()
+		self.request = RequestFactory().get('/')
+	
+	def test_least_recently_used_entries_are_evicted(self):
+		cache = RequestCache(max_entries = 2)
+		cache.set('a', 1)
+		cache.set('b', 2)
+		cache.get('a')
+		cache.set('c', 3)
+		
+		self.assertEqual(len(cache), 2)
+		self.assertIn('a', cache)
+		self.assertNotIn('b', cache)
+		self.assertFalse(cache.add('a', 10))
+		self.assertEqual(cache.incr('c'), 4)
+		self.assertRaises(ValueError, cache.incr, 'b')
+	
+	def test_hits_and_misses(self):
+		cache = RequestCache()
+		cache.set('a', None)
+		
+		self.assertIsNone(cache.get('a', 'default'))
+		self.assertEqual(cache.get('b', 'default'), 'default')
+		self.assertEqual((cache.hits, cache.misses), (1, 1))
+	
+	def test_cache_is_per_request(self):
+		self.middleware.process_request(self.request)
+		cache = get_request_cache()
+		cache.set('a', 1)
+		self.assertIs(get_request_cache(), cache)
+		
+		self.middleware.process_response(self.request, HttpResponse())
+		self.assertRaises(AssertionError, get_request_cache)
+		
+		self.middleware.process_request(self.request)
+		self.assertNotIn('a', get_request_cache())
+		self.middleware.process_response(self.request, HttpResponse())
+	
+	def test_cache_is_dropped_on_exception(self):
+		self.middleware.process_request(self.request)
+		self.middleware.process_exception(self.request, ValueError())
+		
+		self.assertRaises(AssertionError, get_request_cache)
+	
+	def test_cache_is_kept_while_streaming(self):
+		self.middleware.process_request(self.request)
+		cache = get_request_cache()
+		
+		def content():
+			self.assertIs(get_request_cache(), cache)
+			yield b'streamed'
+		
+		response = self.middleware.process_response(self.request, StreamingHttpResponse(content()))
+		self.assertIs(get_request_cache(), cache)
+		
+		self.assertEqual(b''.join(response.streaming_content), b'streamed')
+		self.assertRaises(AssertionError, get_request_cache)
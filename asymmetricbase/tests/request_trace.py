@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+#    Asymmetric Base Framework - A collection of utilities for django frameworks
+#    Copyright (C) 2013  Asymmetric Ventures Inc.
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; version 2 of the License.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import logging
+import unittest
+
+from django.template import Template
+from django.template.response import SimpleTemplateResponse
+from django.test.client import RequestFactory
+from django.utils.functional import SimpleLazyObject
+
+from asymmetricbase.logging import logger, unwrap_logger
+from asymmetricbase.logging.request_trace import RequestTrace, start_request_trace, get_request_trace, null_request_trace
+from asymmetricbase.tests.audit_capture import LogCapture
+from asymmetricbase.views.base import AsymBaseView
+
+class TestRequestTrace(unittest.TestCase):
+	
+	def setUp(self):
+		self.request = RequestFactory().get('/traced')
+	
+	def test_phases(self):
+		trace = RequestTrace()
+		with trace.phase('preprocess'):
+			pass
+		
+		rendering = trace.phase('render')
+		rendering.start()
+		rendering.stop()
+		# only the first stop() counts
+		rendering.stop()
+		
+		self.assertEqual([name for name, duration in trace.timings], ['preprocess', 'render'])
+		self.assertTrue(all(duration >= 0 for name, duration in trace.timings))
+	
+	def test_start_request_trace(self):
+		self.assertIs(get_request_trace(self.request), null_request_trace)
+		
+		with LogCapture(logger, logging.INFO):
+			self.assertIs(start_request_trace(self.request, unwrap_logger(logger)), null_request_trace)
+		
+		with LogCapture(logger, logging.DEBUG):
+			trace = start_request_trace(self.request, unwrap_logger(logger))
+		self.assertIsInstance(trace, RequestTrace)
+		self.assertIs(get_request_trace(self.request), trace)
+	
+	def test_log(self):
+		trace = RequestTrace()
+		trace.add('handler', 0.002)
+		
+		with LogCapture(logger, logging.DEBUG) as capture:
+			trace.log(unwrap_logger(logger), '/traced')
+		
+		self.assertEqual(len(capture.records), 1)
+		self.assertEqual(capture.records[0].timings, [('handler', 0.002)])
+		self.assertIn('/traced', capture.records[0].getMessage())
+		self.assertIn('handler=2.0ms', capture.records[0].getMessage())
+	
+	def test_render_phase_ends_once_rendered(self):
+		trace = RequestTrace()
+		response = SimpleTemplateResponse(Template('rendered'))
+		
+		with LogCapture(logger, logging.DEBUG) as capture:
+			AsymBaseView._log_request_trace(trace, self.request, response)
+			self.assertEqual(capture.records, [])
+			
+			response.render()
+		
+		self.assertEqual(len(capture.records), 1)
+		self.assertEqual([name for name, duration in capture.records[0].timings], ['render'])
+	
+	def test_rendered_responses_are_logged_straight_away(self):
+		with LogCapture(logger, logging.DEBUG) as capture:
+			AsymBaseView._log_request_trace(RequestTrace(), self.request, SimpleTemplateResponse(Template('')).render())
+			AsymBaseView._log_request_trace(null_request_trace, self.request, SimpleTemplateResponse(Template('')))
+		
+		self.assertEqual(len(capture.records), 1)
+	
+	def test_unwrap_logger(self):
+		lazy_logger = SimpleLazyObject(lambda: logging.getLogger('asym-test-unwrap'))
+		
+		unwrapped = unwrap_logger(lazy_logger)
+		self.assertIs(unwrapped, logging.getLogger('asym-test-unwrap'))
+		self.assertIs(unwrap_logger(lazy_logger), unwrapped)
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+#    Asymmetric Base Framework - A collection of utilities for django frameworks
+#    Copyright (C) 2013  Asymmetric Ventures Inc.
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; version 2 of the License.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from django.contrib.auth.models import Group
+from django.core.exceptions import ValidationError, ImproperlyConfigured
+
+from asymmetricbase.models import Role, AssignedRole, RoleTransfer, AccessType, TypeAwareRoleManager, HasTypeAwareRoleManager
+from asymmetricbase._models.roles import get_user_role_model, RoleRegistry
+from asymmetricbase.testing.base_with_models import BaseTestCaseWithModels
+from asymmetricbase.tests.models import TestModel, FKTestModel
+from asymmetricbase.tests.audit_capture import AuditCapture
+
+class TestRoles(BaseTestCaseWithModels):
+	
+	def setUp(self):
+		self.allowed = Group.objects.create(name = 'test roles allowed')
+		self.users = []
+		for i in range(3):
+			user = get_user_role_model().objects.create(username = 'test-roles-{}'.format(i))
+			getattr(user, get_user_role_model().get_groups_query_string()).add(self.allowed)
+			self.users.append(user)
+		
+		self.from_role = self._make_role('from', TestModel)
+		self.to_role = self._make_role('to', FKTestModel)
+		RoleTransfer.objects.create(role_from = self.from_role, role_to = self.to_role)
+		
+		self.from_model = TestModel.objects.create(field1 = 1, field2 = 'from')
+		self.to_model = FKTestModel.objects.create(test_model = self.from_model, field1 = 1, field2 = 'to')
+		
+		self.audit_handler = AuditCapture().install()
+	
+	def tearDown(self):
+		self.audit_handler.uninstall()
+	
+	def _make_role(self, name, model):
+		role = Role.objects.create(
+			name = name,
+			defined_for = model.get_content_type(),
+			permission_group = Group.objects.create(name = 'test roles {}'.format(name)),
+		)
+		role.permitted_groups.add(self.allowed)
+		return role
+	
+	def _add_records(self):
+		return [record for record in self.audit_handler.records if getattr(record, 'model_name', None) == 'AssignedRole' and record.access_type == AccessType.ADD]
+	
+	def test_bulk_assign_logs_one_entry(self):
+		new_assigned_roles = AssignedRole.objects.bulk_assign(self.users, self.from_role, [self.from_model])
+		
+		self.assertEqual(len(new_assigned_roles), 3)
+		self.assertEqual(AssignedRole.objects.filter(role = self.from_role).count(), 3)
+		
+		add_records = self._add_records()
+		self.assertEqual(len(add_records), 1)
+		self.assertIn('3 AssignedRole objects', add_records[0].msg)
+	
+	def test_role_transfer_create(self):
+		AssignedRole.objects.bulk_assign(self.users, self.from_role, [self.from_model])
+		existing = AssignedRole.objects.create(user = self.users[0], role = self.to_role, content_object = self.to_model)
+		self.audit_handler.records = []
+		
+		transferred = RoleTransfer.create(self.from_model, self.to_model)
+		
+		self.assertEqual(sorted(assigned_role.user_id for assigned_role in transferred), sorted(user.pk for user in self.users))
+		self.assertTrue(all(assigned_role.pk for assigned_role in transferred))
+		self.assertIn(existing.pk, [assigned_role.pk for assigned_role in transferred])
+		self.assertEqual(AssignedRole.objects.filter(role = self.to_role, object_id = self.to_model.pk).count(), 3)
+		
+		add_records = self._add_records()
+		self.assertEqual(len(add_records), 1)
+		self.assertIn('2 AssignedRole objects', add_records[0].msg)
+		
+		# transferring again creates nothing
+		self.audit_handler.records = []
+		self.assertEqual(len(RoleTransfer.create(self.from_model, self.to_model)), 3)
+		self.assertEqual(self._add_records(), [])
+	
+	def test_role_transfer_create_checks_permitted_users(self):
+		outsider = get_user_role_model().objects.create(username = 'test-roles-outsider')
+		self.from_role.permitted_groups.add(Group.objects.create(name = 'test roles outsiders'))
+		getattr(outsider, get_user_role_model().get_groups_query_string()).add(self.from_role.permitted_groups.get(name = 'test roles outsiders'))
+		AssignedRole.objects.create(user = outsider, role = self.from_role, content_object = self.from_model)
+		
+		self.assertRaises(ValidationError, RoleTransfer.create, self.from_model, self.to_model)
+	
+	def test_cached_roles(self):
+		manager = TypeAwareRoleManager(content_type_model_name = 'testmodel')
+		
+		self.assertEqual([role.name for role in manager.cached()], ['from'])
+		self.assertIs(manager.get_cached('from'), manager.get_cached('from'))
+		self.assertEqual(manager.get_cached('from').pk, self.from_role.pk)
+		self.assertRaises(Role.DoesNotExist, manager.get_cached, 'to')
+		
+		self.assertRaises(ImproperlyConfigured, TypeAwareRoleManager(model_content_type = TestModel.get_content_type()).cached)
+	
+	def test_role_changes_clear_the_registry(self):
+		manager = TypeAwareRoleManager(content_type_model_name = 'testmodel')
+		self.assertEqual([role.name for role in manager.cached()], ['from'])
+		
+		new_role = self._make_role('new', TestModel)
+		self.assertEqual([role.name for role in manager.cached()], ['from', 'new'])
+		
+		new_role.delete()
+		self.assertEqual([role.name for role in manager.cached()], ['from'])
+	
+	def test_other_processes_notice_the_version_stamp(self):
+		# A registry of its own stands in for the one in another process,
+		# which the signals don't reach
+		other = RoleRegistry()
+		content_type_ids = other.get_content_type_ids('testmodel')
+		self.assertEqual(list(other.get_roles(content_type_ids)), ['from'])
+		
+		self._make_role('new', TestModel)
+		self.assertEqual(list(other.get_roles(content_type_ids)), ['from'])
+		
+		other.checked_at -= other.CHECK_INTERVAL + 1
+		self.assertEqual(list(other.get_roles(content_type_ids)), ['from', 'new'])
+	
+	def test_has_type_aware_role_manager_shares_its_manager(self):
+		Mixin = HasTypeAwareRoleManager('testmodel')
+		
+		self.assertIsInstance(Mixin().roles, TypeAwareRoleManager)
+		self.assertIs(Mixin().roles, Mixin().roles)
+		self.assertEqual(Mixin().roles.content_type_model_name, 'testmodel')
+
+	
+	def test_check_groups_many(self):
+		other_role = self._make_role('other', FKTestModel)
+		missing = Group.objects.create(name = 'test roles missing')
+		self.from_role.permitted_groups.add(missing)
+		
+		pairs = [(self.from_role, other_role), (self.to_role, other_role), (self.from_role, self.to_role)]
+		results = RoleTransfer.check_groups_many(pairs)
+		
+		self.assertEqual(list(results), pairs)
+		self.assertIsNone(results[(self.to_role, other_role)])
+		for pair in (pairs[0], pairs[2]):
+			self.assertEqual(len(results[pair]), 1)
+			self.assertIn('The test roles missing group is not a Permitted Group on the {} role'.format(pair[1].name), results[pair][0])
+		
+		self.assertEqual(RoleTransfer.check_groups(self.from_role, self.to_role), results[pairs[2]])
+		self.assertIsNone(RoleTransfer.check_groups(self.to_role, other_role))
@@ -23,6 +23,7 @@ import os
 import random
 
 from asymmetricbase.tests.models import TestS3FileModel, TestS3FileWithPreviewModel
+from asymmetricbase.models import PreviewStatus
 from asymmetricbase.testing.base_with_models import BaseTestCaseWithModels
 
 try:
@@ -64,6 +65,30 @@ class TestS3File(BaseTestCaseWithModels):
 			d_loaded = TestS3FileModel.objects.get(id = d_id)
 			self.assertEquals(d_loaded.file_data, random_blocks[i])
 	
+	def test_previews_are_saved_for_a_fresh_copy_of_the_row(self):
+		f = TestS3FileWithPreviewModel(file_data = b"NOT AN IMAGE")
+		f.save()
+		
+		saved_for = []
+		original = TestS3FileWithPreviewModel._save_previews
+		TestS3FileWithPreviewModel._save_previews = lambda instance, file_data: saved_for.append((instance, file_data))
+		try:
+			TestS3FileWithPreviewModel._save_previews_for_pk(f.pk, f._s3_version_id, b"DATA")
+			
+			# newer data has been saved since
+			TestS3FileWithPreviewModel._save_previews_for_pk(f.pk, 'older-version', b"DATA")
+			
+			with self.settings(ASYM_PREVIEW_STATUS_RETRIES = 0):
+				TestS3FileWithPreviewModel._save_previews_for_pk(f.pk + 1, f._s3_version_id, b"DATA")
+		finally:
+			TestS3FileWithPreviewModel._save_previews = original
+		
+		self.assertEqual(len(saved_for), 1)
+		instance, file_data = saved_for[0]
+		self.assertIsNot(instance, f)
+		self.assertEqual(instance.pk, f.pk)
+		self.assertEqual(file_data, b"DATA")
+	
 	def _generate_random_block(self):
 		block_length = random.randrange(1000, 2000)
 		return b"".join(chr(random.randrange(0, 256)) for _i in xrange(block_length))
@@ -88,5 +113,21 @@ class TestS3FileWithPreview(BaseTestCaseWithModels):
 		self.assertGreater(height, 0)
 		self.assertLessEqual(width, TestS3FileWithPreviewModel.Constants.PREVIEW_IMAGE_WIDTH)
 		self.assertLessEqual(height, TestS3FileWithPreviewModel.Constants.PREVIEW_IMAGE_HEIGHT)
-
-
+	
+	def test_queue_preview_image(self):
+		test_image_file = os.path.join(os.path.dirname(__file__), "tiger.jpg")
+		with open(test_image_file) as fp:
+			f = TestS3FileWithPreviewModel(
+				file_data = fp.read(),
+				file_name = "tiger.jpg"
+			)
+		f.save()
+		self.assertEqual(f.preview_status, PreviewStatus.NONE)
+		
+		# runs synchronously in tests
+		f.queue_preview_image()
+		
+		f_loaded = TestS3FileWithPreviewModel.objects.get(id = f.id)
+		self.assertEqual(f_loaded.preview_status, PreviewStatus.READY)
+		image_preview = Image.open(StringIO.StringIO(f_loaded.get_preview_image_data()))
+		self.assertLessEqual(image_preview.size[0], TestS3FileWithPreviewModel.Constants.PREVIEW_IMAGE_WIDTH)
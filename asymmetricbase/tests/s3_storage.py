@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+#    Asymmetric Base Framework - A collection of utilities for django frameworks
+#    Copyright (C) 2013  Asymmetric Ventures Inc.
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; version 2 of the License.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import base64
+import unittest
+from io import BytesIO
+
+from asymmetricbase.utils import s3storage
+from asymmetricbase.utils.s3storage import FileSystemS3Storage, ObjectStream, S3ObjectNotFound, MB
+
+class ReleaseCountingStorage(FileSystemS3Storage):
+	def __init__(self, *args, **kwargs):
+		super(ReleaseCountingStorage, self).__init__(*args, **kwargs)
+		self.open_streams = 0
+	
+	def _open(self, bucket_name, key_name, chunk_size):
+		stream, encoding = super(ReleaseCountingStorage, self)._open(bucket_name, key_name, chunk_size)
+		self.open_streams += 1
+		
+		def release():
+			self.open_streams -= 1
+			stream.close()
+		
+		return ObjectStream(stream, release), encoding
+
+class NestedGetManyStorage(FileSystemS3Storage):
+	""" Calls get_many() again while getting key-0 and key-1 """
+	
+	def __init__(self, *args, **kwargs):
+		super(NestedGetManyStorage, self).__init__(*args, **kwargs)
+		self.nested = {}
+	
+	def get(self, bucket_name, key_name):
+		if key_name in ('key-0', 'key-1'):
+			self.nested[key_name] = len(self.get_many(bucket_name, ['key-2', 'key-3'], max_workers = 2))
+		return super(NestedGetManyStorage, self).get(bucket_name, key_name)
+
+class TestFileSystemS3Storage(unittest.TestCase):
+	
+	def setUp(self):
+		self.storage = FileSystemS3Storage(chunk_size = 1000)
+	
+	def tearDown(self):
+		self.storage.delete_all()
+	
+	def test_put_get(self):
+		version_id = self.storage.put('bucket', 'asymm/some-key', b'SOME FILE CONTENT')
+		
+		self.assertTrue(version_id)
+		self.assertEqual(self.storage.get('bucket', 'asymm/some-key'), b'SOME FILE CONTENT')
+	
+	def test_multipart_stream(self):
+		data = bytes(bytearray(i % 256 for i in range(6 * MB + 17)))
+		self.storage.put('bucket', 'big', BytesIO(data))
+		
+		chunks = list(self.storage.iter_chunks('bucket', 'big'))
+		
+		self.assertTrue(all(len(chunk) <= 1000 for chunk in chunks))
+		self.assertEqual(b''.join(chunks), data)
+	
+	def test_legacy_base64_objects(self):
+		data = b'OLD FILE CONTENT WRITTEN BEFORE RAW STORAGE'
+		# Objects written by older versions have no encoding metadata
+		self.storage._upload('bucket', 'old', iter([base64.b64encode(data)]), {})
+		
+		self.assertEqual(self.storage.get('bucket', 'old'), data)
+	
+	def test_versions(self):
+		first = self.storage.put('bucket', 'key', b'1')
+		second = self.storage.put('bucket', 'key', b'2')
+		
+		self.assertEqual([v.version_id for v in self.storage.list_versions('bucket', 'key')], [second, first])
+		self.assertEqual(self.storage.get('bucket', 'key'), b'2')
+	
+	def test_missing_object(self):
+		self.assertRaises(S3ObjectNotFound, self.storage.get, 'bucket', 'missing')
+	
+	def test_get_many(self):
+		for i in range(5):
+			self.storage.put('bucket', 'key-{}'.format(i), 'data-{}'.format(i).encode('ascii'))
+		
+		data = self.storage.get_many('bucket', ['key-{}'.format(i) for i in range(5)] + ['missing'], max_workers = 3)
+		
+		self.assertEqual(data, dict(('key-{}'.format(i), 'data-{}'.format(i).encode('ascii')) for i in range(5)))
+	
+	def test_get_many_shares_one_pool(self):
+		storage = NestedGetManyStorage(self.storage.root)
+		for i in range(4):
+			storage.put('bucket', 'key-{}'.format(i), b'data')
+		
+		pool = s3storage._get_fetch_pool()
+		self.assertEqual(len(storage.get_many('bucket', ['key-0', 'key-1'], max_workers = 2)), 2)
+		self.assertIs(s3storage._get_fetch_pool(), pool)
+		
+		# a get_many() made on the pool's threads fetches in the same thread
+		self.assertEqual(storage.nested, {'key-0' : 2, 'key-1' : 2})
+	
+	def test_read_file(self):
+		data = bytes(bytearray(i % 256 for i in range(5000)))
+		self.storage.put('bucket', 'key', data)
+		
+		with self.storage.open_read('bucket', 'key') as fp:
+			self.assertEqual(fp.size, 5000)
+			self.assertEqual(fp.read(10), data[:10])
+			fp.seek(2500)
+			self.assertEqual(fp.read(1500), data[2500:4000])
+			fp.seek(-10, 2)
+			self.assertEqual(fp.read(), data[-10:])
+			self.assertEqual(fp.read(), b'')
+			fp.seek(0)
+			self.assertEqual(b''.join(fp), data)
+	
+	def test_read_file_legacy_base64(self):
+		data = b'0123456789' * 100 + b'X'
+		self.storage._upload('bucket', 'old', iter([base64.b64encode(data)]), {})
+		
+		fp = self.storage.open_read('bucket', 'old', chunk_size = 7)
+		
+		self.assertEqual(fp.size, len(data))
+		fp.seek(13)
+		self.assertEqual(fp.read(50), data[13:63])
+		self.assertEqual(b''.join(fp.chunks()), data[63:])
+	
+	def test_write_file(self):
+		versions = []
+		with self.storage.open_write('bucket', 'key', on_close = versions.append) as fp:
+			for _ in range(100):
+				fp.write(b'0123456789')
+		
+		self.assertEqual(len(versions), 1)
+		self.assertEqual(self.storage.get('bucket', 'key'), b'0123456789' * 100)
+	
+	def test_streams_are_released(self):
+		storage = ReleaseCountingStorage(chunk_size = 10)
+		try:
+			storage.put('bucket', 'key', b'x' * 100)
+			
+			# read to the end
+			self.assertEqual(len(list(storage.iter_chunks('bucket', 'key'))), 10)
+			self.assertEqual(storage.open_streams, 0)
+			
+			# abandoned part way through
+			stream = storage.iter_chunks('bucket', 'key')
+			next(stream)
+			self.assertEqual(storage.open_streams, 1)
+			stream.close()
+			self.assertEqual(storage.open_streams, 0)
+			
+			# never iterated
+			storage.iter_chunks('bucket', 'key').close()
+			self.assertEqual(storage.open_streams, 0)
+			
+			# closing the file closes the streams of its chunks()
+			fp = storage.open_read('bucket', 'key')
+			chunks = iter(fp)
+			next(chunks)
+			self.assertEqual(storage.open_streams, 1)
+			fp.close()
+			self.assertEqual(storage.open_streams, 0)
+		finally:
+			storage.delete_all()
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+#    Asymmetric Base Framework - A collection of utilities for django frameworks
+#    Copyright (C) 2013  Asymmetric Ventures Inc.
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; version 2 of the License.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import unittest
+
+from django.test.client import RequestFactory
+
+from asymmetricbase import displaymanager
+from asymmetricbase.jinja import jinja_env
+from asymmetricbase.jinja.response import StreamingJinjaTemplateResponse
+
+class Row(object):
+	def __init__(self, number):
+		self.number = number
+
+class RowTable(displaymanager.SimpleTableDisplay):
+	number = displaymanager.AttrGetField()
+
+class TestStreamingJinjaTemplateResponse(unittest.TestCase):
+	
+	def test_table_rows_are_streamed(self):
+		template = jinja_env.from_string("{% set table = rows %}{% include 'asymmetricbase/displaymanager/vtable_stream.djhtml' %}")
+		rows = RowTable([Row(i) for i in range(50)], iterator = True)
+		
+		response = StreamingJinjaTemplateResponse(RequestFactory().get('/'), template, {'rows' : rows}, buffer_size = 10)
+		chunks = list(response.streaming_content)
+		
+		self.assertGreater(len(chunks), 1)
+		content = b''.join(chunks).decode('utf-8')
+		self.assertEqual(content.count('<td>'), 50 + 1)
+		self.assertIn('<td>49</td>', content)
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+#    Asymmetric Base Framework - A collection of utilities for django frameworks
+#    Copyright (C) 2013  Asymmetric Ventures Inc.
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; version 2 of the License.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import unittest
+
+from asymmetricbase import displaymanager as dm
+from asymmetricbase.jinja import jinja_env
+
+class Owner(object):
+	name = '<b>owner</b>'
+
+class Item(object):
+	def __init__(self, name, value):
+		self.name = name
+		self.value = value
+		self.owner = Owner()
+	
+	def get_label(self):
+		return 'label & "{}"'.format(self.name)
+
+class CellsDisplay(dm.SimpleTableDisplay):
+	name = dm.AttrGetField()
+	value = dm.AttrGetField()
+	owner_name = dm.AttrGetField(attr = 'owner.name')
+	missing = dm.AttrGetField(attr = 'not_an_attribute')
+	missing_owner = dm.AttrGetField(attr = 'owner.not_an_attribute')
+	label = dm.AttrCallField(attr = 'get_label')
+
+class OtherDisplay(dm.Display):
+	name = dm.AttrGetField()
+	
+	class Meta(object):
+		template_name = ('asymmetricbase/displaymanager/fields.djhtml', 'asymmetricbase/displaymanager/vtable.djhtml')
+	
+	@property
+	def columns(self):
+		return self._meta.fields
+	
+	@property
+	def items(self):
+		return self.obj
+	
+	empty_form = None
+
+class TestSimpleTableDisplay(unittest.TestCase):
+	
+	def setUp(self):
+		self.items = [
+			Item('<script>', None),
+			Item('a & b', 0),
+			Item("'quoted'", '"x"'),
+		]
+	
+	def _render(self, source, **context):
+		return jinja_env.from_string(source).render(**context)
+	
+	def test_compiled_cells_match_the_macros(self):
+		display = CellsDisplay(self.items)
+		
+		through_macros = self._render(
+			'{% for item in table.items %}{% for h in table.columns %}[{{ h(item) }}]{% endfor %}\n{% endfor %}',
+			table = display
+		)
+		compiled = self._render(
+			'{% for item in table.items %}{% for cell in table.render_row(item) %}[{{ cell }}]{% endfor %}\n{% endfor %}',
+			table = display
+		)
+		
+		self.assertEqual(compiled, through_macros)
+		self.assertIn('[&lt;script&gt;][None][&lt;b&gt;owner&lt;/b&gt;]', compiled)
+		self.assertIn('[label &amp; &#34;a &amp; b&#34;]', compiled)
+	
+	def test_exclude(self):
+		display = CellsDisplay(self.items, exclude = ('value', 'missing', 'missing_owner', 'label', 'owner_name'))
+		
+		rendered = self._render('{% for cell in table.render_row(item) %}[{{ cell }}]{% endfor %}', table = display, item = self.items[1])
+		
+		self.assertEqual(rendered, '[a &amp; b]')
+	
+	def test_vtable_without_render_row(self):
+		rendered = self._render(
+			"{% from 'asymmetricbase/displaymanager/vtable.djhtml' import display %}{{ display(table) }}",
+			table = OtherDisplay(self.items)
+		)
+		
+		self.assertIn('<td>&lt;script&gt;</td>', rendered)
+		self.assertIn('<td>a &amp; b</td>', rendered)
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+#    Asymmetric Base Framework - A collection of utilities for django frameworks
+#    Copyright (C) 2013  Asymmetric Ventures Inc.
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; version 2 of the License.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import unittest
+
+from asymmetricbase.utils.tiered_cache import TieredCache
+
+class TestTieredCache(unittest.TestCase):
+	
+	def setUp(self):
+		TieredCache('test').invalidate()
+	
+	def test_get_set(self):
+		tiered_cache = TieredCache('test')
+		self.assertEqual(tiered_cache.get('key', 'default'), 'default')
+		
+		tiered_cache.set('key', 'value')
+		self.assertEqual(tiered_cache.get('key'), 'value')
+		self.assertEqual(tiered_cache.local.hits, 1)
+		
+		# another process only has the shared copy
+		self.assertEqual(TieredCache('test').get('key'), 'value')
+	
+	def test_invalidate(self):
+		tiered_cache = TieredCache('test', local_ttl = 0)
+		other_process = TieredCache('test', local_ttl = 0)
+		tiered_cache.set_many({'a' : 1, 'b' : 2})
+		self.assertEqual(other_process.get_many(['a', 'b', 'c']), {'a' : 1, 'b' : 2})
+		
+		tiered_cache.invalidate()
+		self.assertEqual(tiered_cache.get('a'), None)
+		self.assertEqual(other_process.get_many(['a', 'b']), {})
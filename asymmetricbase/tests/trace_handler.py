@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+#    Asymmetric Base Framework - A collection of utilities for django frameworks
+#    Copyright (C) 2013  Asymmetric Ventures Inc.
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; version 2 of the License.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import logging
+import threading
+import time
+
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+
+from asymmetricbase.logging.batchwriter import BatchWriter
+from asymmetricbase.logging.tracehandler import DBTraceHandler
+from asymmetricbase.models import TraceEntry
+from asymmetricbase.testing.base import BaseTestCase
+
+def make_record(level = logging.INFO, message = 'traced'):
+	return logging.LogRecord('trace', level, __file__, 1, message, (), None)
+
+class TestDBTraceHandler(BaseTestCase):
+	
+	def setUp(self):
+		self.written = []
+		self.handler = DBTraceHandler(write_mode = 'background')
+		# Hands the entries over in this thread, instead of saving them
+		self.handler.writer = BatchWriter(self.written.extend, background = False)
+	
+	def trace_request(self, path = '/page', levels = (logging.INFO,)):
+		self.handler.django_request = RequestFactory().get(path)
+		for level in levels:
+			self.handler.emit(make_record(level))
+		self.handler.flush()
+	
+	def test_background_mode_hands_entries_to_the_writer(self):
+		self.trace_request()
+		
+		self.assertEqual(len(self.written), 1)
+		self.assertEqual(self.written[0]['get'], '/page')
+		self.assertIn('[I]', self.written[0]['msg'])
+	
+	def test_sync_mode_saves_the_entry(self):
+		handler = DBTraceHandler(write_mode = 'sync')
+		handler.django_request = RequestFactory().get('/sync-trace')
+		handler.emit(make_record())
+		handler.flush()
+		
+		self.assertEqual(TraceEntry.objects.filter(get = '/sync-trace').count(), 1)
+	
+	def test_messages_are_formatted(self):
+		self.handler.django_request = RequestFactory().get('/page')
+		self.handler.emit(logging.LogRecord('trace', logging.INFO, __file__, 1, 'took %s seconds', (3,), None))
+		self.handler.flush()
+		
+		self.assertIn('took 3 seconds', self.written[0]['msg'])
+	
+	def test_background_writer_flushes_at_exit(self):
+		self.assertTrue(DBTraceHandler().get_writer().stop_at_exit)
+	
+	def test_static_files_are_skipped(self):
+		self.trace_request(path = '/static/site.css')
+		
+		self.assertEqual(self.written, [])
+	
+	@override_settings(ASYM_TRACE_SAMPLE = 'errors')
+	def test_errors_sample(self):
+		self.trace_request(levels = (logging.INFO,))
+		self.assertEqual(self.written, [])
+		
+		self.trace_request(levels = (logging.INFO, logging.ERROR))
+		self.assertEqual(len(self.written), 1)
+	
+	@override_settings(ASYM_TRACE_SAMPLE = 'slow', ASYM_TRACE_SLOW_THRESHOLD = 60)
+	def test_slow_sample(self):
+		self.trace_request()
+		self.assertEqual(self.written, [])
+		
+		self.handler.django_request = RequestFactory().get('/slow')
+		self.handler._local.started = time.time() - 120
+		self.handler.emit(make_record())
+		self.handler.flush()
+		self.assertEqual([data['get'] for data in self.written], ['/slow'])
+	
+	@override_settings(ASYM_TRACE_SAMPLE_RATE = 0)
+	def test_sample_rate(self):
+		self.trace_request(levels = (logging.INFO,))
+		self.assertEqual(self.written, [])
+		
+		# requests with errors are always kept
+		self.trace_request(levels = (logging.ERROR,))
+		self.assertEqual(len(self.written), 1)
+	
+	def test_rows_are_per_thread(self):
+		self.handler.django_request = RequestFactory().get('/main')
+		self.handler.emit(make_record(message = 'main thread'))
+		
+		def other_request():
+			self.handler.django_request = RequestFactory().get('/other')
+			self.handler.emit(make_record(message = 'other thread'))
+			self.handler.flush()
+		thread = threading.Thread(target = other_request)
+		thread.start()
+		thread.join()
+		
+		self.handler.flush()
+		
+		self.assertEqual([data['get'] for data in self.written], ['/other', '/main'])
+		self.assertNotIn('main thread', self.written[0]['msg'])
+		self.assertNotIn('other thread', self.written[1]['msg'])
@@ -17,7 +17,162 @@
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+from collections import namedtuple
 from functools import wraps
+import threading
+import time
+import weakref
+
+from asymmetricbase.utils.lru import LRUCache
+
+_MISSING = object()
+
+CacheInfo = namedtuple('CacheInfo', ('hits', 'misses', 'max_size', 'size'))
+
+# Every memo created by memoize() or cached_function, see clear_all_caches()
+_memos = weakref.WeakSet()
+
+def clear_all_caches():
+	""" Empties every memoize() and cached_function cache. BaseTestCase calls this before each test. """
+	for memo in list(_memos):
+		memo.cache_clear()
+
+class _Memo(object):
+	"""
+	The cache behind a memoized function: an LRU of the results keyed by the
+	arguments, with an optional time to live in seconds.
+	
+	Concurrent calls with the same arguments compute the result only once; the
+	other callers wait for it instead.
+	
+	Calls with unhashable arguments can't be cached, so they bypass the cache
+	and always call the function (counted as misses), the same as cached()
+	does for arguments it can't build a cache key from.
+	"""
+	
+	def __init__(self, func, max_size, ttl, make_key):
+		self.func = func
+		self.max_size = max_size
+		self.ttl = ttl
+		self.make_key = make_key
+		
+		self.hits = 0
+		self.misses = 0
+		
+		self._cache = LRUCache(max_size = max_size)
+		self._lock = threading.Lock()
+		self._key_locks = {}
+		
+		_memos.add(self)
+	
+	def __call__(self, *args, **kwargs):
+		key = self.make_key(args, kwargs)
+		try:
+			value = self._get(key)
+		except TypeError:
+			# unhashable arguments can't be cached
+			self.misses += 1
+			return self.func(*args, **kwargs)
+		
+		if value is not _MISSING:
+			self.hits += 1
+			return value
+		
+		with self._lock:
+			key_lock = self._key_locks.setdefault(key, threading.Lock())
+		
+		try:
+			with key_lock:
+				# another thread may have computed it while we were waiting
+				value = self._get(key)
+				if value is _MISSING:
+					self.misses += 1
+					value = self.func(*args, **kwargs)
+					expires = time.time() + self.ttl if self.ttl is not None else None
+					self._cache.set(key, (value, expires))
+				else:
+					self.hits += 1
+		finally:
+			# also when func raises, or the lock would be kept for good
+			with self._lock:
+				self._key_locks.pop(key, None)
+		
+		return value
+	
+	def _get(self, key):
+		entry = self._cache.get(key, _MISSING)
+		if entry is _MISSING:
+			return _MISSING
+		
+		value, expires = entry
+		if expires is not None and expires <= time.time():
+			self._cache.pop(key)
+			return _MISSING
+		
+		return value
+	
+	def invalidate(self, *args, **kwargs):
+		""" Forgets the result for the given arguments """
+		try:
+			self._cache.pop(self.make_key(args, kwargs))
+		except TypeError:
+			# unhashable arguments are never cached
+			pass
+	
+	def cache_clear(self):
+		self._cache.clear()
+		self.hits = self.misses = 0
+	
+	def cache_info(self):
+		return CacheInfo(self.hits, self.misses, self.max_size, len(self._cache))
+
+_KWARGS_MARK = object()
+
+def _make_key(args, kwargs):
+	if not kwargs:
+		return args
+	return args + (_KWARGS_MARK,) + tuple(sorted(kwargs.items()))
+
+def _wrap(func, memo):
+	@wraps(func)
+	def wrapper(*args, **kwargs):
+		return memo(*args, **kwargs)
+	
+	wrapper.invalidate = memo.invalidate
+	wrapper.cache_clear = memo.cache_clear
+	wrapper.cache_info = memo.cache_info
+	return wrapper
+
+def memoize(max_size = 128, ttl = None):
+	"""
+	Cache the results of a function by its arguments. Calls with unhashable
+	arguments bypass the cache and always run the function.
+	
+	Keeps the `max_size` most recently used results, each for at most `ttl`
+	seconds if it is given. The wrapped function gets `invalidate(*args, **kwargs)`
+	to forget one result, `cache_clear()` to forget all of them and `cache_info()`
+	for the hit and miss counts.
+	
+	>>> @memoize(max_size = 10)
+	... def square(x):
+	...   print("CALC", x)
+	...   return x * x
+	>>> square(3)
+	CALC 3
+	9
+	>>> square(3)
+	9
+	>>> square.invalidate(3)
+	>>> square(3)
+	CALC 3
+	9
+	>>> square.cache_info()
+	CacheInfo(hits=1, misses=2, max_size=10, size=1)
+	
+	"""
+	def decorator(func):
+		return _wrap(func, _Memo(func, max_size, ttl, _make_key))
+	return decorator
 
 def cached_function(func):
 	"""
@@ -26,7 +181,8 @@ def cached_function(func):
 	
 	Similar to django's "cached_property"
 	
-	Note: Assumes that the function will be called with the same arguments each time
+	Note: Assumes that the function will be called with the same arguments each time,
+	use memoize() for functions whose result depends on their arguments.
 	
 	>>> def myfunc():
 	...   print("HELLO")
@@ -46,13 +202,4 @@ def cached_function(func):
 	
 	"""
 	
-	@wraps(func)
-	def wrapper(*args, **kwargs):
-		if not hasattr(func, '__cached_result__'):
-			func.__cached_result__ = func(*args, **kwargs)
-		
-		return func.__cached_result__
-	
-	return wrapper
-		
-
+	return _wrap(func, _Memo(func, 1, None, lambda args, kwargs: None))
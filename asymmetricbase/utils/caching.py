@@ -18,28 +18,232 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 from functools import wraps
+import hashlib
+import time
 
-from django.core.cache import cache
+from django.core.cache import cache as default_cache
+
+# Bumped whenever the format of the cached values changes, so values stored
+# by an older version are never read back
+CACHE_KEY_VERSION = 'v2'
+
+class UncacheableArguments(TypeError):
+	""" Raised by make_cache_key() for arguments it can't build a stable key from """
+
+def _key_part(value):
+	# model instances are identified by their pk, not their (non unique) repr()
+	if hasattr(value, '_meta') and hasattr(value, 'pk'):
+		return '<{}.{}:{}>'.format(value._meta.app_label, value._meta.object_name, value.pk)
+	
+	if isinstance(value, (tuple, list)):
+		return '({})'.format(','.join(_key_part(item) for item in value))
+	
+	# Anything else has to be hashable, and have a repr() which doesn't
+	# depend on where the object is in memory, or the key would never match
+	try:
+		hash(value)
+	except TypeError:
+		raise UncacheableArguments("Can't build a cache key from {!r}, it isn't hashable".format(value))
+	
+	part = repr(value)
+	if ' at 0x' in part:
+		raise UncacheableArguments("Can't build a cache key from {}, its repr() isn't stable".format(part))
+	return part
+
+def _method_owner(obj, name, function):
+	# The class `function` was defined on, if it's called as a method of obj
+	# (or as a classmethod of obj), else None
+	klass = obj if isinstance(obj, type) else type(obj)
+	for owner in getattr(klass, '__mro__', ()):
+		attr = owner.__dict__.get(name)
+		if attr is function or getattr(attr, '__func__', None) is function:
+			return owner
+	return None
+
+def make_cache_key(prefix, args = (), kwargs = None, scope = None):
+	"""
+	Builds a cache key from a prefix (such as the qualified name of a
+	function), a scope (eg. the session key or user id the result belongs to)
+	and the arguments. The arguments are hashed, which keeps the key short and
+	free of the characters memcached doesn't allow.
+	
+	Arguments must be model instances, or hashable values with a stable
+	repr(), or tuples and lists of those. Anything else raises
+	UncacheableArguments, a TypeError.
+	"""
+	key = '{}:{}'.format(CACHE_KEY_VERSION, prefix)
+	if scope is not None:
+		key = '{}:{}'.format(key, scope)
+	
+	if args or kwargs:
+		parts = [_key_part(arg) for arg in args]
+		parts.extend('{}={}'.format(name, _key_part(value)) for name, value in sorted((kwargs or {}).items()))
+		key = '{}:{}'.format(key, hashlib.md5('\x00'.join(parts).encode('utf-8')).hexdigest())
+	
+	return key
+
+class cached(object):
+	"""
+	Caches the result of a function in the django cache for `timeout` seconds,
+	keyed on the function's module and name, its arguments, and optionally a
+	scope. `scope` is a function that is given the same arguments and returns
+	eg. the session key, user id or tenant the result is for.
+	
+	The key of a method also includes the name of the class defining it, so
+	same-named methods of different classes don't share results. Its `self`
+	is part of the arguments, so it has to be a model instance or have a
+	stable repr().
+	
+	None results are cached like any other result. Calls whose arguments
+	can't be made into a key (see make_cache_key()) bypass the cache and
+	always call the function.
+	
+	With `stale_timeout`, a result is kept for that many seconds after it goes
+	stale. The first caller to find it stale recomputes it, and everyone else
+	keeps getting the stale result in the meantime instead of all of them
+	recomputing it at once.
+	
+	The wrapped function also gets:
+	 - make_key(*args, **kwargs)
+	 - invalidate(*args, **kwargs)
+	 - get_many(arg_list): the results for a list of argument tuples, fetching
+	   all the cached ones with a single cache.get_many() and storing the
+	   computed ones with a single cache.set_many()
+	
+	`backend` replaces the django cache, eg. with a TieredCache for results
+	that are read many times per request.
+	"""
+	
+	def __init__(self, timeout = 60, scope = None, stale_timeout = None, key_prefix = None, backend = None):
+		self.timeout = timeout
+		self.scope = scope
+		self.stale_timeout = stale_timeout
+		self.key_prefix = key_prefix
+		self.backend = backend
+	
+	def __call__(self, fn):
+		cache = self._get_backend()
+		prefix = self.key_prefix or 'asym-cached:{}.{}'.format(fn.__module__, fn.__name__)
+		method_prefixes = {}
+		
+		def get_prefix(args):
+			if self.key_prefix or not args:
+				return prefix
+			
+			klass = type(args[0])
+			if klass not in method_prefixes:
+				owner = _method_owner(args[0], fn.__name__, wrapped)
+				method_prefixes[klass] = prefix if owner is None else 'asym-cached:{}.{}.{}'.format(fn.__module__, owner.__name__, fn.__name__)
+			return method_prefixes[klass]
+		
+		def make_key(*args, **kwargs):
+			scope = self.scope(*args, **kwargs) if self.scope is not None else None
+			return make_cache_key(get_prefix(args), args, kwargs, scope)
+		
+		@wraps(fn)
+		def wrapped(*args, **kwargs):
+			try:
+				key = make_key(*args, **kwargs)
+			except UncacheableArguments:
+				return fn(*args, **kwargs)
+			
+			entry = cache.get(key)
+			if entry is not None:
+				value, fresh_until = entry
+				if fresh_until is None or fresh_until > time.time() or not self._claim_refresh(key):
+					return value
+			
+			value = fn(*args, **kwargs)
+			cache.set(key, self._make_entry(value), self._cache_timeout())
+			if entry is not None:
+				cache.delete(self._refresh_key(key))
+			return value
+		
+		def invalidate(*args, **kwargs):
+			try:
+				cache.delete(make_key(*args, **kwargs))
+			except UncacheableArguments:
+				# never cached in the first place
+				pass
+		
+		def get_many(arg_list):
+			arg_list = [args if isinstance(args, tuple) else (args,) for args in arg_list]
+			keys = []
+			for args in arg_list:
+				try:
+					keys.append(make_key(*args))
+				except UncacheableArguments:
+					keys.append(None)
+			entries = cache.get_many([key for key in keys if key is not None])
+			
+			now = time.time()
+			results = []
+			computed = {}
+			for args, key in zip(arg_list, keys):
+				if key is None:
+					results.append(fn(*args))
+					continue
+				
+				entry = entries.get(key)
+				if entry is not None:
+					value, fresh_until = entry
+					if fresh_until is None or fresh_until > now or not self._claim_refresh(key):
+						results.append(value)
+						continue
+				
+				if key not in computed:
+					computed[key] = self._make_entry(fn(*args))
+				results.append(computed[key][0])
+			
+			if computed:
+				cache.set_many(computed, self._cache_timeout())
+				if self.stale_timeout:
+					cache.delete_many([self._refresh_key(key) for key in computed])
+			
+			return results
+		
+		wrapped.make_key = make_key
+		wrapped.invalidate = invalidate
+		wrapped.get_many = get_many
+		return wrapped
+	
+	def _make_entry(self, value):
+		# the value is always wrapped, so a cached None isn't taken for a miss
+		fresh_until = time.time() + self.timeout if self.stale_timeout else None
+		return (value, fresh_until)
+	
+	def _cache_timeout(self):
+		return self.timeout + (self.stale_timeout or 0)
+	
+	def _get_backend(self):
+		return self.backend if self.backend is not None else default_cache
+	
+	def _refresh_key(self, key):
+		return '{}:refreshing'.format(key)
+	
+	def _claim_refresh(self, key):
+		# Only one caller gets to refresh a stale result
+		return self._get_backend().add(self._refresh_key(key), True, self.stale_timeout)
 
 class session_cached_function(object):
+	"""
+	Caches a function's result under `key`. When the function takes
+	arguments, they are added to the key, so each set of arguments gets its
+	own result.
+	"""
 	def __init__(self, key, **kwargs):
 		self.key = key
 		self.timeout = kwargs.get('timeout', 60)
+		self.backend = kwargs.get('backend', None)
 	
 	def __call__(self, fn):
-		@wraps(fn)
-		def wrapped(*args, **kwargs):
-			data = cache.get(self.key)
-			if data is None:
-				data = fn(*args, **kwargs)
-				cache.set(self.key, data, self.timeout)
-			return data
-		return wrapped
+		return cached(timeout = self.timeout, key_prefix = self.key, backend = self.backend)(fn)
 
 class session_cached_property(object):
 	def __init__(self, make_key, **kwargs):
 		self.make_key = make_key
 		self.timeout = kwargs.get('timeout', 300)
+		self.backend = kwargs.get('backend', None)
 	
 	def __call__(self, fn):
 		self.fn = fn
@@ -49,11 +253,11 @@ class session_cached_property(object):
 		if instance is None:
 			return self
 		
-		key = self.make_key(instance)
-		data = cache.get(key)
-		if data is None:
-			data = self.fn(instance)
-			cache.set(key, data, self.timeout)
+		cache = self.backend if self.backend is not None else default_cache
+		key = '{}:{}'.format(CACHE_KEY_VERSION, self.make_key(instance))
+		entry = cache.get(key)
+		if entry is None:
+			entry = (self.fn(instance),)
+			cache.set(key, entry, self.timeout)
 		
-		return data
-			
+		return entry[0]
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+#    Asymmetric Base Framework - A collection of utilities for django frameworks
+#    Copyright (C) 2013  Asymmetric Ventures Inc.
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; version 2 of the License.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import threading
+from collections import OrderedDict
+
+_MISSING = object()
+
+class LRUCache(object):
+	"""
+	A thread safe, in-process least recently used cache.
+	
+	Holds at most `max_size` entries and, if `max_bytes` is given, at most
+	that many bytes as measured by `sizeof(value)`. Values bigger than
+	`max_bytes` are not cached at all.
+	"""
+	
+	def __init__(self, max_size = 1000, max_bytes = None, sizeof = len):
+		self.max_size = max_size
+		self.max_bytes = max_bytes
+		self.sizeof = sizeof
+		
+		self.hits = 0
+		self.misses = 0
+		
+		self._data = OrderedDict()
+		self._sizes = {}
+		self._total_bytes = 0
+		self._lock = threading.Lock()
+	
+	def get(self, key, default = None):
+		with self._lock:
+			value = self._data.pop(key, _MISSING)
+			if value is _MISSING:
+				self.misses += 1
+				return default
+			
+			self._data[key] = value
+			self.hits += 1
+			return value
+	
+	def set(self, key, value):
+		size = self.sizeof(value) if self.max_bytes is not None else 0
+		
+		with self._lock:
+			self._discard(key)
+			
+			if self.max_bytes is not None and size > self.max_bytes:
+				return
+			
+			self._data[key] = value
+			self._sizes[key] = size
+			self._total_bytes += size
+			
+			while len(self._data) > self.max_size or (self.max_bytes is not None and self._total_bytes > self.max_bytes):
+				self._discard(next(iter(self._data)))
+	
+	def pop(self, key, default = None):
+		with self._lock:
+			value = self._data.get(key, default)
+			self._discard(key)
+			return value
+	
+	def clear(self):
+		with self._lock:
+			self._data.clear()
+			self._sizes.clear()
+			self._total_bytes = 0
+			self.hits = self.misses = 0
+	
+	def __contains__(self, key):
+		return key in self._data
+	
+	def __len__(self):
+		return len(self._data)
+	
+	def __getitem__(self, key):
+		value = self.get(key, _MISSING)
+		if value is _MISSING:
+			raise KeyError(key)
+		return value
+	
+	def __setitem__(self, key, value):
+		self.set(key, value)
+	
+	def __delitem__(self, key):
+		if self.pop(key, _MISSING) is _MISSING:
+			raise KeyError(key)
+	
+	@property
+	def total_bytes(self):
+		return self._total_bytes
+	
+	def _discard(self, key):
+		# must be called with the lock held
+		if self._data.pop(key, _MISSING) is not _MISSING:
+			self._total_bytes -= self._sizes.pop(key)
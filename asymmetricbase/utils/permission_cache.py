@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+#    Asymmetric Base Framework - A collection of utilities for django frameworks
+#    Copyright (C) 2013  Asymmetric Ventures Inc.
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; version 2 of the License.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import Group, Permission
+from django.contrib.contenttypes.models import ContentType
+from django.db.models.signals import post_save, post_delete, m2m_changed
+
+from asymmetricbase.utils.tiered_cache import get_tiered_cache
+
+# How long (in seconds) a user's permission set may be shared between requests.
+# 0 keeps the permission set for the lifetime of the request's user object only.
+PERMISSION_CACHE_TIMEOUT = getattr(settings, 'ASYM_PERMISSION_CACHE_TIMEOUT', 0)
+
+permission_cache = get_tiered_cache('permissions')
+
+def get_permission_version():
+	"""
+	Returns the current permission version stamp. Every cached permission set is
+	kept under this stamp, so replacing it invalidates all of them at once.
+	"""
+	return permission_cache.get_version()
+
+def invalidate_permission_cache(*args, **kwargs):
+	"""
+	Drops every user's cached permission set. Can be connected directly to
+	model signals.
+	"""
+	permission_cache.invalidate()
+
+def get_cached_permissions(user_obj, kind, load):
+	"""
+	Returns load(), shared between requests for ASYM_PERMISSION_CACHE_TIMEOUT
+	seconds under the current permission version. The result is shared, so it
+	must not be modified.
+	"""
+	if not PERMISSION_CACHE_TIMEOUT:
+		return load()
+	
+	# superusers get every permission, so the flag is part of the key
+	key = '{}:{}:{}'.format(kind, user_obj.pk, int(user_obj.is_superuser))
+	perms = permission_cache.get(key)
+	if perms is None:
+		perms = load()
+		permission_cache.set(key, perms, PERMISSION_CACHE_TIMEOUT)
+	return perms
+
+class CachedModelBackend(ModelBackend):
+	"""
+	Drop-in replacement for django's ModelBackend.
+	
+	Like ModelBackend, the user's permission set is loaded once and kept on the
+	user object, so every has_perm() for the rest of the request is answered from
+	memory. If ASYM_PERMISSION_CACHE_TIMEOUT is set, the set is also shared
+	between requests through a TieredCache for that many seconds. Changes to
+	groups, permissions or assigned roles invalidate the shared sets.
+	
+	Enable it by replacing 'django.contrib.auth.backends.ModelBackend' in
+	AUTHENTICATION_BACKENDS with 'asymmetricbase.utils.permission_cache.CachedModelBackend'.
+	"""
+	
+	def get_group_permissions(self, user_obj, obj = None):
+		if user_obj.is_anonymous() or obj is not None:
+			return set()
+		if not hasattr(user_obj, '_group_perm_cache'):
+			user_obj._group_perm_cache = set(get_cached_permissions(
+				user_obj, 'group',
+				lambda: super(CachedModelBackend, self).get_group_permissions(user_obj)
+			))
+		return user_obj._group_perm_cache
+	
+	def get_all_permissions(self, user_obj, obj = None):
+		if user_obj.is_anonymous() or obj is not None:
+			return set()
+		if not hasattr(user_obj, '_perm_cache'):
+			user_obj._perm_cache = set(get_cached_permissions(
+				user_obj, 'all',
+				lambda: set(super(CachedModelBackend, self).get_all_permissions(user_obj))
+			))
+		return user_obj._perm_cache
+
+class AssignedRoleBackend(object):
+	"""
+	Object level permissions from AssignedRoles: a user has a permission on an
+	object if they are assigned a Role on that object whose permission_group
+	has the permission.
+	
+	All of a user's assignments are loaded with one query into an index of
+	(content_type_id, object_id) to permission set, which is kept on the user
+	object (and shared like CachedModelBackend's permission sets).
+	
+	Add 'asymmetricbase.utils.permission_cache.AssignedRoleBackend' to
+	AUTHENTICATION_BACKENDS to enable it. For filtering whole querysets, see
+	AssignedRoleManager.filter_objects_with_perm().
+	"""
+	
+	def authenticate(self, **credentials):
+		return None
+	
+	def get_user(self, user_id):
+		return None
+	
+	def get_role_permission_index(self, user_obj):
+		if not hasattr(user_obj, '_role_perm_cache'):
+			from asymmetricbase._models.roles import AssignedRole
+			user_obj._role_perm_cache = get_cached_permissions(
+				user_obj, 'roles',
+				lambda: AssignedRole.objects.get_permission_index(user_obj)
+			)
+		return user_obj._role_perm_cache
+	
+	def get_all_permissions(self, user_obj, obj = None):
+		if obj is None or user_obj.is_anonymous() or not user_obj.is_active:
+			return set()
+		
+		content_type = ContentType.objects.get_for_model(obj)
+		return set(self.get_role_permission_index(user_obj).get((content_type.id, obj.pk), ()))
+	
+	def has_perm(self, user_obj, perm, obj = None):
+		if obj is None or user_obj.is_anonymous() or not user_obj.is_active:
+			return False
+		
+		content_type = ContentType.objects.get_for_model(obj)
+		return perm in self.get_role_permission_index(user_obj).get((content_type.id, obj.pk), ())
+
+def _invalidate_on_m2m_changed(sender, action, **kwargs):
+	if action not in ('post_add', 'post_remove', 'post_clear'):
+		return
+	
+	user_model = get_user_model()
+	watched = [Group.permissions.through]
+	for field_name in ('groups', 'user_permissions'):
+		descriptor = getattr(user_model, field_name, None)
+		if descriptor is not None:
+			watched.append(descriptor.through)
+	
+	if sender in watched:
+		invalidate_permission_cache()
+
+for model in (Group, Permission):
+	post_save.connect(invalidate_permission_cache, sender = model, dispatch_uid = 'asym_permission_cache_{}_save'.format(model.__name__))
+	post_delete.connect(invalidate_permission_cache, sender = model, dispatch_uid = 'asym_permission_cache_{}_delete'.format(model.__name__))
+
+m2m_changed.connect(_invalidate_on_m2m_changed, dispatch_uid = 'asym_permission_cache_m2m')
@@ -0,0 +1,731 @@
+# -*- coding: utf-8 -*-
+#    Asymmetric Base Framework - A collection of utilities for django frameworks
+#    Copyright (C) 2013  Asymmetric Ventures Inc.
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; version 2 of the License.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import base64
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import namedtuple
+from contextlib import contextmanager
+from itertools import chain
+from multiprocessing.pool import ThreadPool
+
+try:
+	from queue import Queue, Empty, Full
+except ImportError:
+	from Queue import Queue, Empty, Full
+
+try:
+	from urllib.parse import quote as url_quote, unquote as url_unquote
+except ImportError:
+	from urllib import quote as url_quote, unquote as url_unquote
+
+from io import BytesIO
+
+from django.conf import settings
+from django.db.utils import DatabaseError
+from django.utils.importlib import import_module
+
+try:
+	from boto.s3.connection import S3Connection
+	from boto.s3.key import Key
+	from boto import exception as boto_exceptions
+except ImportError:
+	S3Connection = None
+
+# Objects are stored as raw bytes, and tagged with this metadata. Objects
+# without it were written by older versions, which base64 encoded the data.
+ENCODING_METADATA_KEY = 'asym-encoding'
+RAW_ENCODING = 'raw'
+
+MB = 1024 * 1024
+
+class S3ObjectNotFound(IOError):
+	pass
+
+def _decode_base64_chunks(chunks):
+	"Decodes a stream of base64 encoded chunks without joining them first"
+	remainder = b''
+	for chunk in chunks:
+		chunk = remainder + chunk
+		usable = len(chunk) - len(chunk) % 4
+		remainder = chunk[usable:]
+		if usable:
+			yield base64.b64decode(chunk[:usable])
+	
+	if remainder:
+		yield base64.b64decode(remainder)
+
+class ObjectStream(object):
+	"""
+	Iterates over the chunks of a stored object. close() releases what the
+	read holds (eg. a pooled connection), and is called once the last chunk
+	has been read, so streams that are read to the end need not be closed.
+	Streams that may be abandoned, such as the content of a streamed
+	response, must be closed.
+	"""
+	
+	def __init__(self, chunks, release):
+		self._chunks = iter(chunks)
+		self._release = release
+	
+	def __iter__(self):
+		return self
+	
+	def __next__(self):
+		if self._release is None:
+			raise StopIteration()
+		
+		try:
+			return next(self._chunks)
+		except BaseException:
+			self.close()
+			raise
+	
+	next = __next__
+	
+	def close(self):
+		release, self._release = self._release, None
+		if release is not None:
+			release()
+
+def _read_parts(data, part_size):
+	"Splits `data` (bytes or a file-like object) into parts of `part_size` bytes"
+	if not hasattr(data, 'read'):
+		data = BytesIO(bytes(data))
+	
+	while True:
+		part = data.read(part_size)
+		if not part:
+			return
+		yield part
+
+class S3Storage(object):
+	"""
+	Stores S3File contents. Subclasses implement _open(), which returns the
+	stored chunks and their encoding, _upload() and list_versions().
+	"""
+	
+	def __init__(self, chunk_size = None, part_size = None):
+		self.chunk_size = chunk_size or getattr(settings, 'AWS_S3_FILES_CHUNK_SIZE', 1 * MB)
+		# S3 refuses multipart parts smaller than 5MB
+		self.part_size = max(part_size or getattr(settings, 'AWS_S3_FILES_PART_SIZE', 8 * MB), 5 * MB)
+	
+	def get(self, bucket_name, key_name):
+		stream = self.iter_chunks(bucket_name, key_name)
+		try:
+			return b''.join(stream)
+		finally:
+			stream.close()
+	
+	def get_many(self, bucket_name, key_names, max_workers = None):
+		"""
+		Fetches several objects concurrently, with at most `max_workers`
+		requests in flight, and returns a dict of key name to contents. The
+		requests are made on a pool of AWS_S3_FILES_PREFETCH_WORKERS threads
+		shared by the whole process.
+		
+		Objects that can't be read are left out of the result, so the caller
+		can fall back to get() and see the error where the data is used.
+		"""
+		key_names = list(set(key_names))
+		if not key_names:
+			return {}
+		
+		max_workers = max_workers or getattr(settings, 'AWS_S3_FILES_PREFETCH_WORKERS', 8)
+		
+		def fetch(key_name):
+			try:
+				return key_name, self.get(bucket_name, key_name)
+			except (IOError, DatabaseError):
+				return key_name, None
+		
+		def fetch_group(group):
+			_fetch_state.in_pool = True
+			try:
+				return [fetch(key_name) for key_name in group]
+			finally:
+				_fetch_state.in_pool = False
+		
+		# A get_many() running on the pool fetches in its own thread, waiting
+		# for a free worker there could deadlock
+		if len(key_names) == 1 or max_workers <= 1 or getattr(_fetch_state, 'in_pool', False):
+			results = [fetch(key_name) for key_name in key_names]
+		else:
+			workers = min(max_workers, len(key_names))
+			groups = [key_names[i::workers] for i in range(workers)]
+			results = chain.from_iterable(_get_fetch_pool().map(fetch_group, groups))
+		
+		return dict((key_name, data) for key_name, data in results if data is not None)
+	
+	def iter_chunks(self, bucket_name, key_name, chunk_size = None):
+		"""
+		Returns an ObjectStream of the decoded contents of the object,
+		`chunk_size` bytes at a time.
+		"""
+		stream, encoding = self._open(bucket_name, key_name, chunk_size or self.chunk_size)
+		if encoding == RAW_ENCODING:
+			return stream
+		return ObjectStream(_decode_base64_chunks(stream), stream.close)
+	
+	def put(self, bucket_name, key_name, data):
+		"""
+		Stores `data`, which is either bytes or a file-like object, and returns
+		the version id of the new object. Data larger than `part_size` is
+		uploaded in parts, so it never needs to be in memory all at once.
+		"""
+		return self._upload(bucket_name, key_name, _read_parts(data, self.part_size), {ENCODING_METADATA_KEY : RAW_ENCODING})
+	
+	def stat(self, bucket_name, key_name):
+		"Returns the size of the decoded contents of the object, and its encoding"
+		size, encoding = self._head(bucket_name, key_name)
+		if encoding != RAW_ENCODING and size:
+			padding = self._get_range(bucket_name, key_name, size - 2, size - 1).count(b'=')
+			size = size // 4 * 3 - padding
+		return size, encoding
+	
+	def read_range(self, bucket_name, key_name, start, length, encoding):
+		"Returns up to `length` bytes of the decoded contents, starting at `start`"
+		if length <= 0:
+			return b''
+		
+		if encoding == RAW_ENCODING:
+			return self._get_range(bucket_name, key_name, start, start + length - 1)
+		
+		# Every 3 decoded bytes are 4 encoded bytes
+		encoded_start = start // 3 * 4
+		encoded_end = (start + length + 2) // 3 * 4 - 1
+		data = base64.b64decode(self._get_range(bucket_name, key_name, encoded_start, encoded_end))
+		offset = start - start // 3 * 3
+		return data[offset:offset + length]
+	
+	def open_read(self, bucket_name, key_name, chunk_size = None):
+		return S3ReadFile(self, bucket_name, key_name, chunk_size)
+	
+	def open_write(self, bucket_name, key_name, on_close = None):
+		return S3WriteFile(self, bucket_name, key_name, on_close)
+	
+	def list_versions(self, bucket_name, key_name):
+		raise NotImplementedError()
+	
+	def _open(self, bucket_name, key_name, chunk_size):
+		"Returns an ObjectStream of the stored bytes, and the object's encoding"
+		raise NotImplementedError()
+	
+	def _head(self, bucket_name, key_name):
+		"Returns the stored size and encoding of the object"
+		raise NotImplementedError()
+	
+	def _get_range(self, bucket_name, key_name, start, end):
+		"Returns the stored bytes from `start` to `end`, inclusive"
+		raise NotImplementedError()
+	
+	def _upload(self, bucket_name, key_name, parts, metadata):
+		raise NotImplementedError()
+
+class BotoS3Storage(S3Storage):
+	"""
+	S3Storage backed by Amazon S3.
+	
+	Connections are kept in a pool shared by all threads (boto connections
+	must not be used by two threads at the same time). Buckets are checked,
+	created and have versioning enabled at most once per process.
+	"""
+	
+	def __init__(self, pool_size = None, *args, **kwargs):
+		assert S3Connection is not None, "boto is required to store S3Files in S3"
+		super(BotoS3Storage, self).__init__(*args, **kwargs)
+		
+		self.pool = Queue(pool_size or getattr(settings, 'AWS_S3_FILES_POOL_SIZE', 10))
+		
+		# bucket name -> whether versioning has been checked
+		self.validated_buckets = {}
+		self.bucket_lock = threading.Lock()
+	
+	def list_versions(self, bucket_name, key_name):
+		with self._bucket(bucket_name, assert_versioning_enabled = True) as bucket:
+			return list(bucket.list_versions(prefix = key_name))
+	
+	def _open(self, bucket_name, key_name, chunk_size):
+		connection = self._get_connection()
+		try:
+			key = Key(bucket = self._get_bucket(connection, bucket_name), name = key_name)
+			key.open_read()
+		except boto_exceptions.S3ResponseError as e:
+			self._release_connection(connection)
+			raise self._object_error(bucket_name, key_name, e)
+		except Exception:
+			self._release_connection(connection)
+			raise
+		
+		def release():
+			try:
+				key.close()
+			finally:
+				self._release_connection(connection)
+		
+		return ObjectStream(iter(lambda: key.read(chunk_size), b''), release), key.get_metadata(ENCODING_METADATA_KEY)
+	
+	def _head(self, bucket_name, key_name):
+		with self._bucket(bucket_name) as bucket:
+			try:
+				key = bucket.get_key(key_name)
+			except boto_exceptions.S3ResponseError as e:
+				raise self._object_error(bucket_name, key_name, e)
+			
+			if key is None:
+				raise S3ObjectNotFound("Object {} not found in bucket {}".format(key_name, bucket_name))
+			
+			return key.size, key.get_metadata(ENCODING_METADATA_KEY)
+	
+	def _get_range(self, bucket_name, key_name, start, end):
+		with self._bucket(bucket_name) as bucket:
+			try:
+				key = Key(bucket = bucket, name = key_name)
+				return key.get_contents_as_string(headers = {'Range' : 'bytes={}-{}'.format(start, end)})
+			except boto_exceptions.S3ResponseError as e:
+				raise self._object_error(bucket_name, key_name, e)
+	
+	@staticmethod
+	def _object_error(bucket_name, key_name, e):
+		if e.status == 404:
+			return S3ObjectNotFound("Object {} not found in bucket {}".format(key_name, bucket_name))
+		return DatabaseError(
+			"Error retrieving object from S3.\n Bucket: {}\n Object Name: {}\n Boto Exception:\n {}".format(
+				bucket_name, key_name, e
+			)
+		)
+	
+	def _upload(self, bucket_name, key_name, parts, metadata):
+		first_part = next(parts, b'')
+		second_part = next(parts, None)
+		
+		with self._bucket(bucket_name, assert_versioning_enabled = True) as bucket:
+			try:
+				if second_part is None:
+					key = Key(bucket = bucket, name = key_name)
+					for name, value in metadata.items():
+						key.set_metadata(name, value)
+					key.set_contents_from_string(first_part, encrypt_key = True)
+					return key.version_id
+				
+				upload = bucket.initiate_multipart_upload(key_name, metadata = metadata, encrypt_key = True)
+				try:
+					for part_num, part in enumerate(self._chain(first_part, second_part, parts), 1):
+						upload.upload_part_from_file(BytesIO(part), part_num)
+					result = upload.complete_upload()
+				except Exception:
+					upload.cancel_upload()
+					raise
+				
+				return getattr(result, 'version_id', None)
+			except boto_exceptions.BotoClientError as e:
+				raise DatabaseError(
+					"Error storing object in S3.\n Bucket: {}\n Object Name: {}\n Boto Exception:\n {}".format(
+						bucket_name, key_name, e
+					)
+				)
+	
+	@staticmethod
+	def _chain(first_part, second_part, parts):
+		yield first_part
+		yield second_part
+		for part in parts:
+			yield part
+	
+	@contextmanager
+	def _bucket(self, bucket_name, assert_versioning_enabled = False):
+		connection = self._get_connection()
+		try:
+			yield self._get_bucket(connection, bucket_name, assert_versioning_enabled)
+		finally:
+			self._release_connection(connection)
+	
+	def _get_bucket(self, connection, bucket_name, assert_versioning_enabled = False):
+		try:
+			versioning_checked = self.validated_buckets.get(bucket_name)
+			if versioning_checked is None or (assert_versioning_enabled and not versioning_checked):
+				self._validate_bucket(connection, bucket_name, assert_versioning_enabled)
+			
+			# The bucket is known to exist, so don't spend a request checking it
+			return connection.get_bucket(bucket_name, validate = False)
+		except boto_exceptions.S3ResponseError as e:
+			raise DatabaseError(
+				"Error retrieving bucket from S3.\nBucket: {}\nBoto Exception:\n{}".format(
+					bucket_name, e
+				)
+			)
+	
+	def _validate_bucket(self, connection, bucket_name, assert_versioning_enabled):
+		with self.bucket_lock:
+			versioning_checked = self.validated_buckets.get(bucket_name)
+			
+			if versioning_checked is None:
+				if not connection.lookup(bucket_name):
+					connection.create_bucket(bucket_name)
+				versioning_checked = False
+			
+			if assert_versioning_enabled and not versioning_checked:
+				self._assert_bucket_has_versioning_enabled(connection.get_bucket(bucket_name))
+				versioning_checked = True
+			
+			self.validated_buckets[bucket_name] = versioning_checked
+	
+	@staticmethod
+	def _assert_bucket_has_versioning_enabled(bucket):
+		d = bucket.get_versioning_status()
+		if 'Versioning' in d and d['Versioning'] == 'Enabled':
+			# already has versioning enabled
+			return
+		bucket.configure_versioning(versioning = True)
+		# need to wait until AWS syncs s3. this is fine,
+		# since we only do this once every few months (when bucket properties change)
+		time.sleep(15)
+	
+	def _get_connection(self):
+		try:
+			return self.pool.get_nowait()
+		except Empty:
+			pass
+		
+		aws_access_key_id = getattr(settings, 'AWS_S3_FILES_ACCESS_KEY_ID', None)
+		aws_secret_access_key = getattr(settings, 'AWS_S3_FILES_SECRET_ACCESS_KEY', None)
+		assert aws_access_key_id and aws_secret_access_key, \
+			"Please assign values for AWS_S3_FILES_ACCESS_KEY_ID and AWS_S3_FILES_SECRET_ACCESS_KEY in settings"
+		
+		try:
+			return S3Connection(aws_access_key_id, aws_secret_access_key)
+		except boto_exceptions.BotoClientError as e:
+			raise DatabaseError("Unable to connect to S3.\nBoto Exception:\n{}".format(e))
+	
+	def _release_connection(self, connection):
+		try:
+			self.pool.put_nowait(connection)
+		except Full:
+			pass # the pool already has enough idle connections
+
+LocalVersion = namedtuple('LocalVersion', ('name', 'version_id', 'last_modified'))
+
+class FileSystemS3Storage(S3Storage):
+	"""
+	Stand-in for S3 which keeps every version of every object in a directory,
+	for tests and development. The directory is AWS_S3_FILES_LOCAL_ROOT, or a
+	temporary directory.
+	"""
+	
+	def __init__(self, root = None, *args, **kwargs):
+		super(FileSystemS3Storage, self).__init__(*args, **kwargs)
+		self.root = root or getattr(settings, 'AWS_S3_FILES_LOCAL_ROOT', None) or tempfile.mkdtemp(prefix = 'asym-s3-')
+		self.lock = threading.Lock()
+	
+	def list_versions(self, bucket_name, key_name):
+		versions = []
+		bucket_path = os.path.join(self.root, bucket_name)
+		if not os.path.isdir(bucket_path):
+			return versions
+		
+		for dir_name in sorted(os.listdir(bucket_path)):
+			name = url_unquote(dir_name)
+			if not name.startswith(key_name):
+				continue
+			
+			key_path = os.path.join(bucket_path, dir_name)
+			for version_file in os.listdir(key_path):
+				if version_file.endswith('.meta'):
+					with open(os.path.join(key_path, version_file)) as fp:
+						meta = json.load(fp)
+					versions.append((meta['last_modified'], meta['sequence'], LocalVersion(name, meta['version_id'], meta['last_modified'])))
+		
+		return [version for _, _, version in sorted(versions, reverse = True)]
+	
+	def delete_all(self):
+		shutil.rmtree(self.root, ignore_errors = True)
+	
+	def _open(self, bucket_name, key_name, chunk_size):
+		data_path, meta = self._latest(bucket_name, key_name)
+		fp = open(data_path, 'rb')
+		return ObjectStream(iter(lambda: fp.read(chunk_size), b''), fp.close), meta['metadata'].get(ENCODING_METADATA_KEY)
+	
+	def _head(self, bucket_name, key_name):
+		data_path, meta = self._latest(bucket_name, key_name)
+		return os.path.getsize(data_path), meta['metadata'].get(ENCODING_METADATA_KEY)
+	
+	def _get_range(self, bucket_name, key_name, start, end):
+		data_path, _ = self._latest(bucket_name, key_name)
+		with open(data_path, 'rb') as fp:
+			fp.seek(start)
+			return fp.read(end - start + 1)
+	
+	def _latest(self, bucket_name, key_name):
+		"Returns the data file and metadata of the latest version of the object"
+		key_path = self._key_path(bucket_name, key_name)
+		try:
+			with open(os.path.join(key_path, 'latest')) as fp:
+				version_id = fp.read()
+			with open(os.path.join(key_path, version_id + '.meta')) as fp:
+				meta = json.load(fp)
+		except (IOError, OSError):
+			raise S3ObjectNotFound("Object {} not found in bucket {}".format(key_name, bucket_name))
+		
+		return os.path.join(key_path, version_id + '.data'), meta
+	
+	def _upload(self, bucket_name, key_name, parts, metadata):
+		key_path = self._key_path(bucket_name, key_name)
+		version_id = uuid.uuid4().hex
+		
+		with self.lock:
+			if not os.path.isdir(key_path):
+				os.makedirs(key_path)
+		
+		with open(os.path.join(key_path, version_id + '.data'), 'wb') as fp:
+			for part in parts:
+				fp.write(part)
+		
+		with self.lock:
+			# the sequence number orders versions written within the same clock tick
+			sequence = len([f for f in os.listdir(key_path) if f.endswith('.meta')])
+			with open(os.path.join(key_path, version_id + '.meta'), 'w') as fp:
+				json.dump({'version_id' : version_id, 'last_modified' : time.time(), 'sequence' : sequence, 'metadata' : metadata}, fp)
+			
+			with open(os.path.join(key_path, 'latest'), 'w') as fp:
+				fp.write(version_id)
+		
+		return version_id
+	
+	def _key_path(self, bucket_name, key_name):
+		return os.path.join(self.root, bucket_name, url_quote(key_name, safe = ''))
+
+class S3ReadFile(object):
+	"""
+	Read only, seekable file-like object over a stored object.
+	
+	read() fetches at least `chunk_size` bytes at a time with ranged GETs, so
+	only what is read is ever in memory. Iterating yields the rest of the
+	object in `chunk_size` chunks, using a single streaming GET when starting
+	from the beginning.
+	"""
+	
+	def __init__(self, storage, bucket_name, key_name, chunk_size = None):
+		self.storage = storage
+		self.bucket_name = bucket_name
+		self.key_name = key_name
+		self.chunk_size = chunk_size or storage.chunk_size
+		self.size, self.encoding = storage.stat(bucket_name, key_name)
+		self.closed = False
+		
+		# streams opened by chunks() that haven't been read to the end
+		self._streams = []
+		self._position = 0
+		self._buffer = b''
+		self._buffer_start = 0
+	
+	def read(self, size = -1):
+		remaining = self.size - self._position
+		if size is None or size < 0 or size > remaining:
+			size = remaining
+		if size <= 0:
+			return b''
+		
+		offset = self._position - self._buffer_start
+		if offset < 0 or offset + size > len(self._buffer):
+			self._buffer = self.storage.read_range(self.bucket_name, self.key_name, self._position, max(size, self.chunk_size), self.encoding)
+			self._buffer_start = self._position
+			offset = 0
+		
+		data = self._buffer[offset:offset + size]
+		self._position += len(data)
+		return data
+	
+	def chunks(self, chunk_size = None):
+		chunk_size = chunk_size or self.chunk_size
+		
+		if self._position == 0:
+			stream = self.storage.iter_chunks(self.bucket_name, self.key_name, chunk_size)
+			self._streams.append(stream)
+			try:
+				for chunk in stream:
+					self._position += len(chunk)
+					yield chunk
+			finally:
+				stream.close()
+				if stream in self._streams:
+					self._streams.remove(stream)
+			return
+		
+		while True:
+			chunk = self.read(chunk_size)
+			if not chunk:
+				return
+			yield chunk
+	
+	def __iter__(self):
+		return self.chunks()
+	
+	def seek(self, offset, whence = os.SEEK_SET):
+		if whence == os.SEEK_CUR:
+			offset += self._position
+		elif whence == os.SEEK_END:
+			offset += self.size
+		
+		if offset < 0:
+			raise IOError("Invalid offset {}".format(offset))
+		
+		self._position = offset
+		return offset
+	
+	def tell(self):
+		return self._position
+	
+	def seekable(self):
+		return True
+	
+	def readable(self):
+		return True
+	
+	def writable(self):
+		return False
+	
+	def close(self):
+		"Also releases the streams of any chunks() that weren't read to the end"
+		self.closed = True
+		self._buffer = b''
+		
+		streams, self._streams = self._streams, []
+		for stream in streams:
+			stream.close()
+	
+	def __enter__(self):
+		return self
+	
+	def __exit__(self, *exc_info):
+		self.close()
+
+class S3WriteFile(object):
+	"""
+	Write only file-like object. Written data is spooled to a temporary file,
+	which only stays in memory up to the storage's `part_size`, and streamed
+	to the storage when the file is closed. `on_close` is then called with
+	the new version id.
+	
+	Leaving a `with` block because of an exception discards the data.
+	"""
+	
+	def __init__(self, storage, bucket_name, key_name, on_close = None):
+		self.storage = storage
+		self.bucket_name = bucket_name
+		self.key_name = key_name
+		self.on_close = on_close
+		self.version_id = None
+		self.closed = False
+		
+		self._spool = tempfile.SpooledTemporaryFile(max_size = storage.part_size)
+	
+	def write(self, data):
+		self._spool.write(data)
+	
+	def writelines(self, lines):
+		for line in lines:
+			self.write(line)
+	
+	def tell(self):
+		return self._spool.tell()
+	
+	def seekable(self):
+		return False
+	
+	def readable(self):
+		return False
+	
+	def writable(self):
+		return True
+	
+	def close(self):
+		if self.closed:
+			return
+		self.closed = True
+		
+		try:
+			self._spool.seek(0)
+			self.version_id = self.storage.put(self.bucket_name, self.key_name, self._spool)
+		finally:
+			self._spool.close()
+		
+		if self.on_close is not None:
+			self.on_close(self.version_id)
+	
+	def discard(self):
+		self.closed = True
+		self._spool.close()
+	
+	def __enter__(self):
+		return self
+	
+	def __exit__(self, exc_type, *exc_info):
+		if exc_type is None:
+			self.close()
+		else:
+			self.discard()
+
+_fetch_pool = None
+_fetch_pool_pid = None
+_fetch_pool_lock = threading.Lock()
+_fetch_state = threading.local()
+
+def _get_fetch_pool():
+	"""
+	The ThreadPool get_many() fetches on. A pool created before the process
+	forked has no threads left in the child, so each process makes its own.
+	"""
+	global _fetch_pool, _fetch_pool_pid
+	
+	if _fetch_pool is None or _fetch_pool_pid != os.getpid():
+		with _fetch_pool_lock:
+			if _fetch_pool is None or _fetch_pool_pid != os.getpid():
+				_fetch_pool = ThreadPool(getattr(settings, 'AWS_S3_FILES_PREFETCH_WORKERS', 8))
+				_fetch_pool_pid = os.getpid()
+	
+	return _fetch_pool
+
+_storage = None
+_storage_lock = threading.Lock()
+
+def get_s3_storage():
+	"""
+	Returns the process wide S3Storage, an instance of the class named by
+	AWS_S3_FILES_STORAGE (BotoS3Storage by default).
+	"""
+	global _storage
+	
+	if _storage is None:
+		with _storage_lock:
+			if _storage is None:
+				path = getattr(settings, 'AWS_S3_FILES_STORAGE', 'asymmetricbase.utils.s3storage.BotoS3Storage')
+				module_name, class_name = path.rsplit('.', 1)
+				_storage = getattr(import_module(module_name), class_name)()
+	
+	return _storage
+
+def set_s3_storage(storage):
+	"Replaces the process wide S3Storage, eg. with a FileSystemS3Storage in tests"
+	global _storage
+	_storage = storage
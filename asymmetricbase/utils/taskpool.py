@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+#    Asymmetric Base Framework - A collection of utilities for django frameworks
+#    Copyright (C) 2013  Asymmetric Ventures Inc.
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; version 2 of the License.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from asymmetricbase.utils.worker_queue import WorkerQueue
+
+class TaskPool(WorkerQueue):
+	"""
+	Runs callables on `workers` background threads. See WorkerQueue for the
+	meaning of the other arguments; a full queue runs the task in the
+	calling thread straight away, unless `drop_when_full` is set.
+	"""
+	
+	def __init__(self, workers = 2, max_queue_size = 100, background = True, after_task = None, on_error = None, drop_when_full = False, name = 'TaskPool'):
+		super(TaskPool, self).__init__(
+			workers = workers,
+			max_queue_size = max_queue_size,
+			background = background,
+			drop_when_full = drop_when_full,
+			after_task = after_task,
+			on_error = on_error,
+			name = name,
+		)
+	
+	def submit(self, func, *args, **kwargs):
+		self.put((func, args, kwargs))
+	
+	def _process(self, items):
+		for func, args, kwargs in items:
+			func(*args, **kwargs)
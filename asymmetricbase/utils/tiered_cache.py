@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+#    Asymmetric Base Framework - A collection of utilities for django frameworks
+#    Copyright (C) 2013  Asymmetric Ventures Inc.
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; version 2 of the License.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from asymmetricbase.utils.lru import LRUCache
+
+class TieredCache(object):
+	"""
+	A django cache with a small in-process LRU in front of it, so that keys
+	read many times per request only go over the network once every few
+	seconds.
+	
+	Every key lives in a namespace with a version stamp, which is kept in the
+	shared cache. invalidate() replaces the stamp, which expires all the keys
+	in the namespace in every process. This process sees the change
+	immediately and other processes within local_ttl seconds, which is also
+	how long a delete() or set() can take to reach their local copies.
+	
+	As with django's cache, a stored None reads as a miss.
+	"""
+	VERSION_TIMEOUT = 60 * 60 * 24
+	
+	def __init__(self, namespace, backend = None, local_size = None, local_ttl = None):
+		if local_size is None:
+			local_size = getattr(settings, 'ASYM_TIERED_CACHE_LOCAL_SIZE', 1000)
+		if local_ttl is None:
+			local_ttl = getattr(settings, 'ASYM_TIERED_CACHE_LOCAL_TTL', 5)
+		
+		self.namespace = namespace
+		self.backend = backend if backend is not None else cache
+		self.local_ttl = local_ttl
+		self.local = LRUCache(max_size = local_size)
+		
+		self.version_key = 'asym-tiered-version:{}'.format(namespace)
+		self._version = None
+		self._version_checked_at = 0
+	
+	def get_version(self):
+		"""
+		Returns the namespace's version stamp, rereading it from the shared cache
+		at most every local_ttl seconds.
+		"""
+		now = time.time()
+		if self._version is None or now - self._version_checked_at >= self.local_ttl:
+			version = self.backend.get(self.version_key)
+			if version is None:
+				# a fresh random stamp, so that an evicted stamp can't bring back old keys
+				version = uuid.uuid4().hex
+				if not self.backend.add(self.version_key, version, self.VERSION_TIMEOUT):
+					version = self.backend.get(self.version_key) or version
+			
+			self._version = version
+			self._version_checked_at = now
+		
+		return self._version
+	
+	def invalidate(self, *args, **kwargs):
+		""" Expires every key in the namespace. Can be connected to model signals. """
+		version = uuid.uuid4().hex
+		self.backend.set(self.version_key, version, self.VERSION_TIMEOUT)
+		self._version = version
+		self._version_checked_at = time.time()
+		self.local.clear()
+	
+	def get(self, key, default = None):
+		version = self.get_version()
+		value = self._get_local(key, version)
+		if value is not None:
+			return value
+		
+		value = self.backend.get(self._make_key(key, version))
+		if value is None:
+			return default
+		
+		self._set_local(key, value, version)
+		return value
+	
+	def get_many(self, keys):
+		version = self.get_version()
+		results = {}
+		missing = []
+		for key in keys:
+			value = self._get_local(key, version)
+			if value is None:
+				missing.append(key)
+			else:
+				results[key] = value
+		
+		if missing:
+			found = self.backend.get_many([self._make_key(key, version) for key in missing])
+			for key in missing:
+				value = found.get(self._make_key(key, version))
+				if value is not None:
+					self._set_local(key, value, version)
+					results[key] = value
+		
+		return results
+	
+	def set(self, key, value, timeout = None):
+		version = self.get_version()
+		self.backend.set(self._make_key(key, version), value, timeout)
+		self._set_local(key, value, version, timeout)
+	
+	def set_many(self, data, timeout = None):
+		version = self.get_version()
+		self.backend.set_many(dict((self._make_key(key, version), value) for key, value in data.items()), timeout)
+		for key, value in data.items():
+			self._set_local(key, value, version, timeout)
+	
+	def add(self, key, value, timeout = None):
+		version = self.get_version()
+		if not self.backend.add(self._make_key(key, version), value, timeout):
+			return False
+		
+		self._set_local(key, value, version, timeout)
+		return True
+	
+	def delete(self, key):
+		self.backend.delete(self._make_key(key, self.get_version()))
+		self.local.pop(key)
+	
+	def delete_many(self, keys):
+		version = self.get_version()
+		self.backend.delete_many([self._make_key(key, version) for key in keys])
+		for key in keys:
+			self.local.pop(key)
+	
+	def _make_key(self, key, version):
+		return '{}:{}:{}'.format(self.namespace, version, key)
+	
+	def _get_local(self, key, version):
+		entry = self.local.get(key)
+		if entry is None:
+			return None
+		
+		value, entry_version, expires = entry
+		if entry_version != version or expires <= time.time():
+			self.local.pop(key)
+			return None
+		
+		return value
+	
+	def _set_local(self, key, value, version, timeout = None):
+		ttl = self.local_ttl if not timeout else min(self.local_ttl, timeout)
+		self.local.set(key, (value, version, time.time() + ttl))
+
+# namespace to TieredCache, see get_tiered_cache()
+_tiered_caches = {}
+
+def get_tiered_cache(namespace):
+	""" Returns the process's TieredCache for the namespace """
+	tiered_cache = _tiered_caches.get(namespace, None)
+	if tiered_cache is None:
+		tiered_cache = _tiered_caches.setdefault(namespace, TieredCache(namespace))
+	return tiered_cache
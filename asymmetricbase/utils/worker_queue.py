@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+#    Asymmetric Base Framework - A collection of utilities for django frameworks
+#    Copyright (C) 2013  Asymmetric Ventures Inc.
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; version 2 of the License.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import atexit
+import threading
+
+try:
+	from queue import Queue, Full
+except ImportError:
+	from Queue import Queue, Full
+
+_STOP = object()
+
+class WorkerQueue(object):
+	"""
+	Base class for handing items to `workers` background threads through a
+	queue holding at most `max_queue_size` items. Subclasses implement
+	_process(items), and can override _get_items() to take several items off
+	the queue at once.
+	
+	When the queue is full, put() waits for up to `put_timeout` seconds and
+	then processes the item in the calling thread, so a slow consumer slows
+	the producers down instead of items being lost. With `drop_when_full`, it
+	logs a warning and drops the item instead, for work that can be redone
+	later and mustn't slow the producer down. Errors are logged.
+	
+	If `background` is False, put() processes every item immediately in the
+	calling thread and lets any error propagate, which is what tests need.
+	
+	`after_task` is called on a worker thread after each call to _process(),
+	and `on_error` after one that failed. They are only ever called from the
+	worker threads, so they can eg. close the database connection Django
+	opened for that thread.
+	
+	The worker threads are daemon threads, so they don't keep the process
+	alive. With `stop_at_exit`, whatever is still queued when the process
+	exits is processed first, instead of being lost.
+	"""
+	
+	def __init__(self, workers = 1, max_queue_size = 1000, put_timeout = 0, background = True, after_task = None, on_error = None, stop_at_exit = False, drop_when_full = False, name = 'WorkerQueue'):
+		self.workers = workers
+		self.put_timeout = put_timeout
+		self.drop_when_full = drop_when_full
+		self.background = background
+		self.after_task = after_task
+		self.on_error = on_error
+		self.stop_at_exit = stop_at_exit
+		self.name = name
+		
+		self._queue = Queue(max_queue_size)
+		self._threads = []
+		self._lock = threading.Lock()
+		self._stops_at_exit = False
+	
+	def put(self, item):
+		if not self.background:
+			self._process([item])
+			return
+		
+		self._ensure_started()
+		
+		try:
+			if self.put_timeout:
+				self._queue.put(item, True, self.put_timeout)
+			else:
+				self._queue.put_nowait(item)
+		except Full:
+			if self.drop_when_full:
+				from asymmetricbase.logging import line_logger
+				line_logger.warning('{} is full, dropped an item'.format(self.name))
+			else:
+				self._process_safely([item])
+	
+	def join(self):
+		"Blocks until every queued item has been processed"
+		if self._threads:
+			self._queue.join()
+	
+	def stop(self, timeout = None):
+		"Processes everything still queued, then stops the worker threads"
+		with self._lock:
+			threads, self._threads = self._threads, []
+		
+		threads = [thread for thread in threads if thread.is_alive()]
+		for _ in threads:
+			self._queue.put(_STOP)
+		for thread in threads:
+			thread.join(timeout)
+	
+	def _process(self, items):
+		raise NotImplementedError()
+	
+	def _get_items(self):
+		"""
+		Returns the next items to process, waiting for at least one. A worker
+		stops after processing the items before a _STOP.
+		"""
+		return [self._queue.get()]
+	
+	def _ensure_started(self):
+		if self._threads:
+			return
+		
+		with self._lock:
+			if not self._threads:
+				if self.stop_at_exit and not self._stops_at_exit:
+					atexit.register(self.stop)
+					self._stops_at_exit = True
+				
+				for i in range(self.workers):
+					thread = threading.Thread(target = self._run, name = '{}-{}'.format(self.name, i))
+					thread.daemon = True
+					thread.start()
+					self._threads.append(thread)
+	
+	def _run(self):
+		while True:
+			batch = self._get_items()
+			try:
+				items = [item for item in batch if item is not _STOP]
+				if items:
+					self._process_safely(items, in_worker = True)
+			finally:
+				for _ in batch:
+					self._queue.task_done()
+			
+			if batch[-1] is _STOP:
+				return
+	
+	def _process_safely(self, items, in_worker = False):
+		try:
+			self._process(items)
+		except Exception:
+			from asymmetricbase.logging import line_logger
+			line_logger.exception('{} could not process {} items'.format(self.name, len(items)))
+			if in_worker:
+				self._call_hook(self.on_error)
+		finally:
+			if in_worker:
+				self._call_hook(self.after_task)
+	
+	def _call_hook(self, hook):
+		if hook is None:
+			return
+		try:
+			hook()
+		except Exception:
+			from asymmetricbase.logging import line_logger
+			line_logger.exception('{} hook {!r} failed'.format(self.name, hook))
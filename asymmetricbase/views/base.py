@@ -18,8 +18,8 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 from collections import OrderedDict
-from copy import deepcopy
 import functools
+import logging
 
 from django.views.generic.base import View
 from django.http import HttpResponseForbidden, HttpResponseNotFound
@@ -33,12 +33,27 @@ from django.utils.http import urlencode
 from django.template.response import ContentNotRenderedError
 
 from asymmetricbase.views.mixins.multi_format_response import MultiFormatResponseMixin
+from asymmetricbase.forms.form_factory import LazyForm
 from asymmetricbase.utils.exceptions import DeveloperTODO, ForceRollback
-from asymmetricbase.logging import logger #@UnusedImport
+from asymmetricbase.logging import logger, unwrap_logger
+from asymmetricbase.logging.request_trace import start_request_trace
 from asymmetricbase.jinja import jinja_env
 from asymmetricbase.utils.permissions import create_codename, \
 	default_content_type_appname
 
+def get_trace_logger():
+	"""
+	The trace logger itself, rather than its lazy proxy. Looked up when it is
+	used, since which logger it is depends on the settings.
+	"""
+	return unwrap_logger(logger)
+
+# view class to (the form_info the plan is for, form plan), see _get_form_plan()
+_form_plans = {}
+
+# (view class, permission suffix) to the full view permission, see _get_view_perm()
+_view_perms = {}
+
 class AsymBaseView(MultiFormatResponseMixin, View):
 	""" Base class for all views """
 	login_required = True
@@ -70,14 +85,25 @@ class AsymBaseView(MultiFormatResponseMixin, View):
 			pass
 	
 	def load_forms(self, request):
+		"""
+		Makes the forms available as attributes of the view and in the context.
+		Forms that aren't eager are LazyForms, which are only created, and have
+		their callbacks run, when they are first used. JSON output needs every
+		form's errors, so all forms are created then.
+		"""
+		self._loaded_forms = {}
+		json_output = self.output_type in ('json', 'jsontree')
 		
 		for form_name, form_data in self.forms.items():
 			
-			form_instance = form_data(request)
+			if json_output or form_data.is_eager():
+				form_instance = self._load_form(request, form_name)
+			else:
+				form_instance = LazyForm(functools.partial(self._load_form, request, form_name))
 			
 			setattr(self, form_name, form_instance)
 			
-			if self.output_type in ('json', 'jsontree'):
+			if json_output:
 				# Forms aren't json serializable, so we just want pertinent
 				# values for the form. 
 				self.context[form_name] = {
@@ -86,54 +112,90 @@ class AsymBaseView(MultiFormatResponseMixin, View):
 				}
 			else:
 				self.context[form_name] = form_instance
-			
-			form_data.process_callbacks()
+	
+	def _load_form(self, request, form_name):
+		"Creates the form and runs its callbacks, after doing so for its parents"
+		if form_name in self._loaded_forms:
+			return self._loaded_forms[form_name]
+		
+		form_data = self.forms[form_name]
+		for parent_name in self.forms:
+			if parent_name in form_data.parents:
+				self._load_form(request, parent_name)
+		
+		form_instance = self._loaded_forms[form_name] = form_data(request)
+		form_data.process_callbacks()
+		
+		return form_instance
 	
 	def get_form_data(self):
-		self.forms = OrderedDict()
-		# Create an instance copy of the form data
-		forms = deepcopy(self._merge_attr('form_info'))
+		form_info = self._get_merged_attr('form_info')
 		
-		# Now make sure they're in the correct order
+		# Copy the form factories for this request, in an order that resolves
+		# their dependencies, see _get_form_plan()
+		self.forms = OrderedDict()
+		for form_name, (parents, children) in self._get_form_plan(form_info).items():
+			form_data = form_info[form_name].copy()
+			form_data.parents = set(parents)
+			form_data.children = set(children)
+			self.forms[form_name] = form_data
+	
+	@classmethod
+	def _get_form_plan(cls, form_info):
+		"""
+		Returns an OrderedDict of form name to its (parents, children), in an
+		order that resolves the dependencies, yet preserves the original insert
+		order best it can. Only worked out once per class and form_info.
+		"""
+		plan = _form_plans.get(cls)
+		if plan is not None and plan[0] is form_info:
+			return plan[1]
 		
 		# First pass, just create the dependencies (update all parents)
-		for form_name, form_data in forms.items():
-			for child_name in form_data.children:
-				forms[child_name].parents.update([form_name])
+		parents = OrderedDict((form_name, set(form_data.parents)) for form_name, form_data in form_info.items())
+		children = OrderedDict((form_name, set(form_data.children)) for form_name, form_data in form_info.items())
+		
+		for form_name, form_data in form_info.items():
+			for child_name in children[form_name]:
+				parents[child_name].update([form_name])
 			
-			for parent_name in form_data.parents:
-				forms[parent_name].children.update([form_name])
+			for parent_name in parents[form_name]:
+				children[parent_name].update([form_name])
 		
 		added = OrderedDict() # The forms we've already added
 		top = OrderedDict() # The forms we're looking at
 		new_top = OrderedDict() # The forms we'll look at next
 		
 		# Second pass, find forms with no dependencies
-		for form_name, form_data in forms.items():
-			if len(form_data.parents) == 0:
-				top[form_name] = form_data
+		for form_name in form_info:
+			if len(parents[form_name]) == 0:
+				top[form_name] = True
 		
 		while len(top):
-			for form_name, form_data in top.items():
-				if (form_name not in added) and (set(form_data.parents) <= set(added.keys())):
-					for name in form_data.children: # can't rely on dict comprehensions being ordered
-						new_top[name] = forms[name]
-					added[form_name] = form_data
+			for form_name in top:
+				if (form_name not in added) and all(parent_name in added for parent_name in parents[form_name]):
+					for name in children[form_name]: # can't rely on dict comprehensions being ordered
+						new_top[name] = True
+					added[form_name] = (parents[form_name], children[form_name])
 			
 			top = new_top
 			new_top = OrderedDict()
 		
-		# added should now contain the forms in an order that resolves
-		# the dependencies, yet preserves the original insert order best it can
-		
-		self.forms = added
+		_form_plans[cls] = (form_info, added)
+		return added
 	
 	def dispatch(self, request, *args, **kwargs):
+		trace_logger = get_trace_logger()
+		debug = trace_logger.isEnabledFor(logging.DEBUG)
+		trace = start_request_trace(request, trace_logger)
+		
 		try:
 			self.request = request
-			logger.debug('BEGIN REQUEST *********** {}'.format(request.path))
+			if debug:
+				trace_logger.debug('BEGIN REQUEST *********** %s', request.path)
 			if not self._login_requirement_ok(request):
-				logger.debug('Login requirement is not ok, redirecting')
+				if debug:
+					trace_logger.debug('Login requirement is not ok, redirecting')
 				self.error('You were not logged in properly. Please try again')
 				return redirect('{}?{}={}'.format(
 					reverse(getattr(settings, 'ASYM_FAILED_LOGIN_URL', settings.LOGIN_REDIRECT_URL)),
@@ -141,52 +203,76 @@ class AsymBaseView(MultiFormatResponseMixin, View):
 					request.path,
 				))
 			
-			if hasattr(request, 'user'):
-				logger.debug('User is: {}'.format(request.user))
-			else:
-				logger.debug('No user in request')
-			permissions_required = self._merge_attr('permissions_required')
-			
-			logger.debug('The required permissions are {}'.format(permissions_required))
+			if debug:
+				if hasattr(request, 'user'):
+					trace_logger.debug('User is: %s', request.user)
+				else:
+					trace_logger.debug('No user in request')
+				
+				trace_logger.debug('The required permissions are %s', self._get_merged_attr('permissions_required'))
 			
-			logger.debug('AsymBaseView: Getting form data')
-			self.get_form_data()
+			with trace.phase('get_form_data'):
+				self.get_form_data()
 			
 			# Do any preprocessing, which should also fill out the arguments
 			# for the forms
-			logger.debug('AsymBaseView: Preprocess')
-			self.preprocess(request, *args, **kwargs)
+			with trace.phase('preprocess'):
+				self.preprocess(request, *args, **kwargs)
 			
 			# Create the form instances, and place into context
-			logger.debug('AsymBaseView: LoadForms')
-			self.load_forms(request)
+			with trace.phase('load_forms'):
+				self.load_forms(request)
+			
+			with trace.phase('predispatch'):
+				self.predispatch(request, *args, **kwargs)
 			
-			logger.debug("AsymBaseView: Predispatch")
-			self.predispatch(request, *args, **kwargs)
+			with trace.phase('access'):
+				has_access = self._has_access(request, *args, **kwargs)
 			
-			logger.debug("AsymBaseView: Has Access")
-			if not self._has_access(request, *args, **kwargs):
+			if not has_access:
 				self.error("You do not have permission to view that page")
 				return redirect(reverse(getattr(settings, 'ASYM_FAILED_LOGIN_URL')))
 			
 			try:
-				logger.debug('AsymBaseView: dispatch')
-				response = super(AsymBaseView, self).dispatch(request, *args, **kwargs)
+				with trace.phase('handler'):
+					response = super(AsymBaseView, self).dispatch(request, *args, **kwargs)
 			except ForceRollback:
 				# Ignore these because they're not real exceptions
 				response = self.render_to_response()
 			except ContentNotRenderedError as e:
-				logger.exception('Content not rendered for template {}.'.format(self.template_name))
+				trace_logger.exception('Content not rendered for template %s.', self.template_name)
 				self.template_name = '500.djhtml'
 				return self.render_to_response()
 			
-			logger.debug('END REQUEST*********')
+			if debug:
+				trace_logger.debug('END REQUEST*********')
+			
+			self._log_request_trace(trace, request, response)
 			return response
 		except DeveloperTODO as e:
-			logger.error('{}'.format(e))
+			trace_logger.error('%s', e)
 			self.template_name = 'todo_error.djhtml'
 			return self.render_to_response()
 	
+	@staticmethod
+	def _log_request_trace(trace, request, response):
+		"Logs the phase timings, once the response has been rendered"
+		if not trace.enabled:
+			return
+		
+		if getattr(response, 'is_rendered', True):
+			trace.log(get_trace_logger(), request.path)
+			return
+		
+		rendering = trace.phase('render')
+		rendering.start()
+		
+		def rendered(response):
+			rendering.stop()
+			trace.log(get_trace_logger(), request.path)
+		
+		response.add_post_render_callback(rendered)
+	
 	def get(self, request, *args, **kwargs):
 		self.context['params'] = kwargs
 		return self.render_to_response()
@@ -202,12 +288,13 @@ class AsymBaseView(MultiFormatResponseMixin, View):
 	
 	def _has_access(self, request, *args, **kwargs):
 		if self.login_required:
+			trace_logger = get_trace_logger()
 			view_perm = self._get_view_perm(*args, **kwargs)
 			if not request.user.has_perm(view_perm):
-				logger.debug('Failed permission check {}'.format(view_perm))
+				trace_logger.debug('Failed permission check %s', view_perm)
 				return False
 			
-			logger.debug('Has view permission: {}'.format(view_perm))
+			trace_logger.debug('Has view permission: %s', view_perm)
 		return True
 	
 	def _get_view_perm(self, *args, **kwargs):
@@ -215,7 +302,13 @@ class AsymBaseView(MultiFormatResponseMixin, View):
 		if hasattr(self, 'permission_name'):
 			suffix = AsymBaseView.get_view_name_and_suffix(self.permission_name, **kwargs)[1]
 		
-		return '{}.{}'.format(default_content_type_appname(), create_codename(self.__class__.__module__, self.__class__.__name__, suffix))
+		key = (self.__class__, suffix)
+		view_perm = _view_perms.get(key, None)
+		if view_perm is None:
+			view_perm = '{}.{}'.format(default_content_type_appname(), create_codename(self.__class__.__module__, self.__class__.__name__, suffix))
+			_view_perms[key] = view_perm
+		
+		return view_perm
 	
 	def has_permissions(self, perms, obj = None):
 		return self.request.user.has_perms(perms, obj)
@@ -248,13 +341,16 @@ class AsymBaseView(MultiFormatResponseMixin, View):
 		return error_messages
 		
 	def add_errors(self, error_list):
-		
-		logger.debug('The following are add_errors()')
+		trace_logger = get_trace_logger()
+		debug = trace_logger.isEnabledFor(logging.DEBUG)
+		if debug:
+			trace_logger.debug('The following are add_errors()')
 		for error in self._get_error_list(error_list):
 			if error.startswith("This field is required"):
 				error = "Required fields are marked with an asterisk"
 			
-			logger.debug('\t{}'.format(error))
+			if debug:
+				trace_logger.debug('\t%s', error)
 			self.error(error)
 	
 	def enum(self, enum_class):
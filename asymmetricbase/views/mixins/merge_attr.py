@@ -17,6 +17,7 @@
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import types
 from collections import OrderedDict
 
 from django.dispatch import Signal
@@ -26,14 +27,78 @@ from asymmetricbase.logging import logger #@UnusedImport
 pre_merge = Signal(providing_args = ['instance', 'attr'])
 post_merge = Signal(providing_args = ['instance', 'attr', 'merged'])
 
+# (class, attrname, _process_key(process)) to the stamp and the merged attribute.
+# Shared, so must not be modified; _merge_attr() hands out copies.
+_merged_attrs = {}
+
+_MISSING = object()
+
+def _process_key(process):
+	"""
+	The part of the cache key for `process`, or None if merges using it can't
+	be cached. Functions are keyed by their code, so a lambda in a method gives
+	the same key every time the method runs, unless it closes over variables
+	or has defaults that can't be hashed (eg. a list).
+	"""
+	if process is None:
+		return 'none'
+	
+	if isinstance(process, types.FunctionType) and not process.__closure__:
+		try:
+			hash(process.__defaults__)
+		except TypeError:
+			return None
+		return (process.__code__, process.__defaults__)
+	
+	return None
+
+def _attr_stamp(cls, attrname):
+	"""
+	The attribute as defined on each class of cls's MRO. A cached merge is
+	only used while its stamp is still the same, so setting or deleting the
+	attribute on any of the classes invalidates it.
+	"""
+	return tuple(klass.__dict__.get(attrname, _MISSING) for klass in cls.__mro__)
+
+def _same_stamp(stamp, other):
+	return len(stamp) == len(other) and all(a is b for a, b in zip(stamp, other))
+
 class MergeAttrMixin(object):
+	
 	@classmethod
 	def _merge_attr(cls, attrname, process = None):
+		return OrderedDict(cls._get_merged_attr(attrname, process))
+	
+	@classmethod
+	def _get_merged_attr(cls, attrname, process = None):
+		"""
+		Like _merge_attr(), but returns the cached result itself, which must
+		not be modified. The merge is done once per class, unless `process`
+		is a closure or some other callable, see _process_key(), and again
+		whenever the attribute is set or deleted on one of the classes.
+		Changing the list or dict in place isn't noticed.
+		"""
+		process_key = _process_key(process)
+		if process_key is None:
+			return cls._build_merged_attr(attrname, process)
+		
+		key = (cls, attrname, process_key)
+		stamp = _attr_stamp(cls, attrname)
+		entry = _merged_attrs.get(key)
+		if entry is not None and _same_stamp(entry[0], stamp):
+			return entry[1]
+		
+		attr_ret = cls._build_merged_attr(attrname, process)
+		_merged_attrs[key] = (stamp, attr_ret)
+		return attr_ret
+	
+	@classmethod
+	def _build_merged_attr(cls, attrname, process):
 		attr_ret = OrderedDict()
 		
 		for base_class in cls.__bases__:
 			if issubclass(base_class, MergeAttrMixin):
-				attr_ret.update(base_class._merge_attr(attrname, process))
+				attr_ret.update(base_class._get_merged_attr(attrname, process))
 		
 		if not hasattr(cls, attrname):
 			return attr_ret
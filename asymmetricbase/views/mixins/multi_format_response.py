@@ -18,23 +18,51 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 from collections import defaultdict
+from functools import partial
+
+import six
 
 from django.core.exceptions import ImproperlyConfigured
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from django.utils.http import urlquote
 from django.conf import settings
 
-from asymmetricbase.jinja.response import JinjaTemplateResponse
+from asymmetricbase.jinja.response import JinjaTemplateResponse, StreamingJinjaTemplateResponse
 from asymmetricbase.views.mixins.merge_attr import MergeAttrMixin
 from asymmetricbase.logging import logger # @UnusedImport
 from asymmetricbase.utils.jsonencoder import AsymJSONEncoder, AsymJSTreeEncoder
 from asymmetricbase.utils.resources import ResourceSet
 
+def _iter_content(content, chunk_size = 64 * 1024):
+	if hasattr(content, 'chunks'):
+		chunks = content.chunks()
+	elif hasattr(content, 'read'):
+		chunks = iter(partial(content.read, chunk_size), b'')
+	else:
+		return content
+	
+	def close_after(chunks):
+		try:
+			for chunk in chunks:
+				yield chunk
+		finally:
+			content.close()
+	
+	return close_after(chunks)
+
+def _css_file_name(name):
+	return name.replace('scss', 'css')
+
 class MultiFormatResponseMixin(MergeAttrMixin):
 	""" A mixin that can be used to render a djhtml templates or return json data. """
 	template_name = None
 	output_type = 'html'
 	response_class = JinjaTemplateResponse
+	
+	# Set to render html while it's being sent, for big pages such as reports.
+	# Tables of querysets should then use SimpleTableDisplay(..., iterator = True)
+	stream_response = False
+	streaming_response_class = StreamingJinjaTemplateResponse
 	css_files = getattr(settings, 'ASYM_DEFAULT_CSS', ())
 	js_files = getattr(settings, 'ASYM_DEFAULT_JS', ())
 	
@@ -44,7 +72,7 @@ class MultiFormatResponseMixin(MergeAttrMixin):
 		self.context = dd()
 	
 	def get_context_data(self, **kwargs):
-		css_files = self._merge_attr_signal('css_files', lambda x:  x.replace('scss', 'css'))
+		css_files = self._merge_attr_signal('css_files', _css_file_name)
 		css_resources = ResourceSet()
 		css_resources.add(css_files)
 		
@@ -64,7 +92,8 @@ class MultiFormatResponseMixin(MergeAttrMixin):
 		if self.output_type == 'html':
 			
 			self.context.update(self.get_context_data())
-			return self.response_class(
+			response_class = self.streaming_response_class if self.stream_response else self.response_class
+			return response_class(
 				request = self.request,
 				template = self.get_template_names(),
 				context = self.context,
@@ -84,9 +113,17 @@ class MultiFormatResponseMixin(MergeAttrMixin):
 			
 			callback = response_kwargs.pop('__callback', None)
 			
-			response = HttpResponse(**response_kwargs)
+			content = response_kwargs.pop('content')
 			
-			response['Content-Length'] = len(response_kwargs['content'])
+			if isinstance(content, (six.binary_type, six.text_type)):
+				response = HttpResponse(content, **response_kwargs)
+				response['Content-Length'] = len(content)
+			else:
+				# File-like objects (eg. S3File.open()) and iterators are
+				# streamed rather than read into memory
+				response = StreamingHttpResponse(_iter_content(content), **response_kwargs)
+				if getattr(content, 'size', None) is not None:
+					response['Content-Length'] = content.size
 			
 			if callback is not None:
 				# Add any extra headers to the response
@@ -119,6 +156,10 @@ class MultiFormatResponseMixin(MergeAttrMixin):
 		return ret_kwargs
 	
 	def _default_output(self):
+		"""
+		Returns context['content_data'], which may be bytes, a file-like object
+		or an iterator of chunks. The latter two are streamed.
+		"""
 		assert 'content_data' in self.context, "Not data found in context['content_data']"
 		
 		ret_kwargs = {